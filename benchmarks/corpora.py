@@ -0,0 +1,136 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Synthetic graph corpora of configurable size for the benchmarks.
+
+The seven generator families of the graph corpus are reproduced with a fixed
+average degree, so that the cost of a stage can be followed from 5 to 5000
+nodes without the edge count exploding. Complete graphs are the exception and
+are skipped once they exceed `max_edges`.
+"""
+
+import contextlib
+import os
+import random
+
+import networkx as nx
+
+from codegraph import cg_graph_task as graph_task
+from codegraph import cg_graph_text_encoder as graph_text_encoder
+
+GENERATOR_FAMILIES = ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path']
+MIN_NODES = 5
+MAX_NODES = 5000
+
+
+def simple_graph(graph, nnodes):
+    """Return an undirected graph on nodes 0..nnodes-1 without self-loops or parallel edges."""
+    simple = nx.Graph()
+    simple.add_nodes_from(range(nnodes))
+    simple.add_edges_from((u, v) for u, v in graph.edges() if u != v)
+    return simple
+
+
+def generate_graph(family, nnodes, average_degree, seed):
+    """Generate one graph of a family with about `average_degree` edges per node."""
+    p = min(1.0, average_degree / (nnodes - 1))
+    if family == 'er':
+        graph = nx.fast_gnp_random_graph(nnodes, p, seed=seed)
+    elif family == 'ba':
+        graph = nx.barabasi_albert_graph(nnodes, max(1, min(average_degree // 2, nnodes - 1)), seed=seed)
+    elif family == 'sbm':
+        sizes = [nnodes // 2, nnodes - nnodes // 2]
+        p_in = min(1.0, 1.8 * p)
+        p_out = p_in / 10
+        graph = nx.stochastic_block_model(sizes, [[p_in, p_out], [p_out, p_in]], seed=seed, sparse=True)
+    elif family == 'sfn':
+        graph = nx.scale_free_graph(nnodes, seed=seed)
+    elif family == 'complete':
+        graph = nx.complete_graph(nnodes)
+    elif family == 'star':
+        graph = nx.star_graph(nnodes - 1)
+    elif family == 'path':
+        graph = nx.path_graph(nnodes)
+    else:
+        raise ValueError(f'Unknown generator family: {family}')
+    return simple_graph(graph, nnodes)
+
+
+def build_corpus(families, sizes, graphs_per_cell, average_degree=4, max_edges=200000, seed=1234):
+    """Generate `graphs_per_cell` graphs per (family, size).
+
+    Returns:
+        dict: From (family, size) to a list of graphs. Cells of complete graphs
+        above `max_edges` edges are left out.
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for size in sizes:
+        for family in families:
+            if family == 'complete' and size * (size - 1) // 2 > max_edges:
+                continue
+            corpus[(family, size)] = [
+                generate_graph(family, size, average_degree, rng.randrange(2**31))
+                for _ in range(graphs_per_cell)
+            ]
+    return corpus
+
+
+def write_corpus(corpus, base_path):
+    """Write a corpus as graphml files laid out as `cg_graph_task_utils.load_graphs` expects.
+
+    The graphs of a size go to `{base_path}/n{size}/{family}/test/`.
+    """
+    for (family, size), graphs in corpus.items():
+        graphs_path = os.path.join(base_path, f'n{size}', family, 'test')
+        os.makedirs(graphs_path, exist_ok=True)
+        for ind, graph in enumerate(graphs):
+            nx.write_graphml(graph, os.path.join(graphs_path, f'{ind}.graphml'))
+
+
+def extend_name_dict(name_dict, nnodes):
+    """Extend a node name dictionary to `nnodes` names.
+
+    Integer dictionaries continue counting; named ones reuse their names with a
+    numeric suffix, e.g. 'James1' after the first round.
+    """
+    names = list(name_dict.values())
+    if len(names) >= nnodes:
+        return name_dict
+    if all(name.isdigit() for name in names):
+        return {ind: str(ind) for ind in range(nnodes)}
+    return {
+        ind: names[ind % len(names)] + (str(ind // len(names)) if ind >= len(names) else '')
+        for ind in range(nnodes)
+    }
+
+
+@contextlib.contextmanager
+def large_name_dicts(nnodes):
+    """Temporarily extend every text encoder's node names to `nnodes` names.
+
+    The name dictionaries of the encoders only cover the small graphs of the
+    graph corpus, so larger synthetic graphs could not be encoded otherwise.
+    """
+    original = {text_encoder: graph_text_encoder.TEXT_ENCODER_DICT[text_encoder]
+                for text_encoder in graph_text_encoder.TEXT_ENCODER_NAMES}
+    for text_encoder, name_dict in original.items():
+        graph_text_encoder.TEXT_ENCODER_DICT[text_encoder] = extend_name_dict(name_dict, nnodes)
+    graph_task.clear_graph_literals()
+    try:
+        yield
+    finally:
+        graph_text_encoder.TEXT_ENCODER_DICT.update(original)
+        graph_task.clear_graph_literals()
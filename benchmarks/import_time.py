@@ -0,0 +1,95 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure the startup time of the entry points.
+
+Every command runs in a fresh interpreter `--repeats` times; the median wall
+time is reported together with the slowest imports of one `-X importtime` run.
+
+Example usage:
+
+    python -m benchmarks.import_time --output import_time.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMMANDS = {
+    'evaluate --help': ['evaluate.py', '--help'],
+    'generator --help': ['-m', 'codegraph.cg_graph_task_generator', '--help'],
+    'corpus --help': ['-m', 'codegraph.cg_graph_corpus', '--help'],
+    'summarize_telemetry --help': ['summarize_telemetry.py', '--help'],
+    'import evaluate': ['-c', 'import evaluate'],
+    'import generator': ['-c', 'import codegraph.cg_graph_task_generator'],
+    'encode one graph': ['-c', 'import networkx as nx; from codegraph import cg_graph_text_encoder as e; '
+                               'e.encode_graph(nx.path_graph(5), "friendship")'],
+}
+# Modules whose cumulative import time is listed per command.
+TOP_IMPORTS = 5
+
+
+def time_command(command, repeats):
+    """Return the median wall seconds of running `python {command}`.
+
+    The exit status is not checked, as absl exits with 1 after printing --help.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + command, cwd=PROJECT_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_imports(command):
+    """Return the top-level packages imported by a command with the largest cumulative time."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=PROJECT_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        # Lines look like 'import time:   self [us] |  cumulative | imported package'.
+        fields = line.split('|')
+        if not line.startswith('import time:') or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        if '.' not in name and name not in ['site', 'encodings']:
+            imports.append((name, int(fields[1]) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])[:TOP_IMPORTS]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--commands', type=str, nargs='+', default=list(COMMANDS), choices=list(COMMANDS),
+                        help='Commands to time')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of runs per command; the median is reported')
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON file to write the timings to')
+    args = parser.parse_args()
+
+    report = {}
+    for name in args.commands:
+        seconds = time_command(COMMANDS[name], args.repeats)
+        imports = slowest_imports(COMMANDS[name])
+        report[name] = {'seconds': seconds, 'slowest_imports': dict(imports)}
+        print(f'{name}\t{seconds:.3f} s\t' + ', '.join(f'{module} {cost:.3f} s' for module, cost in imports))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
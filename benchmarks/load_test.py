@@ -0,0 +1,147 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Load test the evaluation pipeline against the local mock server.
+
+A `MockOpenAIServer` with the given `LoadProfile` is started, and for every
+level of `--concurrency` that many `evaluate.py` jobs run at once against it
+through the `Local` backend, the way the run_*.sh scripts keep up to
+`MAX_PARALLEL_JOBS` jobs running. Each level reports its throughput, the tail
+latency of the questions, the executor utilization (the share of the job slots'
+wall time spent answering questions rather than starting up or waiting) and the
+429s and errors served.
+
+Arguments not known to this script are passed on to every `evaluate.py` job.
+
+Example usage:
+
+    python -m benchmarks.load_test --concurrency 1 4 16 32 --latency 0.5 \\
+        --latency_distribution lognormal --latency_jitter 0.5 --rate_limit_rate 0.05
+"""
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from models.mock_server import LATENCY_DISTRIBUTIONS, LoadProfile, MockOpenAIServer, exemplar_responder
+from summarize_telemetry import percentile
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_records(results_dir, suffix):
+    """Load the JSONL records of all files ending in `suffix` below results_dir."""
+    records = []
+    for path in glob.glob(os.path.join(results_dir, '**', f'*{suffix}'), recursive=True):
+        with open(path) as f:
+            records += [json.loads(line) for line in f if line.strip()]
+    return records
+
+
+def run_level(server, concurrency, evaluate_args, work_dir):
+    """Run `concurrency` evaluate.py jobs at once and summarize them."""
+    level_dir = os.path.join(work_dir, f'c{concurrency}')
+    env = {**os.environ, 'LOCAL_BASE_URL': f'{server.url}/v1', 'LOCAL_API_KEY': 'mock'}
+    server.reset_counts()
+    start_time = time.perf_counter()
+    jobs = []
+    for job in range(concurrency):
+        job_dir = os.path.join(level_dir, f'job{job}')
+        os.makedirs(job_dir)
+        with open(os.path.join(job_dir, 'evaluate.log'), 'w') as log:
+            jobs.append(subprocess.Popen(
+                [sys.executable, 'evaluate.py', '--model_name', 'Local', '--results_dir', job_dir] + evaluate_args,
+                cwd=PROJECT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+            ))
+    exit_codes = [job.wait() for job in jobs]
+    wall_time = time.perf_counter() - start_time
+
+    telemetry = load_records(level_dir, '.telemetry.jsonl')
+    checkpoints = load_records(level_dir, '.checkpoint.jsonl')
+    totals = [record['total'] for record in telemetry]
+    networks = [record['network'] for record in telemetry if record.get('network') is not None]
+    summary = {
+        'concurrency': concurrency,
+        'failed_jobs': sum(code != 0 for code in exit_codes),
+        'questions': len(telemetry),
+        'failed_questions': sum(record['response'] == 'NA' for record in checkpoints),
+        'wall_time': wall_time,
+        'questions_per_s': len(telemetry) / wall_time,
+        'executor_utilization': sum(totals) / (concurrency * wall_time),
+        'network_p95': percentile(networks, 95),
+    }
+    for q in [50, 95, 99]:
+        summary[f'total_p{q}'] = percentile(totals, q)
+    summary.update({key: server.counts[key] for key in ['requests', 'rate_limited', 'errors', 'peak_in_flight']})
+    return summary
+
+
+def format_value(value):
+    if value is None:
+        return '--'
+    if isinstance(value, float):
+        return f'{value:.3f}'
+    return str(value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(epilog='Other arguments are passed on to evaluate.py.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16],
+                        help='Numbers of evaluate.py jobs run at once, one load level each')
+    parser.add_argument('--task_name', type=str, default='node_count')
+    parser.add_argument('--text_enc', type=str, default='adjacency')
+    parser.add_argument('--graph_gen', type=str, default='er')
+    parser.add_argument('--prompt_method', type=str, default='cg')
+    parser.add_argument('--number_of_questions', type=int, default=50, help='Questions answered by every job')
+    parser.add_argument('--latency', type=float, default=0.5, help='Mean seconds before the mock server returns a completion')
+    parser.add_argument('--latency_jitter', type=float, default=0.5,
+                        help='Half width (uniform) or sigma (lognormal) of the latency')
+    parser.add_argument('--latency_distribution', type=str, default='lognormal', choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='Share of requests rejected with 429')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Share of requests failing with 500')
+    parser.add_argument('--retry_after', type=float, default=1.0, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type=int, default=1234, help='Seed of the latency and error draws')
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON file to write the per-level summaries to')
+    args, passthrough_args = parser.parse_known_args()
+
+    evaluate_args = [
+        '--task_name', args.task_name,
+        '--text_enc', args.text_enc,
+        '--graph_gen', args.graph_gen,
+        '--prompt_method', args.prompt_method,
+        '--number_of_questions', str(args.number_of_questions),
+    ] + passthrough_args
+    load_profile = LoadProfile(args.latency, args.latency_jitter, args.latency_distribution,
+                               args.rate_limit_rate, args.error_rate, args.retry_after, args.seed)
+    columns = ['concurrency', 'failed_jobs', 'questions', 'failed_questions', 'wall_time', 'questions_per_s',
+               'executor_utilization', 'total_p50', 'total_p95', 'total_p99', 'network_p95',
+               'requests', 'rate_limited', 'errors', 'peak_in_flight']
+    summaries = []
+    with tempfile.TemporaryDirectory() as work_dir, \
+            MockOpenAIServer(responder=exemplar_responder(), load_profile=load_profile) as server:
+        print(f'Mock OpenAI server listening on {server.url}')
+        print('\t'.join(columns))
+        for concurrency in args.concurrency:
+            summary = run_level(server, concurrency, evaluate_args, work_dir)
+            summaries.append(summary)
+            print('\t'.join(format_value(summary[column]) for column in columns))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summaries, f, indent=4)
@@ -0,0 +1,236 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time the generation and scoring hot paths on synthetic graph corpora.
+
+Every stage is timed per (generator family, graph size) and stored under a key
+`{stage}/{variant}/{family}/{size}` with the median and minimum seconds per
+call. Passing `--baseline` compares the run against an earlier results file.
+
+Example usage:
+
+    python -m benchmarks.run_benchmarks --sizes 5 50 500 5000 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import networkx as nx
+
+from benchmarks import corpora
+from codegraph import cg_graph_task as graph_task
+from codegraph import cg_graph_task_utils as utils
+from codegraph import cg_graph_text_encoder as graph_text_encoder
+import get_graphqa_answer
+
+CG_TASKS = {
+    'node_count': graph_task.NodeCount,
+    'edge_count': graph_task.EdgeCount,
+    'node_degree': graph_task.NodeDegree,
+    'edge_existence': graph_task.EdgeExistence,
+    'cycle_check': graph_task.CycleCheck,
+    'connected_nodes': graph_task.ConnectedNodes,
+}
+STAGES = ['text_encoder', 'templates', 'load_graphs', 'write_examples', 'exec_py', 'extract']
+# Extraction takes microseconds, so each timing repeats it this many times.
+EXTRACT_CALLS = 100
+
+
+def time_call(fn, repeats, number=1, setup=None):
+    """Return the median and minimum seconds per call of fn over `repeats` timings.
+
+    One untimed call comes first, so that lazy imports (e.g. TensorFlow on the
+    first graph load) and cold caches are not charged to the first cell.
+    """
+    if setup is not None:
+        setup()
+    fn()
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return {'median_s': statistics.median(times), 'min_s': min(times), 'repeats': repeats}
+
+
+def bench_text_encoder(graphs, text_encoders, repeats):
+    for text_encoder in text_encoders:
+        yield text_encoder, time_call(
+            lambda: [graph_text_encoder.encode_graph(graph, text_encoder) for graph in graphs], repeats)
+
+
+def bench_templates(graphs, text_encoder, repeats):
+    # The rendered literals are cached per graph; clear them so that every
+    # timing pays for rendering a graph once, as the generator does.
+    for task_name, task_class in CG_TASKS.items():
+        task = task_class()
+        yield task_name, time_call(
+            lambda: [task.create_few_shot_example(graph, text_encoder, False) for graph in graphs],
+            repeats, setup=graph_task.clear_graph_literals)
+
+
+def bench_load_graphs(graphs_dir, family, size, repeats):
+    base_path = os.path.join(graphs_dir, f'n{size}')
+    yield 'graphml', time_call(lambda: utils.load_graphs(base_path, family, 'test', max_nnodes=size), repeats)
+
+
+def bench_write_examples(graphs, family, text_encoder, output_dir, repeats):
+    task = graph_task.NodeCount()
+    prepare = lambda: utils.prepare_examples(
+        task.prepare_examples_dict(graphs, [family] * len(graphs), text_encoder), text_encoder)
+    yield 'prepare_examples', time_call(prepare, repeats)
+    examples = prepare()
+    output_path = os.path.join(output_dir, f'{family}_{len(graphs[0])}.tfrecords')
+    yield 'write_examples', time_call(lambda: utils.write_examples(examples, output_path), repeats)
+
+
+def bench_exec_py(graphs, text_encoder, repeats):
+    code = graph_task.NodeCount().create_few_shot_example(graphs[0], text_encoder, False)
+    yield 'node_count', time_call(lambda: get_graphqa_answer.exec_py(code), repeats)
+
+
+def bench_extract(graphs, repeats):
+    graph = graphs[0]
+    edges = ', '.join('(%d, %d)' % edge for edge in graph.edges())
+    neighbors = ', '.join(str(node) for node in sorted(graph.neighbors(0)))
+    question = 'Q: List all the nodes connected to 0 in alphabetical order.\n'
+    responses = {
+        'num_response': (get_graphqa_answer.extract_num_response,
+                         f'The edges are {edges}. So the answer is \\boxed{{{graph.number_of_edges()}}}.'),
+        'yes_no_response': (get_graphqa_answer.extract_yes_no_response,
+                            f'The edges are {edges}. No, there is no such edge.'),
+        'cot_num_response': (get_graphqa_answer.extract_cot_num_response,
+                             f'The edges are {edges}. A: {graph.number_of_edges()}'),
+        'connected_nodes': (lambda response: get_graphqa_answer.extract_connected_nodes(response, 'adjacency', question),
+                            f'The edges are {edges}. The answer is \\boxed{{{neighbors}}}.'),
+    }
+    for name, (extract, response) in responses.items():
+        yield name, time_call(lambda: extract(response), repeats, number=EXTRACT_CALLS)
+
+
+def run_benchmarks(args):
+    """Run the selected stages on a synthetic corpus and return the results dict."""
+    corpus = corpora.build_corpus(args.families, args.sizes, args.graphs_per_cell,
+                                  args.average_degree, args.max_edges, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir, corpora.large_name_dicts(max(args.sizes)):
+        if 'load_graphs' in args.stages:
+            corpora.write_corpus(corpus, work_dir)
+        for (family, size), graphs in corpus.items():
+            stage_timings = {
+                'text_encoder': lambda: bench_text_encoder(graphs, args.text_encoders, args.repeats),
+                'templates': lambda: bench_templates(graphs, args.template_encoder, args.repeats),
+                'load_graphs': lambda: bench_load_graphs(work_dir, family, size, args.repeats),
+                'write_examples': lambda: bench_write_examples(graphs, family, args.template_encoder, work_dir, args.repeats),
+                'exec_py': lambda: bench_exec_py(graphs, args.template_encoder, args.repeats),
+                'extract': lambda: bench_extract(graphs, args.repeats),
+            }
+            for stage in args.stages:
+                for variant, timing in stage_timings[stage]():
+                    key = f'{stage}/{variant}/{family}/{size}'
+                    results[key] = timing
+                    print(f"{key}\t{timing['median_s'] * 1000:.3f} ms")
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'networkx': nx.__version__,
+        },
+        'config': {key: value for key, value in vars(args).items() if key not in ['output', 'baseline']},
+        'results': results,
+    }
+
+
+def compare_results(results, baseline, tolerance):
+    """Compare median timings against a baseline run.
+
+    Returns:
+        list: One `(key, baseline_s, current_s, ratio, status)` row per key of
+        either run, where status is 'slower' or 'faster' if the ratio leaves
+        `1 +- tolerance`, 'same' otherwise, and 'new' or 'missing' for keys only
+        in one of the runs.
+    """
+    rows = []
+    for key in sorted(set(results) | set(baseline)):
+        if key not in baseline:
+            rows.append((key, None, results[key]['median_s'], None, 'new'))
+            continue
+        if key not in results:
+            rows.append((key, baseline[key]['median_s'], None, None, 'missing'))
+            continue
+        baseline_s, current_s = baseline[key]['median_s'], results[key]['median_s']
+        ratio = current_s / baseline_s if baseline_s > 0 else None
+        if ratio is None or abs(ratio - 1) <= tolerance:
+            status = 'same'
+        else:
+            status = 'slower' if ratio > 1 else 'faster'
+        rows.append((key, baseline_s, current_s, ratio, status))
+    return rows
+
+
+def format_seconds(value):
+    return '--' if value is None else f'{value * 1000:.3f}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stages', type=str, nargs='+', default=STAGES, choices=STAGES, help='Stages to time')
+    parser.add_argument('--families', type=str, nargs='+', default=corpora.GENERATOR_FAMILIES,
+                        choices=corpora.GENERATOR_FAMILIES, help='Graph generator families of the synthetic corpus')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[5, 20, 100, 500],
+                        help=f'Graph sizes in nodes, between {corpora.MIN_NODES} and {corpora.MAX_NODES}')
+    parser.add_argument('--graphs_per_cell', type=int, default=5, help='Number of graphs per (family, size)')
+    parser.add_argument('--average_degree', type=int, default=4, help='Average degree of the random graph families')
+    parser.add_argument('--max_edges', type=int, default=200000, help='Skip complete graphs with more edges than this')
+    parser.add_argument('--text_encoders', type=str, nargs='+', default=sorted(graph_text_encoder.TEXT_ENCODER_FN),
+                        choices=sorted(graph_text_encoder.TEXT_ENCODER_FN), help='Text encoders timed by the text_encoder stage')
+    parser.add_argument('--template_encoder', type=str, default='adjacency', choices=sorted(graph_text_encoder.TEXT_ENCODER_FN),
+                        help='Text encoder used by the other stages')
+    parser.add_argument('--repeats', type=int, default=5, help='Number of timings per benchmark; the median is reported')
+    parser.add_argument('--seed', type=int, default=1234, help='Random seed of the synthetic corpus')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='JSON file to write the results to')
+    parser.add_argument('--baseline', type=str, default=None, help='Results file of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Relative change of a median timing reported as a regression or improvement')
+    args = parser.parse_args()
+    if any(size < corpora.MIN_NODES or size > corpora.MAX_NODES for size in args.sizes):
+        parser.error(f'--sizes must be between {corpora.MIN_NODES} and {corpora.MAX_NODES}')
+
+    report = run_benchmarks(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'Results written to {args.output}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        rows = compare_results(report['results'], baseline, args.tolerance)
+        print('\t'.join(['key', 'baseline_ms', 'current_ms', 'ratio', 'status']))
+        for key, baseline_s, current_s, ratio, status in rows:
+            print('\t'.join([key, format_seconds(baseline_s), format_seconds(current_s),
+                             '--' if ratio is None else f'{ratio:.2f}', status]))
+        regressions = [row for row in rows if row[4] == 'slower']
+        print(f'{len(regressions)} of {len(rows)} timings slower than the baseline by more than {args.tolerance:.0%}')
+        sys.exit(1 if regressions else 0)
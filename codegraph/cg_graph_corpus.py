@@ -0,0 +1,109 @@
+# coding=utf-8
+# Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Find isomorphic duplicates in the graph corpus and leaks across its splits.
+
+Graphs are grouped with `cg_graph_task_utils.IsomorphismIndex`: they are
+bucketed by their Weisfeiler-Lehman hash, and graphs sharing a hash are compared
+with an exact isomorphism check, so a hash collision never merges two different
+structures.
+
+Example usage:
+
+  python -m codegraph.cg_graph_corpus --graphs_dir=./graphqa/graphs \
+      --algorithm=all --output=corpus_report.json
+"""
+
+import json
+
+from absl import app
+from absl import flags
+
+from codegraph import cg_graph_task_utils as utils
+
+_ALGORITHM = flags.DEFINE_enum(
+    'algorithm',
+    'all',
+    ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path', 'all'],
+    'The graph generator algorithm whose graphs are checked.',
+)
+_GRAPHS_DIR = flags.DEFINE_string(
+    'graphs_dir', None, 'The directory containing the graphs.', required=True
+)
+_OUTPUT = flags.DEFINE_string(
+    'output', None, 'Optional JSON file to write the report to.'
+)
+
+def split_report(graphs):
+  """Summarize the duplicates within one split."""
+  classes = utils.isomorphism_classes(graphs)
+  sizes = {}
+  for class_id in classes:
+    sizes[class_id] = sizes.get(class_id, 0) + 1
+  edge_sets = {
+      (graph.number_of_nodes(), frozenset(map(frozenset, graph.edges())))
+      for graph in graphs
+  }
+  return {
+      'graphs': len(graphs),
+      'distinct_structures': len(sizes),
+      'identical_duplicates': len(graphs) - len(edge_sets),
+      'isomorphic_duplicates': len(graphs) - len(sizes),
+      'largest_class': max(sizes.values(), default=0),
+  }
+
+
+def corpus_report(graphs_dir, algorithms):
+  """Report duplicates per (algorithm, split) and test graphs leaking into train."""
+  report = {}
+  for algorithm in algorithms:
+    splits = {
+        split: utils.load_graphs(graphs_dir, algorithm, split)
+        for split in ['train', 'test']
+    }
+    report[algorithm] = {split: split_report(graphs) for split, graphs in splits.items()}
+    leaked = len(splits['test']) - len(utils.drop_leaked(splits['test'], splits['train']))
+    report[algorithm]['test_graphs_in_train'] = leaked
+  return report
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+
+  if _ALGORITHM.value == 'all':
+    algorithms = ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path']
+  else:
+    algorithms = [_ALGORITHM.value]
+
+  report = corpus_report(_GRAPHS_DIR.value, algorithms)
+  print('algorithm\tsplit\tgraphs\tdistinct\tidentical_dups\tisomorphic_dups\tlargest_class')
+  for algorithm, splits in report.items():
+    for split in ['train', 'test']:
+      row = splits[split]
+      print('%s\t%s\t%d\t%d\t%d\t%d\t%d' % (
+          algorithm, split, row['graphs'], row['distinct_structures'],
+          row['identical_duplicates'], row['isomorphic_duplicates'],
+          row['largest_class'],
+      ))
+    print('%s\ttest graphs isomorphic to a train graph: %d' % (
+        algorithm, splits['test_graphs_in_train']))
+  if _OUTPUT.value:
+    with open(_OUTPUT.value, 'w') as f:
+      json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,118 @@
+# coding=utf-8
+# Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+r"""Generate the graph corpus in process and write it as a binary corpus.
+
+Replaces `graphqa/graph_generator.sh`: the graphs are sampled with NumPy and
+written to one `{algorithm}/{split}.npz` file per algorithm, which
+`cg_graph_task_utils.load_graphs` reads in place of the GraphML files (see
+`cg_graph_generator_utils` for the format). The nodes of sbm graphs keep their
+blocks, so `node_classification` uses the corpus instead of regenerating them.
+With --write_csr, the corpus is also written in CSR form to memory-map from
+every generator process (see `cg_graph_task_generator --graph_views`).
+
+Example usage:
+
+  python -m codegraph.cg_graph_generator --algorithm=all --split=test \
+      --number_of_graphs=500 --output_path=./graphqa/graphs --random_seed=1234
+"""
+
+import os
+import time
+
+from absl import app
+from absl import flags
+
+from codegraph import cg_graph_generator_utils as utils
+
+_ALGORITHM = flags.DEFINE_enum(
+    'algorithm',
+    'all',
+    utils.ALGORITHMS + ['all'],
+    'The graph generator algorithm to generate graphs with.',
+)
+_SPLIT = flags.DEFINE_enum(
+    'split', 'test', ['train', 'valid', 'test'], 'The split to generate.'
+)
+_NUMBER_OF_GRAPHS = flags.DEFINE_integer(
+    'number_of_graphs', 500, 'The number of graphs per algorithm.'
+)
+_MIN_NODES = flags.DEFINE_integer(
+    'min_nodes', 5, 'The minimum number of nodes of a graph.'
+)
+_MAX_NODES = flags.DEFINE_integer(
+    'max_nodes', 20, 'Graphs have fewer nodes than this.'
+)
+_OUTPUT_PATH = flags.DEFINE_string(
+    'output_path', None, 'The directory to write the graphs to.', required=True
+)
+_RANDOM_SEED = flags.DEFINE_integer(
+    'random_seed', 1234, 'The random seed of the graphs.'
+)
+_WRITE_GRAPHML = flags.DEFINE_bool(
+    'write_graphml',
+    False,
+    'Also write every graph as {algorithm}/{split}/{index}.graphml for tools'
+    ' that read GraphML files.',
+)
+_WRITE_CSR = flags.DEFINE_bool(
+    'write_csr',
+    False,
+    'Also write the corpus with its CSR adjacency as .npy files in'
+    ' {algorithm}/{split}_csr/, which task generators memory-map and share.',
+)
+
+
+def main(argv):
+  if len(argv) > 1:
+    raise app.UsageError('Too many command-line arguments.')
+  if not 1 <= _MIN_NODES.value < _MAX_NODES.value:
+    raise app.UsageError('--min_nodes must be at least 1 and below --max_nodes.')
+
+  if _ALGORITHM.value == 'all':
+    algorithms = utils.ALGORITHMS
+  else:
+    algorithms = [_ALGORITHM.value]
+
+  for algorithm in algorithms:
+    start_time = time.perf_counter()
+    corpus = utils.generate_corpus(
+        algorithm,
+        _NUMBER_OF_GRAPHS.value,
+        _RANDOM_SEED.value,
+        _SPLIT.value,
+        _MIN_NODES.value,
+        _MAX_NODES.value,
+    )
+    path = utils.corpus_path(_OUTPUT_PATH.value, algorithm, _SPLIT.value)
+    utils.write_corpus(corpus, path)
+    print('%s: %d graphs, %d edges in %.2f s -> %s' % (
+        algorithm, _NUMBER_OF_GRAPHS.value, len(corpus['edges']),
+        time.perf_counter() - start_time, path))
+    if _WRITE_CSR.value:
+      utils.write_csr_corpus(
+          corpus, utils.csr_path(_OUTPUT_PATH.value, algorithm, _SPLIT.value)
+      )
+    if _WRITE_GRAPHML.value:
+      import networkx as nx
+
+      graphs_path = os.path.join(_OUTPUT_PATH.value, algorithm, _SPLIT.value)
+      os.makedirs(graphs_path, exist_ok=True)
+      for ind, graph in enumerate(utils.corpus_graphs(corpus)):
+        nx.write_graphml(graph, os.path.join(graphs_path, '%d.graphml' % ind))
+
+
+if __name__ == '__main__':
+  app.run(main)
@@ -0,0 +1,451 @@
+# coding=utf-8
+# Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Sampling and storage of the binary graph corpus.
+
+The graphs of all seven generator algorithms are sampled with NumPy, a batch of
+graphs at a time. A corpus holds the graphs of one (algorithm, split) in one
+`{algorithm}/{split}.npz` file with the arrays:
+
+  node_offsets: graph i has node_offsets[i + 1] - node_offsets[i] nodes,
+    numbered from 0.
+  edge_offsets: edges[edge_offsets[i]:edge_offsets[i + 1]] are the edges of
+    graph i.
+  edges: the (u, v) pairs of all graphs with u < v, in the smallest unsigned
+    integer type that holds the node ids.
+  blocks: for sbm only, the block of every node, in node_offsets order.
+
+For workers that share a corpus, `write_csr_corpus` adds the adjacency in CSR
+form and stores every array as a `.npy` file in `{algorithm}/{split}_csr/`.
+`open_csr_corpus` memory-maps them, so all processes read the same pages, and
+hands out read-only `GraphView`s in place of networkx graphs.
+
+The graphs follow the distributions of the GraphQA generators: an edge
+probability drawn per er graph, an attachment count drawn per ba graph, and two
+blocks per sbm graph with the intra and inter block probabilities of
+`cg_graph_task_generator.generate_random_sbm_graph`. sfn graphs are grown by
+preferential attachment with one or two edges per new node, which approximates
+the degree distribution of `nx.scale_free_graph` once made simple.
+"""
+
+import os
+import zlib
+
+import numpy as np
+
+ALGORITHMS = ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path']
+CORPUS_SUFFIX = '.npz'
+CSR_SUFFIX = '_csr'
+
+
+def graph_rng(random_seed, algorithm, split):
+  """Return the generator of the graphs of one (algorithm, split)."""
+  return np.random.default_rng(
+      [random_seed, zlib.crc32(algorithm.encode()), zlib.crc32(split.encode())]
+  )
+
+
+def sample_pairs(rng, nnodes, pair_probability):
+  """Keep each node pair of every graph with a probability.
+
+  Args:
+    rng: the random generator.
+    nnodes: the number of nodes of every graph.
+    pair_probability: called with a node count n and the ids of the graphs of
+      that size, returns the probability of each pair (u, v), u < v, in
+      np.triu_indices(n, 1) order, broadcastable to (len(ids), n(n-1)/2).
+
+  Returns:
+    The graph id and the (u, v) pair of every kept edge.
+  """
+  graph_ids, edges = [], []
+  for n in np.unique(nnodes):
+    ids = np.flatnonzero(nnodes == n)
+    pairs = np.stack(np.triu_indices(n, 1), axis=1)
+    keep = rng.random((len(ids), len(pairs))) < pair_probability(n, ids)
+    rows, columns = np.nonzero(keep)
+    graph_ids.append(ids[rows])
+    edges.append(pairs[columns])
+  return np.concatenate(graph_ids), np.concatenate(edges)
+
+
+def preferential_attachment(rng, nnodes, attachments, graph_ids, edges,
+                            weight_offset):
+  """Grow every graph by preferential attachment.
+
+  Node t of graph g links to attachments[g, t] distinct earlier nodes, chosen
+  with probability proportional to their degree plus `weight_offset`; all
+  graphs take the same step at once. The targets are drawn without
+  replacement by keeping the smallest exponential keys scaled by the weights.
+
+  Args:
+    rng: the random generator.
+    nnodes: the number of nodes of every graph.
+    attachments: (graphs, max nodes) number of edges each node adds; at most
+      its index.
+    graph_ids: the graph id of every edge of the initial graphs.
+    edges: the (u, v) pairs of the initial graphs.
+    weight_offset: added to the degree of every candidate target.
+
+  Returns:
+    The graph id and the (u, v) pair of every edge, initial ones first.
+  """
+  degrees = np.zeros(attachments.shape, dtype=np.float64)
+  np.add.at(degrees, (graph_ids, edges[:, 0]), 1)
+  np.add.at(degrees, (graph_ids, edges[:, 1]), 1)
+  graph_ids, edges = [graph_ids], [edges]
+  for t in range(1, attachments.shape[1]):
+    active = np.flatnonzero((t < nnodes) & (attachments[:, t] > 0))
+    if not len(active):
+      continue
+    counts = attachments[active, t]
+    weights = degrees[active, :t] + weight_offset
+    with np.errstate(divide='ignore'):
+      keys = rng.exponential(size=weights.shape) / weights
+    order = np.argsort(keys, axis=1)
+    chosen = np.arange(t) < counts[:, None]
+    rows = np.repeat(active, counts)
+    targets = order[chosen]
+    np.add.at(degrees, (rows, targets), 1)
+    degrees[active, t] += counts
+    graph_ids.append(rows)
+    edges.append(np.stack([targets, np.full_like(targets, t)], axis=1))
+  return np.concatenate(graph_ids), np.concatenate(edges)
+
+
+def star_edges(nnodes):
+  """Return the graph id and (0, v) pair of the edges of star graphs."""
+  graph_ids = np.repeat(np.arange(len(nnodes)), nnodes - 1)
+  starts = np.cumsum(nnodes - 1) - (nnodes - 1)
+  leaves = np.arange(len(graph_ids)) - np.repeat(starts, nnodes - 1) + 1
+  return graph_ids, np.stack([np.zeros_like(leaves), leaves], axis=1)
+
+
+def generate_er(rng, nnodes):
+  probability = rng.random(len(nnodes))
+  return sample_pairs(rng, nnodes, lambda n, ids: probability[ids, None])
+
+
+def generate_ba(rng, nnodes):
+  # As in nx.barabasi_albert_graph, a star on m + 1 nodes is grown by nodes
+  # that each add m edges.
+  m = rng.integers(1, nnodes)
+  graph_ids, edges = star_edges(m + 1)
+  attachments = np.where(
+      np.arange(nnodes.max()) > m[:, None], m[:, None], 0
+  )
+  return preferential_attachment(rng, nnodes, attachments, graph_ids, edges, 0)
+
+
+def sbm_blocks(n):
+  return (np.arange(n) >= n // 2).astype(np.uint8)
+
+
+def generate_sbm(rng, nnodes):
+  inter = rng.uniform(0, 0.05, len(nnodes))
+  intra = rng.uniform(0.6, 0.8, len(nnodes))
+
+  def pair_probability(n, ids):
+    blocks = sbm_blocks(n)
+    u, v = np.triu_indices(n, 1)
+    same_block = blocks[u] == blocks[v]
+    return np.where(same_block, intra[ids, None], inter[ids, None])
+
+  graph_ids, edges = sample_pairs(rng, nnodes, pair_probability)
+  blocks = np.concatenate([sbm_blocks(n) for n in nnodes])
+  return graph_ids, edges, blocks
+
+
+def generate_sfn(rng, nnodes):
+  attachments = rng.integers(1, 3, (len(nnodes), nnodes.max()))
+  attachments = np.minimum(attachments, np.arange(nnodes.max()))
+  graph_ids = np.zeros(0, dtype=np.int64)
+  edges = np.zeros((0, 2), dtype=np.int64)
+  return preferential_attachment(rng, nnodes, attachments, graph_ids, edges, 1)
+
+
+def generate_complete(rng, nnodes):
+  return sample_pairs(rng, nnodes, lambda n, ids: 1.0)
+
+
+def generate_star(rng, nnodes):
+  return star_edges(nnodes)
+
+
+def generate_path(rng, nnodes):
+  graph_ids = np.repeat(np.arange(len(nnodes)), nnodes - 1)
+  starts = np.cumsum(nnodes - 1) - (nnodes - 1)
+  u = np.arange(len(graph_ids)) - np.repeat(starts, nnodes - 1)
+  return graph_ids, np.stack([u, u + 1], axis=1)
+
+
+GENERATORS = {
+    'er': generate_er,
+    'ba': generate_ba,
+    'sbm': generate_sbm,
+    'sfn': generate_sfn,
+    'complete': generate_complete,
+    'star': generate_star,
+    'path': generate_path,
+}
+
+
+def generate_corpus(algorithm, number_of_graphs, random_seed, split,
+                    min_nodes=5, max_nodes=20):
+  """Generate the graphs of one (algorithm, split) as corpus arrays."""
+  rng = graph_rng(random_seed, algorithm, split)
+  nnodes = rng.integers(min_nodes, max_nodes, number_of_graphs)
+  generated = GENERATORS[algorithm](rng, nnodes)
+  graph_ids, edges = generated[:2]
+  order = np.argsort(graph_ids, kind='stable')
+  edge_counts = np.bincount(graph_ids, minlength=number_of_graphs)
+  corpus = {
+      'node_offsets': np.concatenate([[0], np.cumsum(nnodes)]),
+      'edge_offsets': np.concatenate([[0], np.cumsum(edge_counts)]),
+      'edges': np.sort(edges[order], axis=1).astype(
+          np.min_scalar_type(max_nodes - 1)
+      ),
+  }
+  if len(generated) > 2:
+    corpus['blocks'] = generated[2]
+  return corpus
+
+
+def corpus_path(base_path, algorithm, split):
+  return os.path.join(base_path, algorithm, split + CORPUS_SUFFIX)
+
+
+def write_corpus(corpus, path):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  np.savez(path, **corpus)
+
+
+def read_corpus(path):
+  with np.load(path) as corpus:
+    return {name: corpus[name] for name in corpus.files}
+
+
+def networkx_graph(corpus, index):
+  """Return graph `index` of a corpus as a networkx graph.
+
+  The nodes of sbm graphs carry their block as the 'block' attribute, as in
+  graphs of nx.stochastic_block_model.
+  """
+  import networkx as nx
+
+  node_offsets = corpus['node_offsets']
+  edge_offsets = corpus['edge_offsets']
+  blocks = corpus.get('blocks')
+  nnodes = int(node_offsets[index + 1] - node_offsets[index])
+  graph = nx.Graph()
+  if blocks is None:
+    graph.add_nodes_from(range(nnodes))
+  else:
+    node_blocks = blocks[node_offsets[index]:node_offsets[index + 1]].tolist()
+    graph.add_nodes_from(
+        (node, {'block': block}) for node, block in enumerate(node_blocks)
+    )
+  edges = corpus['edges'][edge_offsets[index]:edge_offsets[index + 1]]
+  graph.add_edges_from(edges.astype(np.int64).tolist())
+  return graph
+
+
+def corpus_graphs(corpus, max_nnodes=None):
+  """Return the graphs of a corpus as networkx graphs."""
+  node_offsets = corpus['node_offsets']
+  return [
+      networkx_graph(corpus, index)
+      for index in range(len(node_offsets) - 1)
+      if max_nnodes is None
+      or node_offsets[index + 1] - node_offsets[index] <= max_nnodes
+  ]
+
+
+def csr_path(base_path, algorithm, split):
+  return os.path.join(base_path, algorithm, split + CSR_SUFFIX)
+
+
+def csr_arrays(corpus):
+  """Add the adjacency of every graph in CSR form to the corpus arrays.
+
+  indptr: the neighbors of node u of graph i, numbered across all graphs as
+    node_offsets[i] + u, are indices[indptr[node]:indptr[node + 1]].
+  indices: the neighbors, as node ids within their graph, in the order their
+    edges are stored, which is the order networkx keeps them in.
+  """
+  node_offsets = corpus['node_offsets']
+  edge_offsets = corpus['edge_offsets']
+  edges = corpus['edges']
+  graph_of_edge = np.repeat(np.arange(len(node_offsets) - 1), np.diff(edge_offsets))
+  first_node = node_offsets[:-1][graph_of_edge]
+  u = edges[:, 0].astype(np.int64)
+  v = edges[:, 1].astype(np.int64)
+  # The two arcs of edge e are at 2e and 2e + 1, so a stable sort by source
+  # keeps the neighbors of a node in edge order.
+  sources = np.stack([first_node + u, first_node + v], axis=1).ravel()
+  targets = np.stack([v, u], axis=1).ravel()
+  order = np.argsort(sources, kind='stable')
+  degrees = np.bincount(sources, minlength=int(node_offsets[-1]))
+  return dict(
+      corpus,
+      indptr=np.concatenate([[0], np.cumsum(degrees)]),
+      indices=targets[order].astype(edges.dtype),
+  )
+
+
+def write_csr_corpus(corpus, path):
+  """Write the corpus arrays and their CSR adjacency as .npy files in path."""
+  os.makedirs(path, exist_ok=True)
+  for name, array in csr_arrays(corpus).items():
+    np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+
+
+def open_csr_corpus(path):
+  """Memory-map the CSR corpus written to path by `write_csr_corpus`."""
+  return CsrCorpus(path)
+
+
+class CsrCorpus:
+  """A CSR corpus whose arrays are memory-mapped read-only.
+
+  Processes that open the same corpus share its pages instead of each holding
+  a copy. A pickled corpus or graph view is reopened from its path, so views
+  sent to worker processes do not copy the arrays either.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.arrays = {
+        file[:-len('.npy')]: np.load(os.path.join(path, file), mmap_mode='r')
+        for file in os.listdir(path)
+        if file.endswith('.npy')
+    }
+    self.node_offsets = self.arrays['node_offsets']
+    self.edge_offsets = self.arrays['edge_offsets']
+    self.indptr = self.arrays['indptr']
+    self.indices = self.arrays['indices']
+    self.blocks = self.arrays.get('blocks')
+
+  def __reduce__(self):
+    return (open_csr_corpus, (self.path,))
+
+  def __len__(self):
+    return len(self.node_offsets) - 1
+
+  def graph(self, index):
+    return GraphView(self, index)
+
+  def graphs(self, max_nnodes=None):
+    """Return views of the graphs with at most max_nnodes nodes."""
+    nnodes = np.diff(self.node_offsets)
+    return [
+        GraphView(self, index)
+        for index in range(len(self))
+        if max_nnodes is None or nnodes[index] <= max_nnodes
+    ]
+
+
+class GraphView:
+  """A read-only undirected graph of a `CsrCorpus`.
+
+  Offers the part of the networkx Graph API that the text encoders and the
+  tasks answered from the structure alone use: nodes(), edges(), degree,
+  neighbors() and the node blocks of sbm graphs. Nodes, neighbors and edges
+  come in the same order as in the networkx graph of the corpus, so encodings
+  are identical. `to_networkx` returns that graph for the other tasks.
+  """
+
+  __slots__ = ('corpus', 'index', '_first_node', '_nnodes')
+
+  def __init__(self, corpus, index):
+    self.corpus = corpus
+    self.index = index
+    self._first_node = int(corpus.node_offsets[index])
+    self._nnodes = int(corpus.node_offsets[index + 1]) - self._first_node
+
+  def __reduce__(self):
+    return (GraphView, (self.corpus, self.index))
+
+  def __len__(self):
+    return self._nnodes
+
+  def __iter__(self):
+    return iter(range(self._nnodes))
+
+  def __contains__(self, node):
+    return isinstance(node, int) and 0 <= node < self._nnodes
+
+  def is_directed(self):
+    return False
+
+  def number_of_nodes(self):
+    return self._nnodes
+
+  def number_of_edges(self):
+    edge_offsets = self.corpus.edge_offsets
+    return int(edge_offsets[self.index + 1] - edge_offsets[self.index])
+
+  def nodes(self, data=False):
+    if not data:
+      return list(range(self._nnodes))
+    if self.corpus.blocks is None:
+      return [(node, {}) for node in range(self._nnodes)]
+    blocks = self.corpus.blocks[self._first_node:self._first_node + self._nnodes]
+    return [(node, {'block': block}) for node, block in enumerate(blocks.tolist())]
+
+  def neighbors(self, node):
+    node_id = self._first_node + node
+    start, end = self.corpus.indptr[node_id], self.corpus.indptr[node_id + 1]
+    return iter(self.corpus.indices[start:end].tolist())
+
+  def edges(self, node=None):
+    """Return the edges, or those of one node, in networkx order."""
+    if node is not None:
+      return [(node, neighbor) for neighbor in self.neighbors(node)]
+    indptr = self.corpus.indptr[
+        self._first_node:self._first_node + self._nnodes + 1
+    ].tolist()
+    indices = self.corpus.indices[indptr[0]:indptr[-1]].tolist()
+    # Like networkx, every edge is listed from its endpoint that comes first.
+    return [
+        (u, v)
+        for u in range(self._nnodes)
+        for v in indices[indptr[u] - indptr[0]:indptr[u + 1] - indptr[0]]
+        if v >= u
+    ]
+
+  @property
+  def degree(self):
+    return DegreeView(self)
+
+  def to_networkx(self):
+    return networkx_graph(self.corpus.arrays, self.index)
+
+
+class DegreeView:
+  """The degrees of a `GraphView`, indexed or iterated as in networkx."""
+
+  __slots__ = ('_graph',)
+
+  def __init__(self, graph):
+    self._graph = graph
+
+  def __getitem__(self, node):
+    node_id = self._graph._first_node + node  # pylint: disable=protected-access
+    indptr = self._graph.corpus.indptr
+    return int(indptr[node_id + 1] - indptr[node_id])
+
+  def __iter__(self):
+    return ((node, self[node]) for node in self._graph)
@@ -22,13 +22,86 @@
 
 """The graph tasks to be tried with LLMs."""
 
+import functools
+import hashlib
 import random
+import re
+import string
+import textwrap
 
 import networkx as nx
 import numpy as np
 
 from codegraph import cg_graph_text_encoder as graph_text_encoder
-import textwrap
+
+# Exemplar code turning the copied edge list of a compact encoding into 'edges'.
+COMPACT_EDGES_CODE = {
+    'compact': [
+        "edges = [tuple(edge.split('-')) for edge in graph.split()]",
+    ],
+    'adjacency_rows': [
+        "edges = [(row.split(':')[0], node) for row in graph.splitlines() for node in row.split(':')[1].split()]",
+    ],
+    'run_length': [
+        "def expand(item):",
+        "    start, _, end = item.partition('-')",
+        "    return [str(node) for node in range(int(start), int(end or start) + 1)]",
+        "edges = [(row.split(':')[0], node) for row in graph.splitlines() for item in row.split(':')[1].split() for node in expand(item)]",
+    ],
+}
+
+# Exemplar code templates by task name, see `register_code_template`.
+CODE_TEMPLATES = {}
+
+
+def register_code_template(task_name, template):
+    """Register the exemplar code template of a task.
+
+    The template is dedented and compiled once. `$nodes_code` and `$edges_code`
+    are filled by `GraphTask.render_code`, any other `$name` by the task.
+    """
+    CODE_TEMPLATES[task_name] = string.Template(textwrap.dedent(template))
+
+
+@functools.lru_cache(maxsize=4096)
+def _graph_literals(graph, encoding_method, name_table_id):
+    """Render `graph_literals`; `name_table_id` only keys the cache."""
+    name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
+    nodes = ','.join("'%s'" % name_dict[i] for i in range(len(graph.nodes())))
+    edges = ',\n'.join("('%s', '%s')" % (name_dict[u], name_dict[v]) for u, v in graph.edges())
+    return nodes, edges
+
+
+def graph_literals(graph, encoding_method):
+    """Return the quoted node and edge literals of a graph under an encoder's names.
+
+    Cached per (graph, encoder, name table), as the same graph is rendered in
+    many exemplars; graphs are not modified once loaded. Call
+    `clear_graph_literals` after replacing a name table.
+    """
+    name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
+    return _graph_literals(graph, encoding_method, id(name_dict))
+
+
+def clear_graph_literals():
+    """Drop the cached literals and the graphs they keep alive."""
+    _graph_literals.cache_clear()
+
+
+# The sentences of the task instructions defaulting the graph to empty lists.
+BOUND_ASSUMPTION = re.compile(r"Assume '[^.]*? if not provided\.")
+BOUND_ADJACENCY_DEFAULT = re.compile(r", default 'edges' to an empty list \(edges=\[\]\) if not provided\.")
+
+
+def keyed_random(*key):
+    """Return a random.Random whose draws depend on `key` only.
+
+    Unlike reseeding the global generator, the draws of one key do not depend
+    on how many draws came before, so any example can be generated on its own.
+    """
+    digest = hashlib.blake2b(repr(key).encode(), digest_size=8).digest()
+    return random.Random(int.from_bytes(digest, 'big'))
+
 
 class GraphTask:
     """The parent class for all the graph tasks."""
@@ -36,17 +109,86 @@ class GraphTask:
     def __init__(self):
         self.name = 'default'
         self.maximum_nnodes_cot_graph = 10
+        # Whether the executed code gets 'nodes' and 'edges' bound to the
+        # question graph, so exemplars use them without writing them out.
+        self.bind_graph = False
+        self.bind_graph_note = (
+            "The graph of the question is already loaded: 'nodes' is the list of"
+            " node names and 'edges' the list of (u, v) edges, all as strings."
+            " Use them directly instead of writing them out."
+        )
+        # Seed of the random choices of the examples, see `rng`.
+        self.random_seed = 0
+
+    def bind_instruction(self, question):
+        """Replace the empty-list defaults of the instructions of a question with the bind note.
+
+        The instructions tell the model to define 'nodes' and 'edges' or assume
+        them empty, which contradicts graphs bound at execution time.
+        """
+        question = BOUND_ADJACENCY_DEFAULT.sub('. ' + self.bind_graph_note, question)
+        return BOUND_ASSUMPTION.sub(self.bind_graph_note, question)
+
+    def rng(self, encoding_method, index, purpose):
+        """Return the generator of one random choice of an example.
+
+        The choice is keyed by (seed, task, encoder, graph index, purpose), where
+        `purpose` tells apart the questions ('question'), the exemplars
+        ('exemplar') and other draws of the same graph.
+        """
+        return keyed_random(self.random_seed, self.name, encoding_method, index, purpose)
+
+    def get_nodes_code(self, graph, encoding_method, name_dict):
+        """Return the exemplar code defining 'nodes'.
+
+        Compact encodings name their nodes 0 to n-1, so the code builds the list
+        from the node count instead of listing every node.
+        """
+        if self.bind_graph:
+            return "# 'nodes' is already defined"
+        if encoding_method in graph_text_encoder.COMPACT_ENCODERS:
+            return 'nodes = [str(node) for node in range(%d)]' % len(graph.nodes())
+        return 'nodes = [%s]' % graph_literals(graph, encoding_method)[0]
+
+    def get_edges_code(self, graph, encoding_method, name_dict):
+        """Return the exemplar code defining 'edges'.
+
+        For compact encodings the code copies the printed edge list verbatim
+        into 'graph' and parses it, instead of re-listing every edge as a
+        quoted tuple.
+        """
+        if self.bind_graph:
+            return "# 'edges' is already defined"
+        if encoding_method in graph_text_encoder.COMPACT_ENCODERS:
+            payload = graph_text_encoder.graph_payload(graph, encoding_method)
+            lines = ('graph = """%s"""' % payload).split('\n') + COMPACT_EDGES_CODE[encoding_method]
+            return '\n'.join(lines)
+        return 'edges = [%s]' % graph_literals(graph, encoding_method)[1]
+
+    def render_code(self, graph, encoding_method, name_dict, **values):
+        """Render the registered exemplar code of this task for a graph."""
+        return CODE_TEMPLATES[self.name].substitute(
+            nodes_code=self.get_nodes_code(graph, encoding_method, name_dict),
+            edges_code=self.get_edges_code(graph, encoding_method, name_dict),
+            **values,
+        )
 
     def prepare_examples_dict(
             self,
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
+        """Return the examples of the graphs, keyed by their position in `graphs`.
+
+        `first_index` is the corpus index of graphs[0]; the random choices are
+        keyed by corpus index, so a slice gets the examples of a full run.
+        """
         raise NotImplementedError()
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
         raise NotImplementedError()
 
@@ -59,66 +201,15 @@ class CycleCheck(GraphTask):
         self.name = 'cycle_check'
         self._task_graph_description = "Write a piece of Python code to return the answer in a variable 'ans'. Please enclose the code with # CODE START and # CODE END. Assume 'edges' and 'nodes' are empty lists (edges = [],nodes=[]) if not provided.\n"
 
-    def get_nodes_string(self, name_dict, nnodes):
-        node_string = ''
-        for i in range(nnodes - 1):
-            node_string += "'" + name_dict[i] + "',"
-        node_string += "'" + name_dict[nnodes - 1] + "'"
-        return node_string
-
-    def get_edges_string(self, name_dict, edges):
-        # Build the string with each edge on a new line and properly quoted
-        edges_string = ',\n        '.join(f"('{name_dict[edge[0]]}', '{name_dict[edge[1]]}')" for edge in edges)
-        return edges_string
-
     def generate_code(self, graph, encoding_method, name_dict):
-        def create_node_string(name_dict, nnodes):
-            node_string = ""
-            for i in range(nnodes - 1):
-                node_string += name_dict[i] + ", "
-            node_string += name_dict[nnodes - 1]
-            return node_string
-
-        nodes_string = self.get_nodes_string(name_dict, len(graph.nodes()))
-        edges_string = self.get_edges_string(name_dict, list(graph.edges()))
-        graph_text = '{node: [] for node in nodes}'
-
-        code = textwrap.dedent(f'''\
-        # CODE START
-        def has_cycle(graph):
-            visited = set()
-            for node in graph:
-                if node not in visited:
-                    if dfs(graph, node, visited, None):
-                        return True
-            return False
-        def dfs(graph, node, visited, parent):
-            visited.add(node)
-            for neighbor in graph[node]:
-                if neighbor not in visited:
-                    if dfs(graph, neighbor, visited, node):
-                        return True
-                elif neighbor != parent:
-                    return True
-            return False
-        nodes = [{nodes_string}]
-        edges = [{edges_string}]
-        graph = {graph_text}
-        for edge in edges:
-             graph[edge[0]].append(edge[1])
-        if has_cycle(graph):
-            ans = "Has cycle."
-        else:
-            ans = "No cycle."
-        # CODE END
-        ''')
-        return code
+        return self.render_code(graph, encoding_method, name_dict)
 
     def prepare_examples_dict(
             self,
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         for ind, graph in enumerate(graphs):
@@ -145,7 +236,7 @@ class CycleCheck(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
         """Create a few shot example w or w/o cot for the graph graph."""
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
@@ -177,6 +268,37 @@ class CycleCheck(GraphTask):
         return few_shots_str
 
 
+register_code_template('cycle_check', '''\
+# CODE START
+def has_cycle(graph):
+    visited = set()
+    for node in graph:
+        if node not in visited:
+            if dfs(graph, node, visited, None):
+                return True
+    return False
+def dfs(graph, node, visited, parent):
+    visited.add(node)
+    for neighbor in graph[node]:
+        if neighbor not in visited:
+            if dfs(graph, neighbor, visited, node):
+                return True
+        elif neighbor != parent:
+            return True
+    return False
+$nodes_code
+$edges_code
+graph = {node: [] for node in nodes}
+for edge in edges:
+     graph[edge[0]].append(edge[1])
+if has_cycle(graph):
+    ans = "Has cycle."
+else:
+    ans = "No cycle."
+# CODE END
+''')
+
+
 class EdgeExistence(GraphTask):
     """The graph task to check if an edge exist in a graph or not."""
 
@@ -190,12 +312,13 @@ class EdgeExistence(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
 
         for ind, graph in enumerate(graphs):
-            source, target = random.sample(list(graph.nodes()), k=2)
+            source, target = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=2)
             question = graph_text_encoder.encode_graph(graph, encoding_method)
             task_description = 'Q: Is node %s connected to node %s? ' % (
                 name_dict[source],
@@ -219,17 +342,13 @@ class EdgeExistence(GraphTask):
                 'node_ids': [source, target],
             }
         return examples_dict
-    
-    def get_edges_string(self, name_dict, edges):
-        # Build the string with each edge on a new line and properly quoted
-        edges_string = ',\n        '.join(f"('{name_dict[edge[0]]}', '{name_dict[edge[1]]}')" for edge in edges)
-        return edges_string
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
-        source, target = random.sample(list(graph.nodes()), k=2)
+        source, target = rng.sample(list(graph.nodes()), k=2)
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         task_description = 'Q: Is node %s connected to node %s? \n' % (
             name_dict[source],
@@ -237,25 +356,28 @@ class EdgeExistence(GraphTask):
         )
         question = self._task_insturction + task_description + question + 'A: '
 
-        answer = textwrap.dedent(f'''
-        # CODE START
-        source = '{name_dict[source]}'
-        target = '{name_dict[target]}'
-        edges = [{self.get_edges_string(name_dict, list(graph.edges()))}]
-        def edge_existence(edges, source, target):
-            edges_set = set()
-            for u, v in edges:
-                edges_set.add((u,v))
-                edges_set.add((v,u))
-            if (source, target) in edges_set: return True
-            else: return False
-
-        ans = edge_existence(edges,source,target)
-        # CODE END
-        ''')
+        answer = self.render_code(graph, encoding_method, name_dict, source=name_dict[source], target=name_dict[target])
         return question + answer
 
 
+register_code_template('edge_existence', '''
+# CODE START
+source = '$source'
+target = '$target'
+$edges_code
+def edge_existence(edges, source, target):
+    edges_set = set()
+    for u, v in edges:
+        edges_set.add((u,v))
+        edges_set.add((v,u))
+    if (source, target) in edges_set: return True
+    else: return False
+
+ans = edge_existence(edges,source,target)
+# CODE END
+''')
+
+
 class NodeCount(GraphTask):
     """The graph task for finding number of nodes in a graph."""
 
@@ -269,6 +391,7 @@ class NodeCount(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         for ind, graph in enumerate(graphs):
@@ -288,15 +411,8 @@ class NodeCount(GraphTask):
             }
         return examples_dict
 
-    def get_nodes_string(self, name_dict, nnodes):
-        node_string = ''
-        for i in range(nnodes - 1):
-            node_string += "'" + name_dict[i] + "',"
-        node_string += "'" + name_dict[nnodes - 1] + "'"
-        return node_string
-
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
@@ -308,18 +424,20 @@ class NodeCount(GraphTask):
         #         name_dict, len(graph.nodes())
         #     )
 
-        formatted_node = self.get_nodes_string(name_dict, len(graph.nodes()))
-        answer = textwrap.dedent(f'''\
-        # CODE START
-        nodes = [{formatted_node}]
-        def count_nodes(nodes):
-            return len(nodes)
-        ans = count_nodes(nodes)
-        # CODE END
-        ''')
+        answer = self.render_code(graph, encoding_method, name_dict)
         return question + answer
 
 
+register_code_template('node_count', '''\
+# CODE START
+$nodes_code
+def count_nodes(nodes):
+    return len(nodes)
+ans = count_nodes(nodes)
+# CODE END
+''')
+
+
 class NodeDegree(GraphTask):
     """The graph task for finding degree of a node in a graph."""
 
@@ -328,61 +446,22 @@ class NodeDegree(GraphTask):
         self.name = 'node_degree'
         self._task_graph_description = "Write a piece of Python code to return the answer in a variable 'ans'. Please enclose the code with # CODE START and # CODE END. Assume 'edges' be an empty list (edges = []) if not provided.\n"
 
-    def get_nodes_string(self, name_dict, nnodes):
-        node_string = ''
-        for i in range(nnodes - 1):
-            node_string += "'" + name_dict[i] + "',"
-        node_string += "'" + name_dict[nnodes - 1] + "'"
-        return node_string
-
-    def get_edges_string(self, name_dict, edges):
-        # Build the string with each edge on a new line and properly quoted
-        edges_string = ',\n        '.join(f"('{name_dict[edge[0]]}', '{name_dict[edge[1]]}')" for edge in edges)
-        return edges_string
-
-
     # generate the code part in prompt,#CODE START...#CODE END
     def generate_code(self, graph, encoding_method, name_dict, source_node):
-        def create_node_string(name_dict, nnodes):
-            node_string = ""
-            for i in range(nnodes - 1):
-                node_string += name_dict[i] + ", "
-            node_string += name_dict[nnodes - 1]
-            return node_string
-        nodes_string = self.get_nodes_string(name_dict, len(graph.nodes()))
-        edges_string = self.get_edges_string(name_dict, list(graph.edges()))
-        code = textwrap.dedent(f'''\
-        # CODE START
-        from collections import defaultdict
-        from typing import Set, Dict, List, Tuple
-        def get_adjacency_list(edges: List[Tuple[str, str]]) -> Dict[str, Set[str]]:
-            adjacency = defaultdict(set)
-            for each_edge in edges:
-                u, v = each_edge
-                adjacency[u].add(v)
-                adjacency[v].add(u)
-            return adjacency
-        def get_node_degree(target_node: str, adjacency_list: Dict[str, Set[str]]) -> int:
-            return len(adjacency_list[target_node])
-        edges = [{edges_string}]
-        adjacency_list = get_adjacency_list(edges)
-        target_node = '{str(name_dict[source_node])}'
-        ans = get_node_degree(target_node, adjacency_list)
-        # CODE END
-        ''')
-        return code
+        return self.render_code(graph, encoding_method, name_dict, target_node=str(name_dict[source_node]))
 
     def prepare_examples_dict(
             self,
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         for ind, graph in enumerate(graphs):
             question = graph_text_encoder.encode_graph(graph, encoding_method)
-            source_node = random.sample(list(graph.nodes()), k=1)[0]
+            source_node = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=1)[0]
             task_description = self._task_graph_description +'Q: What is the degree of node %s? \n' % str(
                 name_dict[source_node])
 
@@ -419,11 +498,12 @@ class NodeDegree(GraphTask):
         return edge_string
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
-        source_node = random.sample(list(graph.nodes()), k=1)[0]
+        source_node = rng.sample(list(graph.nodes()), k=1)[0]
         task_description = self._task_graph_description + 'Q: What is the degree of node %s? \n' % str(
             name_dict[source_node])
         question = task_description + question + 'A: \n'
@@ -432,6 +512,27 @@ class NodeDegree(GraphTask):
         return question + code
 
 
+register_code_template('node_degree', '''\
+# CODE START
+from collections import defaultdict
+from typing import Set, Dict, List, Tuple
+def get_adjacency_list(edges: List[Tuple[str, str]]) -> Dict[str, Set[str]]:
+    adjacency = defaultdict(set)
+    for each_edge in edges:
+        u, v = each_edge
+        adjacency[u].add(v)
+        adjacency[v].add(u)
+    return adjacency
+def get_node_degree(target_node: str, adjacency_list: Dict[str, Set[str]]) -> int:
+    return len(adjacency_list[target_node])
+$edges_code
+adjacency_list = get_adjacency_list(edges)
+target_node = '$target_node'
+ans = get_node_degree(target_node, adjacency_list)
+# CODE END
+''')
+
+
 class EdgeCount(GraphTask):
     """The graph task for finding number of edges in a graph."""
 
@@ -446,6 +547,7 @@ class EdgeCount(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         for ind, graph in enumerate(graphs):
@@ -465,37 +567,34 @@ class EdgeCount(GraphTask):
             }
         return examples_dict
 
-    def get_edges_string(self, name_dict, edges):
-        # Build the string with each edge on a new line and properly quoted
-        edges_string = ',\n        '.join(f"('{name_dict[edge[0]]}', '{name_dict[edge[1]]}')" for edge in edges)
-        return edges_string
-
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         self._question_description = self._question_graph_description
 
         question =self._task_description + self._question_description + question + 'A:'
-        formatted_edges = self.get_edges_string(name_dict, list(graph.edges()))
-        answer = textwrap.dedent(f'''
-        # CODE START
-        from typing import List, Tuple
-        def count_edges(edges: List[Tuple[str, str]]) -> int:
-            unique_edges = set()
-            for u, v in edges:
-                edge = tuple(sorted((u, v)))
-                unique_edges.add(edge)
-            return len(unique_edges)
-        edges = [{formatted_edges}]
-        ans = count_edges(edges)
-        # CODE END
-        ''')
+        answer = self.render_code(graph, encoding_method, name_dict)
 
         return question + answer
 
 
+register_code_template('edge_count', '''
+# CODE START
+from typing import List, Tuple
+def count_edges(edges: List[Tuple[str, str]]) -> int:
+    unique_edges = set()
+    for u, v in edges:
+        edge = tuple(sorted((u, v)))
+        unique_edges.add(edge)
+    return len(unique_edges)
+$edges_code
+ans = count_edges(edges)
+# CODE END
+''')
+
+
 class ConnectedNodes(GraphTask):
     """The graph task for finding connected nodes to a given node in a graph."""
 
@@ -504,29 +603,19 @@ class ConnectedNodes(GraphTask):
         self.name = 'connected_nodes'
         self._task_graph_description = "Write a piece of Python code to return the answer in a variable 'ans'. Please enclose the code with # CODE START and # CODE END. Please create an adjacency list from 'edges', default 'edges' to an empty list (edges=[]) if not provided.\n"
 
-    def get_nodes_string(self, name_dict, nnodes):
-        node_string = ''
-        for i in range(nnodes - 1):
-            node_string += "'" + name_dict[i] + "',"
-        node_string += "'" + name_dict[nnodes - 1] + "'"
-        return node_string
-    
-    def get_edges_string(self, name_dict, edges):
-        # Build the string with each edge on a new line and properly quoted
-        edges_string = ',\n        '.join(f"('{name_dict[edge[0]]}', '{name_dict[edge[1]]}')" for edge in edges)
-        return edges_string
 
     def prepare_examples_dict(
             self,
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         for ind, graph in enumerate(graphs):
             question = graph_text_encoder.encode_graph(graph, encoding_method)
-            source_node = random.sample(list(graph.nodes()), k=1)[0]
+            source_node = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=1)[0]
             task_description = self._task_graph_description + 'Q: List all the nodes connected to %s in alphabetical order.\n'% name_dict[source_node] 
             question = task_description + question + 'A: \n' #question += task_description if you want to remove self.task_graph_description from the exemplar
             outgoing_edges = list(graph.edges(source_node))
@@ -565,38 +654,7 @@ class ConnectedNodes(GraphTask):
 
     # generate the code part in prompt,#CODE START...#CODE END
     def generate_code(self, graph, encoding_method,name_dict, source_node):
-        def create_node_string(name_dict, nnodes):
-            node_string = ""
-            for i in range(nnodes - 1):
-                node_string += name_dict[i] + ", "
-            node_string += name_dict[nnodes - 1]
-            return node_string
-        nodes_string = self.get_nodes_string(name_dict, len(graph.nodes()))
-        edges_string = self.get_edges_string(name_dict, list(graph.edges()))
-        code = textwrap.dedent(f'''\
-        # CODE START
-        from collections import defaultdict
-        from typing import Set, Dict, List, Tuple
-        def get_adjacency_list(edges: List[Tuple[str, str]]) -> Dict[str, Set[str]]:
-            adjacency = defaultdict(set)
-            for each_edge in edges:
-                u, v = each_edge
-                adjacency[u].add(v)
-                adjacency[v].add(u)
-            return adjacency
-        def get_connected_nodes(target_node: str, adjacency_list: Dict[str, Set[str]]) -> str:
-            if target_node in adjacency_list and adjacency_list[target_node]:
-                connected_nodes = sorted(adjacency_list[target_node], key=lambda x: (x.isdigit(), int(x) if x.isdigit() else x))
-                return ', '.join(connected_nodes)
-            else:
-                return "No nodes"
-        edges = [{edges_string}]
-        adjacency_list = get_adjacency_list(edges)
-        target_node = '{str(name_dict[source_node])}'
-        ans = get_connected_nodes(target_node, adjacency_list)
-        # CODE END
-        ''')
-        return code
+        return self.render_code(graph, encoding_method, name_dict, target_node=str(name_dict[source_node]))
     
     def get_edge_string(
             self, name_dict, graph, source_node
@@ -617,11 +675,12 @@ class ConnectedNodes(GraphTask):
 
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
-        source_node = random.sample(list(graph.nodes()), k=1)[0]
+        source_node = rng.sample(list(graph.nodes()), k=1)[0]
         task_description = self._task_graph_description + 'Q: List all the nodes connected to %s in alphabetical order.\n'% name_dict[source_node]
         question = task_description + question + 'A: \n'
         code = self.generate_code(graph, encoding_method, name_dict, source_node)
@@ -632,6 +691,31 @@ class ConnectedNodes(GraphTask):
         return question + code
 
 
+register_code_template('connected_nodes', '''\
+# CODE START
+from collections import defaultdict
+from typing import Set, Dict, List, Tuple
+def get_adjacency_list(edges: List[Tuple[str, str]]) -> Dict[str, Set[str]]:
+    adjacency = defaultdict(set)
+    for each_edge in edges:
+        u, v = each_edge
+        adjacency[u].add(v)
+        adjacency[v].add(u)
+    return adjacency
+def get_connected_nodes(target_node: str, adjacency_list: Dict[str, Set[str]]) -> str:
+    if target_node in adjacency_list and adjacency_list[target_node]:
+        connected_nodes = sorted(adjacency_list[target_node], key=lambda x: (x.isdigit(), int(x) if x.isdigit() else x))
+        return ', '.join(connected_nodes)
+    else:
+        return "No nodes"
+$edges_code
+adjacency_list = get_adjacency_list(edges)
+target_node = '$target_node'
+ans = get_connected_nodes(target_node, adjacency_list)
+# CODE END
+''')
+
+
 class DisconnectedNodes(GraphTask):
     """The task for finding disconnected nodes for a given node in a graph."""
 
@@ -644,12 +728,13 @@ class DisconnectedNodes(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         for ind, graph in enumerate(graphs):
             question = graph_text_encoder.encode_graph(graph, encoding_method)
-            source_node = random.sample(list(graph.nodes()), k=1)[0]
+            source_node = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=1)[0]
             task_description = (
                     'Q: List all the nodes that are not connected to %s in alphabetical'
                     ' order.\nA: '
@@ -706,11 +791,12 @@ class DisconnectedNodes(GraphTask):
         return ', '.join(map(str, sorted(all_nodes_names)))
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
-        source_node = random.sample(list(graph.nodes()), k=1)[0]
+        source_node = rng.sample(list(graph.nodes()), k=1)[0]
         question += (
                 'Q: List all the nodes that are not connected to %s in alphabetical'
                 ' order.\nA: '
@@ -752,12 +838,13 @@ class Reachability(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
 
         for ind, graph in enumerate(graphs):
-            source, target = random.sample(list(graph.nodes()), k=2)
+            source, target = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=2)
             question = graph_text_encoder.encode_graph(graph, encoding_method)
             task_description = 'Q: Is there a path from node %s to node %s?\nA: ' % (
                 name_dict[source],
@@ -781,10 +868,11 @@ class Reachability(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
-        source, target = random.sample(list(graph.nodes()), k=2)
+        source, target = rng.sample(list(graph.nodes()), k=2)
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         question += 'Q: Is there a path from node %s to node %s?\nA: ' % (
             name_dict[source],
@@ -831,12 +919,13 @@ class ShortestPath(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
 
         for ind, graph in enumerate(graphs):
-            source, target = random.sample(list(graph.nodes()), k=1)
+            source, target = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=2)
             question = graph_text_encoder.encode_graph(graph, encoding_method)
             task_description = (
                     'Q: What is the length of the shortest path from node %s to node'
@@ -868,10 +957,11 @@ class ShortestPath(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
+        rng = self.rng(encoding_method, index, 'exemplar')
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
-        source, target = random.sample(list(graph.nodes()), k=2)
+        source, target = rng.sample(list(graph.nodes()), k=2)
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         question += (
                 'Q: What is the length of the shortest path from node %s to node'
@@ -926,6 +1016,7 @@ class TriangleCounting(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         for ind, graph in enumerate(graphs):
@@ -949,7 +1040,7 @@ class TriangleCounting(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
         """Create a few shot example w or w/o cot for the graph graph."""
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
@@ -1001,13 +1092,14 @@ class MaximumFlow(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
 
         for ind, graph in enumerate(graphs):
-            graph = add_edge_weight(graph)
-            source, target = random.sample(list(graph.nodes()), k=2)
+            graph = add_edge_weight(graph, self.rng(None, first_index + ind, 'question_weights'))
+            source, target = self.rng(encoding_method, first_index + ind, 'question').sample(list(graph.nodes()), k=2)
             question = graph_text_encoder.encode_graph(graph, encoding_method)
             task_description = (
                     'Q: What is the maximum capacity of the flow from node %s to node'
@@ -1031,11 +1123,12 @@ class MaximumFlow(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
-        graph = add_edge_weight(graph)
+        rng = self.rng(encoding_method, index, 'exemplar')
+        graph = add_edge_weight(graph, self.rng(None, index, 'exemplar_weights'))
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
-        source, target = random.sample(list(graph.nodes()), k=2)
+        source, target = rng.sample(list(graph.nodes()), k=2)
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         question += (
                 'Q: What is the maximum capacity of the flow from node %s to'
@@ -1077,12 +1170,12 @@ def has_edge_weights(graph):
     return True
 
 
-def add_edge_weight(graph):
+def add_edge_weight(graph, rng):
     if has_edge_weights(graph):
         return graph
     else:
         for edge in graph.edges():
-            graph[edge[0]][edge[1]]['weight'] = random.randint(1, 10)
+            graph[edge[0]][edge[1]]['weight'] = rng.randint(1, 10)
         return graph
 
 
@@ -1106,15 +1199,16 @@ class NodeClassification(GraphTask):
             graphs,
             generator_algorithms,
             encoding_method,
+            first_index=0,
     ):
-        classes = random.sample(list(self.classes), k=2)
+        classes = self.rng(encoding_method, None, 'classes').sample(list(self.classes), k=2)
         examples_dict = {}
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         for ind, graph in enumerate(graphs):
             question = graph_text_encoder.encode_graph(graph, encoding_method)
             nnodes = len(graph.nodes())
             # Sampling nnodes // 2 + 1 nodes.
-            sampled_nodes = random.sample(
+            sampled_nodes = self.rng(encoding_method, first_index + ind, 'question').sample(
                 list(graph.nodes(data=True)), k=nnodes // 2 + 1
             )
             # Adding the class of half of the nodes.
@@ -1147,13 +1241,14 @@ class NodeClassification(GraphTask):
         return examples_dict
 
     def create_few_shot_example(
-            self, graph, encoding_method, cot
+            self, graph, encoding_method, cot, index=None
     ):
-        classes = random.sample(list(self.classes), k=2)
+        rng = self.rng(encoding_method, index, 'exemplar')
+        classes = rng.sample(list(self.classes), k=2)
         name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
         question = graph_text_encoder.encode_graph(graph, encoding_method)
         nnodes = len(graph.nodes())
-        sampled_nodes = random.sample(
+        sampled_nodes = rng.sample(
             list(graph.nodes(data=True)), k=nnodes // 2 + 1
         )
         for node_data in sampled_nodes[:-1]:
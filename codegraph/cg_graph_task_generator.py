@@ -25,24 +25,13 @@ r"""The graph tasks to be tried with LLMs."""
 
 from collections.abc import Sequence
 import os
-import random
 
 from absl import app
 from absl import flags
-import networkx as nx
-import numpy as np
 
-
-# Check the environment variable
-adjacency_list_type = os.environ.get('ADJACENCY_LIST_TYPE', '0')  # Default to '0' if not set
-if adjacency_list_type == '1':
-    from codegraph import cg_graph_task_adj_list as graph_task
-    print("Using cg_graph_task_adj_list module for graph tasks.")
-else:
-    from codegraph import cg_graph_task as graph_task
-    print("Using cg_graph_task module for graph tasks.")
-
-from codegraph import cg_graph_task_utils as utils #edited for import cg_graph_task_utils
+# networkx, numpy, TensorFlow and the task modules are imported on first use,
+# so that --help and flag errors come back at once.
+import profiling
 
 _TASK = flags.DEFINE_enum(
     'task',
@@ -88,24 +77,108 @@ _K_SHOT = flags.DEFINE_integer(
     1,  # default to 1-shot if not specified
     'Number of few-shot examples to include in the prompt'
 )
+_K_SHOTS = flags.DEFINE_list(
+    'k_shots',
+    None,
+    'Comma-separated k values, e.g. 1,2,3, to write the _cg_{k}_shot files of'
+    ' all of them in one pass with nested exemplars; overrides --k_shot.',
+)
+_FIXED_EXEMPLARS = flags.DEFINE_bool(
+    'fixed_exemplars',
+    False,
+    'Share one exemplar set across all questions of a (task, encoder) so that'
+    ' prompts have a long common prefix for provider-side prompt caching.',
+)
+_BIND_GRAPH = flags.DEFINE_bool(
+    'bind_graph',
+    False,
+    'Write exemplars whose code uses the question graph as pre-bound `nodes`'
+    ' and `edges` instead of transcribing it (see evaluate.py --bind_graph).',
+)
+_MAX_ISOMORPHIC_COPIES = flags.DEFINE_integer(
+    'max_isomorphic_copies',
+    None,
+    'Keep at most this many mutually isomorphic test graphs per algorithm'
+    ' (1 drops every duplicate structure). Default: keep all graphs.',
+)
+_EXCLUDE_LEAKED_EXEMPLARS = flags.DEFINE_bool(
+    'exclude_leaked_exemplars',
+    False,
+    'Do not use few-shot graphs isomorphic to a test graph as exemplars.',
+)
+_FORCE = flags.DEFINE_bool(
+    'force',
+    False,
+    'Regenerate the output even if the manifest next to it records the same'
+    ' inputs (graph corpus, task source, encoders, seed, k and options).',
+)
+_GRAPH_VIEWS = flags.DEFINE_bool(
+    'graph_views',
+    False,
+    'Read the graphs as read-only views of the memory-mapped CSR corpus'
+    ' (cg_graph_generator --write_csr) when the task only needs their nodes,'
+    ' edges and degrees, so that parallel generators share one copy of it.',
+)
+_PROFILE = flags.DEFINE_bool(
+    'profile',
+    False,
+    'Profile the stages of the run (graph loading, encoding, exemplar'
+    ' rendering, serialization) and write the profiles to'
+    ' {task_dir}/profile/{task}_{algorithm}.',
+)
+_TRACE_MEMORY = flags.DEFINE_bool(
+    'trace_memory',
+    False,
+    'Record the peak traced memory of every stage with its top allocation'
+    ' sites, written like --profile.',
+)
+_PROFILER = flags.DEFINE_enum(
+    'profiler',
+    'cprofile',
+    profiling.PROFILERS,
+    'cprofile profiles each stage; pyinstrument samples the whole run.',
+)
 
 
 
 
+# The class of each task in the graph task module.
 TASK_CLASS = {
-    'edge_existence': graph_task.EdgeExistence,
-    'node_degree': graph_task.NodeDegree,
-    'node_count': graph_task.NodeCount,
-    'edge_count': graph_task.EdgeCount,
-    'connected_nodes': graph_task.ConnectedNodes,
-    'cycle_check': graph_task.CycleCheck,
-    'disconnected_nodes': graph_task.DisconnectedNodes,
-    'reachability': graph_task.Reachability,
-    'shortest_path': graph_task.ShortestPath,
-    'maximum_flow': graph_task.MaximumFlow,
-    'triangle_counting': graph_task.TriangleCounting,
-    'node_classification': graph_task.NodeClassification,
+    'edge_existence': 'EdgeExistence',
+    'node_degree': 'NodeDegree',
+    'node_count': 'NodeCount',
+    'edge_count': 'EdgeCount',
+    'connected_nodes': 'ConnectedNodes',
+    'cycle_check': 'CycleCheck',
+    'disconnected_nodes': 'DisconnectedNodes',
+    'reachability': 'Reachability',
+    'shortest_path': 'ShortestPath',
+    'maximum_flow': 'MaximumFlow',
+    'triangle_counting': 'TriangleCounting',
+    'node_classification': 'NodeClassification',
 }
+# The tasks answered from the nodes, edges and degrees of a graph alone, which
+# can run on the graph views of the CSR corpus.
+GRAPH_VIEW_TASKS = [
+    'edge_existence',
+    'node_degree',
+    'node_count',
+    'edge_count',
+    'connected_nodes',
+    'disconnected_nodes',
+]
+
+
+def load_graph_task_module():
+  """Return the graph task module selected by the ADJACENCY_LIST_TYPE variable."""
+  # Default to '0' if not set
+  if os.environ.get('ADJACENCY_LIST_TYPE', '0') == '1':
+    from codegraph import cg_graph_task_adj_list as graph_task
+    print("Using cg_graph_task_adj_list module for graph tasks.")
+  else:
+    from codegraph import cg_graph_task as graph_task
+    print("Using cg_graph_task module for graph tasks.")
+  return graph_task
 
 
 def zero_shot(
@@ -128,7 +201,9 @@ def zero_shot(
     random_seed: the random seed to use in the process.
     split: whether we are creating a train or test split.
   """
-  random.seed(random_seed)
+  from codegraph import cg_graph_task_utils as utils
+
+  task.random_seed = random_seed
   zero_shot_examples = utils.create_zero_shot_task(
       task, graphs, algorithms, text_encoders, cot=cot
   )
@@ -151,7 +226,9 @@ def few_shot(
     cot,
     bag,
     random_seed,
-    k,
+    ks,
+    fixed_exemplars=False,
+    bind_graph=False,
 ):
   """Creating few-shot, cot, or cot-bag examples for the given task.
 
@@ -164,9 +241,13 @@ def few_shot(
     cot: whether to apply cot or not.
     bag: whether to apply build-a-graph method or not.
     random_seed: the random seed to use in the process.
+    ks: the numbers of exemplars per question, one file each.
+    fixed_exemplars: whether all questions of an encoder share the exemplars.
+    bind_graph: whether the code gets the question graph bound to it.
   """
-  random.seed(random_seed)
-  few_shot_examples = utils.create_few_shot_task(
+  from codegraph import cg_graph_task_utils as utils
+
+  few_shot_examples = utils.create_few_shot_tasks(
       task,
       graphs,
       algorithms,
@@ -175,9 +256,23 @@ def few_shot(
       cot=cot,
       bag=bag,
       random_seed=random_seed,
-      k=k,
+      ks=ks,
+      fixed_exemplars=fixed_exemplars,
+      bind_graph=bind_graph,
   )
-  file_name = task.name
+  for k in ks:
+    file_name = few_shot_file_name(
+        task.name, cot, bag, k, fixed_exemplars, bind_graph
+    )
+    utils.write_examples(
+        few_shot_examples[k],
+        os.path.join(_TASK_DIR.value, file_name),
+    )
+
+
+def few_shot_file_name(task_name, cot, bag, k, fixed_exemplars, bind_graph):
+  """Return the file name of the few-shot examples of a task."""
+  file_name = task_name
   if cot and bag:
     file_name += '_cot_bag_test.tfrecords'
   elif cot:
@@ -185,31 +280,135 @@ def few_shot(
   else:
     # file_name += '_few_shot_test.tfrecords'
     # file_name += '_cg_test.tfrecords'
-    file_name += f'_cg_{k}_shot_test.tfrecords'
+    file_name += f'_cg_{k}_shot'
+    if fixed_exemplars:
+      file_name += '_fixed'
+    if bind_graph:
+      file_name += '_bound'
+    file_name += '_test.tfrecords'
+  return file_name
+
+
+def manifest_inputs(graph_task, task, algorithms, text_encoders):
+  """Return the digests of everything the examples of this run depend on but k.
+
+  Covers the graph corpus, the source of the task classes with their exemplar
+  code template and of the module-level helpers rendering it, the text encoders
+  with their name tables, the whole generator code, and the flags that change
+  the examples. Other tasks' classes and templates are left out, so editing one
+  task rebuilds only its files.
+  """
+  import json
+  import sys
 
-  utils.write_examples(
-      few_shot_examples,
-      os.path.join(_TASK_DIR.value, file_name),
-  )
+  from codegraph import cg_graph_generator_utils
+  from codegraph import cg_graph_task_utils as utils
+  from codegraph import cg_graph_text_encoder as graph_text_encoder
+
+  corpus_algorithms = list(algorithms)
+  if isinstance(task, graph_task.NodeClassification):
+    corpus_algorithms.append('sbm')
+  template = graph_task.CODE_TEMPLATES.get(task.name)
+  task_classes = [cls for cls in type(task).__mro__ if cls is not object]
+  rendering_helpers = [
+      graph_task.register_code_template,
+      graph_task._graph_literals,
+      graph_task.graph_literals,
+      graph_task.keyed_random,
+      graph_task.BOUND_ASSUMPTION.pattern,
+      graph_task.BOUND_ADJACENCY_DEFAULT.pattern,
+      json.dumps(graph_task.COMPACT_EDGES_CODE, sort_keys=True),
+  ]
+  name_tables = {
+      text_encoder: graph_text_encoder.TEXT_ENCODER_DICT[text_encoder]
+      for text_encoder in text_encoders
+  }
+  return {
+      'corpus': {
+          '%s/%s' % (algorithm, split): utils.corpus_digest(
+              _GRAPHS_DIR.value, algorithm, split
+          )
+          for algorithm in corpus_algorithms
+          for split in ['test', 'train']
+      },
+      'task': utils.source_digest(
+          *task_classes,
+          template.template if template else '',
+          *rendering_helpers,
+      ),
+      'encoders': utils.source_digest(
+          graph_text_encoder, json.dumps(name_tables, sort_keys=True)
+      ),
+      'generator': utils.source_digest(
+          sys.modules[__name__], utils, cg_graph_generator_utils
+      ),
+      'random_seed': _RANDOM_SEED.value,
+      'options': {
+          'text_encoders': text_encoders,
+          'max_isomorphic_copies': _MAX_ISOMORPHIC_COPIES.value,
+          'exclude_leaked_exemplars': _EXCLUDE_LEAKED_EXEMPLARS.value,
+      },
+  }
 
 
 def generate_random_sbm_graph(random_state):
+  import networkx as nx
+  import numpy as np
+
   # Sampling a small number as the probability of the two nodes in different
   # communities being connected.
-  small_number = random.uniform(0, 0.05)
+  small_number = random_state.uniform(0, 0.05)
   # Sampling a large number as probability of the nodes in one community
   # being connected.
-  large_number = random.uniform(0.6, 0.8)
-  number_of_nodes = random.choice(np.arange(5, 20))
+  large_number = random_state.uniform(0.6, 0.8)
+  number_of_nodes = random_state.choice(np.arange(5, 20))
   sizes = [number_of_nodes // 2, number_of_nodes // 2]
   probs = [[large_number, small_number], [small_number, large_number]]
   return nx.stochastic_block_model(sizes, probs, seed=random_state)
 
 
+def load_sbm_graphs(split):
+  """Return the sbm graphs of a split if they carry their blocks, else []."""
+  from codegraph import cg_graph_generator_utils
+  from codegraph import cg_graph_task_utils as utils
+
+  path = cg_graph_generator_utils.corpus_path(_GRAPHS_DIR.value, 'sbm', split)
+  if not os.path.exists(path):
+    return []
+  graphs = utils.load_graphs(_GRAPHS_DIR.value, 'sbm', split)
+  return graphs if utils.has_blocks(graphs) else []
+
+
 def main(argv):
   if len(argv) > 1:
     raise app.UsageError('Too many command-line arguments.')
 
+  if _PROFILE.value or _TRACE_MEMORY.value:
+    profiling.start(_PROFILE.value, _TRACE_MEMORY.value, _PROFILER.value)
+  generate()
+  profiler = profiling.stop()
+  if profiler is not None:
+    config = {
+        holder.name: holder.value
+        for holder in [_TASK, _ALGORITHM, _TASK_DIR, _GRAPHS_DIR, _RANDOM_SEED,
+                       _K_SHOT, _K_SHOTS, _FIXED_EXEMPLARS, _BIND_GRAPH,
+                       _MAX_ISOMORPHIC_COPIES, _EXCLUDE_LEAKED_EXEMPLARS,
+                       _FORCE, _GRAPH_VIEWS]
+    }
+    profiler.write(
+        os.path.join(_TASK_DIR.value, 'profile',
+                     '%s_%s' % (_TASK.value, _ALGORITHM.value)),
+        config,
+    )
+
+
+def generate():
+  """Generate the examples of the task selected by the flags."""
+  import numpy as np
+
+  from codegraph import cg_graph_task_utils as utils
+
+  graph_task = load_graph_task_module()
   if _ALGORITHM.value == 'all':
     algorithms = ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path']
   else:
@@ -225,8 +424,46 @@ def main(argv):
       'social_network',
       'politician',
       'expert',
+      'compact',
+      'adjacency_rows',
+      'run_length',
   ]
 
+  # Defining a task on the graphs
+  task = getattr(graph_task, TASK_CLASS[_TASK.value])()
+
+  if _K_SHOTS.value:
+    ks = sorted({int(k) for k in _K_SHOTS.value})
+  else:
+    ks = [_K_SHOT.value]
+
+  # Skipping the outputs generated from the same inputs.
+  run_inputs = manifest_inputs(graph_task, task, algorithms, text_encoders)
+  output_paths = {}
+  inputs = {}
+  for k in ks:
+    output_path = os.path.join(_TASK_DIR.value, few_shot_file_name(
+        task.name, False, False, k, _FIXED_EXEMPLARS.value, _BIND_GRAPH.value,
+    ))
+    inputs[k] = dict(run_inputs, k=k)
+    changed = utils.changed_inputs(output_path, inputs[k])
+    if not changed and not _FORCE.value:
+      print('%s is up to date' % output_path)
+      continue
+    print('Generating %s (changed: %s)' % (
+        output_path, ', '.join(changed) or 'none, --force'))
+    output_paths[k] = output_path
+  if not output_paths:
+    return
+
+  # Finding duplicates needs networkx graphs.
+  graph_views = (
+      _GRAPH_VIEWS.value
+      and _TASK.value in GRAPH_VIEW_TASKS
+      and _MAX_ISOMORPHIC_COPIES.value is None
+      and not _EXCLUDE_LEAKED_EXEMPLARS.value
+  )
+
   # Loading the graphs.
   graphs = []
   generator_algorithms = []
@@ -235,23 +472,33 @@ def main(argv):
         _GRAPHS_DIR.value,
         algorithm,
         'test',
+        graph_views=graph_views,
     )
     graphs += loaded_graphs
     generator_algorithms += [algorithm] * len(loaded_graphs)
 
-  # Defining a task on the graphs
-  task = TASK_CLASS[_TASK.value]()
+  if _MAX_ISOMORPHIC_COPIES.value is not None:
+    number_of_graphs = len(graphs)
+    graphs, generator_algorithms = utils.cap_duplicates(
+        graphs, generator_algorithms, _MAX_ISOMORPHIC_COPIES.value
+    )
+    print('Dropped %d isomorphic duplicate test graphs' % (number_of_graphs - len(graphs)))
 
   if isinstance(task, graph_task.NodeClassification):
     # The node classification task requires SBM graphs. As it's not possible to
-    # write graphs with data (e.g., blocks data as in SBM graphs), we regenerate
-    # graphs.
-
-    random_state = np.random.RandomState(_RANDOM_SEED.value)
-    print('Generating sbm graphs')
-    graphs = [
-        generate_random_sbm_graph(random_state) for _ in range(len(graphs))
-    ]
+    # write graphs with data (e.g., blocks data as in SBM graphs) to GraphML, we
+    # regenerate graphs unless the binary corpus of cg_graph_generator keeps
+    # their blocks.
+    sbm_graphs = load_sbm_graphs('test')
+    if sbm_graphs:
+      graphs = sbm_graphs
+      generator_algorithms = ['sbm'] * len(graphs)
+    else:
+      random_state = np.random.RandomState(_RANDOM_SEED.value)
+      print('Generating sbm graphs')
+      graphs = [
+          generate_random_sbm_graph(random_state) for _ in range(len(graphs))
+      ]
 
   # Loading few-shot graphs.
   few_shot_graphs = []
@@ -260,18 +507,27 @@ def main(argv):
         _GRAPHS_DIR.value,
         algorithm,
         'train',
+        graph_views=graph_views,
     )
 
   if isinstance(task, graph_task.NodeClassification):
-    # The node classification task requires SBM graphs. As it's not possible to
-    # write graphs with data (e.g., blocks data as in SBM graphs), we regenerate
-    # graphs.
-    random_state = np.random.RandomState(_RANDOM_SEED.value + 1)
-    print('Generating few shot sbm graphs')
-    few_shot_graphs = [
-        generate_random_sbm_graph(random_state)
-        for _ in range(len(few_shot_graphs))
-    ]
+    sbm_graphs = load_sbm_graphs('train')
+    if sbm_graphs:
+      few_shot_graphs = sbm_graphs
+    else:
+      random_state = np.random.RandomState(_RANDOM_SEED.value + 1)
+      print('Generating few shot sbm graphs')
+      few_shot_graphs = [
+          generate_random_sbm_graph(random_state)
+          for _ in range(len(few_shot_graphs))
+      ]
+
+  if _EXCLUDE_LEAKED_EXEMPLARS.value:
+    number_of_graphs = len(few_shot_graphs)
+    few_shot_graphs = utils.drop_leaked(few_shot_graphs, graphs)
+    print('Dropped %d few-shot graphs isomorphic to a test graph' % (number_of_graphs - len(few_shot_graphs)))
+    if not few_shot_graphs:
+      raise ValueError('Every few-shot graph is isomorphic to a test graph.')
 
   few_shot(
       task,
@@ -282,8 +538,12 @@ def main(argv):
       cot=False,
       bag=False,
       random_seed=_RANDOM_SEED.value,
-      k=_K_SHOT.value,
+      ks=sorted(output_paths),
+      fixed_exemplars=_FIXED_EXEMPLARS.value,
+      bind_graph=_BIND_GRAPH.value,
   )
+  for k, output_path in output_paths.items():
+    utils.write_manifest(output_path, inputs[k])
 
 
 if __name__ == '__main__':
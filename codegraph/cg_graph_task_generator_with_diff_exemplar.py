@@ -17,12 +17,12 @@
 # Modifications made:
 # - Added new flags `_QUESTION_ALGORITHM` and `_EXEMPLAR_ALGORITHM` to handle distinct generation processes for questions and exemplars.
 # - Modified the `few_shot` function to support different algorithms for questions and exemplars in task generation.
+# - Generate every pair of question and exemplar algorithms, for several tasks, in one run.
 
 """The graph tasks to be tried with LLMs."""
 
 from collections.abc import Sequence
 import os
-import random
 
 from absl import app
 from absl import flags
@@ -32,45 +32,41 @@ import numpy as np
 from codegraph import cg_graph_task as graph_task
 from codegraph import cg_graph_task_utils_with_diff_exemplar as utils 
 
-_TASK = flags.DEFINE_enum(
+ALGORITHMS = ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path']
+
+_TASK = flags.DEFINE_list(
     'task',
     None,
-    [
-        'edge_existence',
-        'node_degree',
-        'node_count',
-        'edge_count',
-        'connected_nodes',
-        'cycle_check',
-        'disconnected_nodes',
-        'reachability',
-        'shortest_path',
-        'maximum_flow',
-        'triangle_counting',
-        'node_classification',
-    ],
-    'The task to generate datapoints.',
+    'The tasks to generate datapoints, comma-separated.',
     required=True,
 )
 
-_QUESTION_ALGORITHM = flags.DEFINE_enum(
+_QUESTION_ALGORITHM = flags.DEFINE_list(
     'question_algorithm',
     None,
-    ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path'],
-    'The graph generator algorithm for the question.',
+    'The graph generator algorithms for the questions, comma-separated.',
     required=True
 )
 
-_EXEMPLAR_ALGORITHM = flags.DEFINE_enum(
+_EXEMPLAR_ALGORITHM = flags.DEFINE_list(
     'exemplar_algorithm',
     None,
-    ['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path'],
-    'The graph generator algorithm for the exemplars.',
+    'The graph generator algorithms for the exemplars, comma-separated. Every'
+    ' question algorithm is paired with every exemplar algorithm.',
     required=True
 )
 
 _TASK_DIR = flags.DEFINE_string(
-    'task_dir', None, 'The directory to write tasks.', required=True
+    'task_dir',
+    None,
+    'The directory to write tasks, for one question and one exemplar'
+    ' algorithm.',
+)
+_BASE_TASK_DIR = flags.DEFINE_string(
+    'base_task_dir',
+    None,
+    'The directory to write the tasks of each pair of algorithms to, in'
+    ' {base_task_dir}/{question_algorithm}_{exemplar_algorithm}.',
 )
 _GRAPHS_DIR = flags.DEFINE_string(
     'graphs_dir', None, 'The directory containing the graphs.', required=True
@@ -108,7 +104,6 @@ def few_shot(
     task,
     question_graphs,
     few_shot_graphs,
-    question_algorithms,
     text_encoders,
     cot,
     bag,
@@ -119,26 +114,23 @@ def few_shot(
 
   Args:
     task: the corresponding graph task.
-    graphs: the list of graphs to use for the task.
-    few_shot_graphs: the list of graphs to generate few shot examples for.
-    algorithms: the algorithm used to generate the graphs.
+    question_graphs: the graphs of each question algorithm.
+    few_shot_graphs: the graphs of each exemplar algorithm to generate few shot
+      examples for.
     text_encoders: the encoders to use in the tasks.
     cot: whether to apply cot or not.
     bag: whether to apply build-a-graph method or not.
     random_seed: the random seed to use in the process.
   """
-  random.seed(random_seed)
-  few_shot_examples = utils.create_few_shot_task(
+  few_shot_examples = utils.create_cross_few_shot_tasks(
       task,
       question_graphs,
-      question_algorithms,
       few_shot_graphs,
       text_encoders,
       cot=cot,
       bag=bag,
       random_seed=random_seed,
       k=k,
-      
   )
   file_name = task.name
   if cot and bag:
@@ -150,20 +142,31 @@ def few_shot(
     #file_name += '_cg_test.tfrecords'
     file_name += f'_cg_{k}_shot_test.tfrecords'
 
-  utils.write_examples(
-      few_shot_examples,
-      os.path.join(_TASK_DIR.value, file_name),
+  for (question_algorithm, exemplar_algorithm), examples in few_shot_examples.items():
+    task_dir = pair_task_dir(question_algorithm, exemplar_algorithm)
+    os.makedirs(task_dir, exist_ok=True)
+    utils.write_examples(
+        examples,
+        os.path.join(task_dir, file_name),
+    )
+
+
+def pair_task_dir(question_algorithm, exemplar_algorithm):
+  if _TASK_DIR.value:
+    return _TASK_DIR.value
+  return os.path.join(
+      _BASE_TASK_DIR.value, '%s_%s' % (question_algorithm, exemplar_algorithm)
   )
 
 
 def generate_random_sbm_graph(random_state):
   # Sampling a small number as the probability of the two nodes in different
   # communities being connected.
-  small_number = random.uniform(0, 0.05)
+  small_number = random_state.uniform(0, 0.05)
   # Sampling a large number as probability of the nodes in one community
   # being connected.
-  large_number = random.uniform(0.6, 0.8)
-  number_of_nodes = random.choice(np.arange(5, 20))
+  large_number = random_state.uniform(0.6, 0.8)
+  number_of_nodes = random_state.choice(np.arange(5, 20))
   sizes = [number_of_nodes // 2, number_of_nodes // 2]
   probs = [[large_number, small_number], [small_number, large_number]]
   return nx.stochastic_block_model(sizes, probs, seed=random_state)
@@ -173,8 +176,20 @@ def main(argv):
   if len(argv) > 1:
     raise app.UsageError('Too many command-line arguments.')
 
-  question_algorithm = _QUESTION_ALGORITHM.value
-  exemplar_algorithm = _EXEMPLAR_ALGORITHM.value
+  for holder, choices in [(_TASK, TASK_CLASS), (_QUESTION_ALGORITHM, ALGORITHMS),
+                          (_EXEMPLAR_ALGORITHM, ALGORITHMS)]:
+    unknown = [value for value in holder.value if value not in choices]
+    if unknown:
+      raise app.UsageError('Unknown --%s: %s' % (holder.name, ', '.join(unknown)))
+  if bool(_TASK_DIR.value) == bool(_BASE_TASK_DIR.value):
+    raise app.UsageError('Pass one of --task_dir and --base_task_dir.')
+  if _TASK_DIR.value and (
+      len(_QUESTION_ALGORITHM.value) > 1 or len(_EXEMPLAR_ALGORITHM.value) > 1
+  ):
+    raise app.UsageError(
+        '--task_dir takes one question and one exemplar algorithm; use'
+        ' --base_task_dir for several.'
+    )
 
   text_encoders = [
       'adjacency',
@@ -188,61 +203,50 @@ def main(argv):
       'expert',
   ]
 
-  # Loading the graphs for questions
-  question_graphs = utils.load_graphs(
-      _GRAPHS_DIR.value,
-      question_algorithm,
-      'test',
-  )
-  question_generator_algorithms = [question_algorithm] * len(question_graphs)
-
-
-  # Defining a task on the graphs
-  task = TASK_CLASS[_TASK.value]()
-
-  if isinstance(task, graph_task.NodeClassification):
-    # The node classification task requires SBM graphs. As it's not possible to
-    # write graphs with data (e.g., blocks data as in SBM graphs), we regenerate
-    # graphs.
-
-    random_state = np.random.RandomState(_RANDOM_SEED.value)
-    print('Generating sbm graphs')
-    graphs = [
-        generate_random_sbm_graph(random_state) for _ in range(len(graphs))
-    ]
-
-  # Loading few-shot graphs.
-    # Loading graphs for few-shot examples
-
-  few_shot_graphs = utils.load_graphs(
-      _GRAPHS_DIR.value,
-      exemplar_algorithm,
-      'train',
-  )
-
-
-  if isinstance(task, graph_task.NodeClassification):
-    # The node classification task requires SBM graphs. As it's not possible to
-    # write graphs with data (e.g., blocks data as in SBM graphs), we regenerate
-    # graphs.
-    random_state = np.random.RandomState(_RANDOM_SEED.value + 1)
-    print('Generating few shot sbm graphs')
-    few_shot_graphs = [
-        generate_random_sbm_graph(random_state)
-        for _ in range(len(few_shot_graphs))
-    ]
-
-  few_shot(
-      task,
-      question_graphs,
-      few_shot_graphs,
-      question_generator_algorithms,
-      text_encoders,
-      cot=False,
-      bag=False,
-      random_seed=_RANDOM_SEED.value,
-      k=_K_SHOT.value,
-  )
+  # Loading the graphs for questions and few-shot examples once, for all tasks
+  # and pairs of algorithms.
+  question_graphs = {
+      algorithm: utils.load_graphs(_GRAPHS_DIR.value, algorithm, 'test')
+      for algorithm in _QUESTION_ALGORITHM.value
+  }
+  few_shot_graphs = {
+      algorithm: utils.load_graphs(_GRAPHS_DIR.value, algorithm, 'train')
+      for algorithm in _EXEMPLAR_ALGORITHM.value
+  }
+
+  for task_name in _TASK.value:
+    # Defining a task on the graphs
+    task = TASK_CLASS[task_name]()
+    task_question_graphs = question_graphs
+    task_few_shot_graphs = few_shot_graphs
+
+    if isinstance(task, graph_task.NodeClassification):
+      # The node classification task requires SBM graphs. As it's not possible
+      # to write graphs with data (e.g., blocks data as in SBM graphs), we
+      # regenerate graphs.
+      random_state = np.random.RandomState(_RANDOM_SEED.value)
+      print('Generating sbm graphs')
+      task_question_graphs = {
+          algorithm: [generate_random_sbm_graph(random_state) for _ in graphs]
+          for algorithm, graphs in question_graphs.items()
+      }
+      random_state = np.random.RandomState(_RANDOM_SEED.value + 1)
+      print('Generating few shot sbm graphs')
+      task_few_shot_graphs = {
+          algorithm: [generate_random_sbm_graph(random_state) for _ in graphs]
+          for algorithm, graphs in few_shot_graphs.items()
+      }
+
+    few_shot(
+        task,
+        task_question_graphs,
+        task_few_shot_graphs,
+        text_encoders,
+        cot=False,
+        bag=False,
+        random_seed=_RANDOM_SEED.value,
+        k=_K_SHOT.value,
+    )
 
 
 if __name__ == '__main__':
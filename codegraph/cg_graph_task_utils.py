@@ -21,14 +21,16 @@
 
 """The graph tasks to be tried with LLMs."""
 
+import hashlib
+import inspect
+import json
 import os
-import random
+import re
 
 import networkx as nx
-import tensorflow as tf
-from tensorflow.io import gfile
-from tensorflow.core.example import example_pb2
-from tensorflow.core.example import feature_pb2
+
+from codegraph import cg_graph_text_encoder as graph_text_encoder
+import profiling
 
 
 def create_example_feature(
@@ -39,8 +41,14 @@ def create_example_feature(
     encoding_method,
     nnodes,
     nedges,
+    graph_json='',
 ):
   """Create a tensorflow example from a datapoint."""
+  # TensorFlow takes seconds to import, so it is only loaded once needed.
+  import tensorflow as tf
+  from tensorflow.core.example import example_pb2
+  from tensorflow.core.example import feature_pb2
+
   key_feature = feature_pb2.Feature(
       bytes_list=tf.train.BytesList(value=[str(key).encode()])
   )
@@ -62,6 +70,9 @@ def create_example_feature(
   nedges_feature = feature_pb2.Feature(
       bytes_list=tf.train.BytesList(value=[nedges.encode()])
   )
+  graph_feature = feature_pb2.Feature(
+      bytes_list=tf.train.BytesList(value=[graph_json.encode()])
+  )
   example_feats = tf.train.Features(
       feature={
           'id': key_feature,
@@ -71,6 +82,7 @@ def create_example_feature(
           'text_encoding': encoding_method_feature,
           'nnodes': nnodes_feature,
           'nedges': nedges_feature,
+          'graph': graph_feature,
       }
   )
   return example_pb2.Example(features=example_feats)
@@ -81,24 +93,199 @@ def load_graphs(
     algorithm,
     split,
     max_nnodes = 20,
+    graph_views = False,
 ):
-  """Load a list of graphs from a given algorithm and split."""
+  """Load a list of graphs from a given algorithm and split.
+
+  The binary corpus of `cg_graph_generator`, `{algorithm}/{split}.npz`, is
+  read if it exists; the GraphML files in `{algorithm}/{split}/` otherwise.
+  With `graph_views`, read-only views of the memory-mapped CSR corpus in
+  `{algorithm}/{split}_csr/` are returned instead if it exists.
+  """
+  from codegraph import cg_graph_generator_utils
+
+  if graph_views:
+    path = cg_graph_generator_utils.csr_path(base_path, algorithm, split)
+    if os.path.exists(path):
+      with profiling.stage('graph_loading'):
+        return cg_graph_generator_utils.open_csr_corpus(path).graphs(max_nnodes)
+
+  path = cg_graph_generator_utils.corpus_path(base_path, algorithm, split)
+  if os.path.exists(path):
+    with profiling.stage('graph_loading'):
+      return cg_graph_generator_utils.corpus_graphs(
+          cg_graph_generator_utils.read_corpus(path), max_nnodes
+      )
+
+  from tensorflow.io import gfile
+
   graphs_path = os.path.join(
       base_path,
       algorithm,
       split,
   )
   loaded_graphs = []
-  all_files = gfile.listdir(graphs_path)
-  for file in all_files:
-    if file.endswith('.graphml'):
-      path = os.path.join(graphs_path, file)
-      graph = nx.read_graphml(open(path, 'rb'), node_type=int)
-      if graph.number_of_nodes() <= max_nnodes:
-        loaded_graphs.append(graph)
+  with profiling.stage('graph_loading'):
+    all_files = gfile.listdir(graphs_path)
+    for file in all_files:
+      if file.endswith('.graphml'):
+        path = os.path.join(graphs_path, file)
+        graph = nx.read_graphml(open(path, 'rb'), node_type=int)
+        if graph.number_of_nodes() <= max_nnodes:
+          loaded_graphs.append(graph)
   return loaded_graphs
 
 
+def has_blocks(graphs):
+  """Whether every node of the graphs carries its SBM block."""
+  return bool(graphs) and all(
+      'block' in data for graph in graphs for _, data in graph.nodes(data=True)
+  )
+
+
+MANIFEST_SUFFIX = '.manifest.json'
+
+
+def corpus_digest(base_path, algorithm, split):
+  """Return the sha256 of the graph files `load_graphs` reads for a split."""
+  from codegraph import cg_graph_generator_utils
+
+  path = cg_graph_generator_utils.corpus_path(base_path, algorithm, split)
+  if os.path.exists(path):
+    paths = [path]
+  else:
+    graphs_path = os.path.join(base_path, algorithm, split)
+    files = sorted(os.listdir(graphs_path)) if os.path.isdir(graphs_path) else []
+    paths = [
+        os.path.join(graphs_path, file)
+        for file in files
+        if file.endswith('.graphml')
+    ]
+  digest = hashlib.sha256()
+  for path in paths:
+    digest.update(os.path.basename(path).encode())
+    with open(path, 'rb') as f:
+      digest.update(hashlib.sha256(f.read()).digest())
+  return digest.hexdigest()
+
+
+def source_digest(*items):
+  """Return the sha256 of the source of modules, classes or functions and of strings."""
+  digest = hashlib.sha256()
+  for item in items:
+    text = item if isinstance(item, str) else inspect.getsource(item)
+    digest.update(hashlib.sha256(text.encode()).digest())
+  return digest.hexdigest()
+
+
+def changed_inputs(output_path, inputs):
+  """Return the names of the inputs that differ from the manifest of output_path.
+
+  Returns:
+    [] if output_path exists and was generated from `inputs`, ['output'] if
+    it or its manifest is missing, and the changed inputs otherwise.
+  """
+  manifest_path = output_path + MANIFEST_SUFFIX
+  if not os.path.exists(output_path) or not os.path.exists(manifest_path):
+    return ['output']
+  with open(manifest_path) as f:
+    recorded = json.load(f)['inputs']
+  return sorted(
+      name for name in set(inputs) | set(recorded)
+      if inputs.get(name) != recorded.get(name)
+  )
+
+
+def write_manifest(output_path, inputs):
+  """Record the inputs output_path was generated from next to it."""
+  with open(output_path + MANIFEST_SUFFIX, 'w') as f:
+    json.dump({'output': os.path.basename(output_path), 'inputs': inputs}, f,
+              indent=2, sort_keys=True)
+
+
+WL_ITERATIONS = 3
+
+
+def wl_hash(graph):
+  """Return the Weisfeiler-Lehman hash of the structure of a graph."""
+  return nx.weisfeiler_lehman_graph_hash(graph, iterations=WL_ITERATIONS)
+
+
+class IsomorphismIndex:
+  """Groups graphs into isomorphism classes.
+
+  Each class is identified by its position in the order the classes were
+  first seen.
+  """
+
+  def __init__(self):
+    self._buckets = {}
+    self.representatives = []
+
+  def find(self, graph, graph_hash=None):
+    """Return the class of a graph, or None if no indexed graph matches."""
+    bucket = self._buckets.get(graph_hash or wl_hash(graph), [])
+    for class_id in bucket:
+      if nx.is_isomorphic(graph, self.representatives[class_id]):
+        return class_id
+    return None
+
+  def add(self, graph):
+    """Return the class of a graph, opening a new class if needed."""
+    graph_hash = wl_hash(graph)
+    class_id = self.find(graph, graph_hash)
+    if class_id is None:
+      class_id = len(self.representatives)
+      self.representatives.append(graph)
+      self._buckets.setdefault(graph_hash, []).append(class_id)
+    return class_id
+
+
+def isomorphism_classes(graphs):
+  """Return the isomorphism class id of every graph."""
+  index = IsomorphismIndex()
+  return [index.add(graph) for graph in graphs]
+
+
+def cap_duplicates(graphs, algorithms, max_copies):
+  """Keep at most `max_copies` mutually isomorphic graphs per algorithm.
+
+  Returns:
+    The kept graphs and their algorithms, in their original order.
+  """
+  indexes = {}
+  copies = {}
+  kept_graphs, kept_algorithms = [], []
+  for graph, algorithm in zip(graphs, algorithms):
+    class_id = indexes.setdefault(algorithm, IsomorphismIndex()).add(graph)
+    copies[(algorithm, class_id)] = copies.get((algorithm, class_id), 0) + 1
+    if copies[(algorithm, class_id)] <= max_copies:
+      kept_graphs.append(graph)
+      kept_algorithms.append(algorithm)
+  return kept_graphs, kept_algorithms
+
+
+def drop_leaked(graphs, reference_graphs):
+  """Drop the graphs isomorphic to any of `reference_graphs`."""
+  index = IsomorphismIndex()
+  for graph in reference_graphs:
+    index.add(graph)
+  return [graph for graph in graphs if index.find(graph) is None]
+
+
+def graph_to_json(graph, encoding_method):
+  """Serialize the nodes and edges of a graph under the names of an encoder.
+
+  `evaluate.py --bind_graph` binds them as 'nodes' and 'edges' in the
+  executed code.
+  """
+  name_dict = graph_text_encoder.TEXT_ENCODER_DICT[encoding_method]
+  return json.dumps({
+      'nodes': [name_dict[node] for node in graph.nodes()],
+      'edges': [[name_dict[u], name_dict[v]] for u, v in graph.edges()],
+  })
+
+
 def prepare_examples(
     examples_dict,
     encoding_method,
@@ -128,6 +315,8 @@ def prepare_examples(
             encoding_method,
             nnodes,
             nedges,
+            value.get('graph_json')
+            or graph_to_json(value['graph'], encoding_method),
         )
     )
   return examples
@@ -143,18 +332,22 @@ def create_zero_shot_task(
   """Create a recordio file with zero-shot examples for the task."""
   examples = []
   for encoding_method in text_encoders:
-    examples_dict = task.prepare_examples_dict(
-        graphs, generator_algorithms, encoding_method
-    )
+    with profiling.stage('encoding'):
+      examples_dict = task.prepare_examples_dict(
+          graphs, generator_algorithms, encoding_method
+      )
     if cot:
       for key in examples_dict.keys():
         examples_dict[key]['question'] += "Let's think step by step. "
-    examples += prepare_examples(examples_dict, encoding_method)
+    with profiling.stage('serialization'):
+      examples += prepare_examples(examples_dict, encoding_method)
   return examples
 
 
 def write_examples(examples, output_path):
-  with tf.io.TFRecordWriter(output_path) as file_writer:
+  import tensorflow as tf
+
+  with profiling.stage('serialization'), tf.io.TFRecordWriter(output_path) as file_writer:
     for example in examples:
       file_writer.write(example.SerializeToString())
 
@@ -170,9 +363,9 @@ def prepare_few_shots(
   for encoding_method in text_encoders:
     if encoding_method not in few_shots_examples_dict:
       few_shots_examples_dict[(encoding_method)] = []
-    for graph in graphs:
+    for index, graph in enumerate(graphs):
       few_shots_examples_dict[(encoding_method)].append(
-          task.create_few_shot_example(graph, encoding_method, cot)
+          task.create_few_shot_example(graph, encoding_method, cot, index=index)
       )
   return few_shots_examples_dict
 
@@ -180,14 +373,48 @@ def prepare_few_shots(
 def choose_few_shot_examples(
     few_shots_dict,
     encoding_method,
+    rng,
     k=1,
 ):
   """Choose few shot examples for each algorithm."""
-  few_shots_str = ''
-  for _ in range(k):
-    example_list = few_shots_dict[encoding_method]
-    few_shots_str +=  random.choice(example_list) + '\n'
-  return few_shots_str
+  return choose_nested_few_shot_examples(
+      few_shots_dict, encoding_method, rng, [k]
+  )[k]
+
+
+def choose_nested_few_shot_examples(
+    few_shots_dict,
+    encoding_method,
+    rng,
+    ks,
+):
+  """Choose the few shot examples for several k at once.
+
+  The exemplars of a smaller k are a prefix of those of a larger one, and the
+  same as `choose_few_shot_examples` chooses for that k with the same rng.
+
+  Returns:
+    A dict from each k to the text of its k exemplars.
+  """
+  example_list = few_shots_dict[encoding_method]
+  chosen = [rng.choice(example_list) + '\n' for _ in range(max(ks))]
+  return {k: ''.join(chosen[:k]) for k in ks}
+
+
+def count_tokens(text):
+  """Approximate the number of BPE tokens of a prompt.
+
+  Words and single punctuation marks are counted as one token each, which is
+  close enough to compare the cost of the text encoders.
+  """
+  return len(re.findall(r'\w+|[^\w\s]', text))
+
+
+def report_number_of_tokens(number_of_tokens):
+  """Print the average prompt tokens per question for each encoding method."""
+  print('Average prompt tokens per question:')
+  for encoding_method, counts in number_of_tokens.items():
+    print('  %s: %.1f' % (encoding_method, sum(counts) / len(counts)))
 
 
 def create_few_shot_task(
@@ -200,38 +427,118 @@ def create_few_shot_task(
     bag,
     random_seed,
     k,
+    fixed_exemplars=False,
+    bind_graph=False,
 ):
-  """Create a recordio file with few-shot examples for the task."""
-  number_of_tokens = {}
-  examples = []
-  print('prepare few shot task', 'cot', cot, 'bag', bag)
-  few_shots_examples_dict = prepare_few_shots(
+  """Create a recordio file with few-shot examples for the task.
+
+  With `fixed_exemplars`, the k exemplars are drawn once per encoding method
+  and shared by all of its questions, so every prompt of a (task, encoder)
+  starts with the same text and can hit provider-side prefix caches.
+
+  With `bind_graph`, the exemplar code uses 'nodes' and 'edges' without
+  defining them, and every prompt starts with a note that both are provided.
+
+  Every random choice is drawn from `task.rng`, keyed by the example it belongs
+  to, so the examples do not depend on the order they are generated in.
+  """
+  return create_few_shot_tasks(
       task,
+      graphs,
+      generator_algorithms,
       few_shots_graphs,
       text_encoders,
       cot,
-  )
-  for encoding_method in text_encoders:
-    random.seed(random_seed)
-    examples_dict = task.prepare_examples_dict(
-        graphs, generator_algorithms, encoding_method
+      bag,
+      random_seed,
+      [k],
+      fixed_exemplars=fixed_exemplars,
+      bind_graph=bind_graph,
+  )[k]
+
+
+def create_few_shot_tasks(
+    task,
+    graphs,
+    generator_algorithms,
+    few_shots_graphs,
+    text_encoders,
+    cot,
+    bag,
+    random_seed,
+    ks,
+    fixed_exemplars=False,
+    bind_graph=False,
+):
+  """Create the few-shot examples of the task for several k in one pass.
+
+  The exemplars are rendered and the questions encoded once for all k. Each
+  question gets nested exemplars: its k-shot prompt starts with the exemplars
+  of its smaller k, and equals the prompt `create_few_shot_task` writes for
+  that k alone.
+
+  Returns:
+    A dict from each k to its examples.
+  """
+  number_of_tokens = {k: {} for k in ks}
+  examples = {k: [] for k in ks}
+  print('prepare few shot task', 'cot', cot, 'bag', bag)
+  task.bind_graph = bind_graph
+  task.random_seed = random_seed
+  with profiling.stage('exemplar_rendering'):
+    few_shots_examples_dict = prepare_few_shots(
+        task,
+        few_shots_graphs,
+        text_encoders,
+        cot,
     )
-    for key in examples_dict.keys():
-      few_shots_examples = choose_few_shot_examples(
+  for encoding_method in text_encoders:
+    with profiling.stage('encoding'):
+      examples_dict = task.prepare_examples_dict(
+          graphs, generator_algorithms, encoding_method
+      )
+    if fixed_exemplars:
+      shared_few_shots_examples = choose_nested_few_shot_examples(
           few_shots_examples_dict,
           encoding_method,
-          k,
-      )
-      examples_dict[key]['question'] = (
-          few_shots_examples +  examples_dict[key]['question']
+          task.rng(encoding_method, None, 'exemplar_choice'),
+          ks,
       )
-      if bag:
-        examples_dict[key]['question'] = examples_dict[key]['question'].replace(
-            '\nQ: ',
-            "\nLet's construct the graph with the nodes and edges first.\nQ: ",
-        )  # pytype: disable=attribute-error
-      if encoding_method not in number_of_tokens:
-        number_of_tokens[encoding_method] = []
-    examples += prepare_examples(examples_dict, encoding_method)
+    k_examples_dicts = {k: {} for k in ks}
+    for key in examples_dict.keys():
+      if len(ks) > 1:
+        # Shared by the examples of every k.
+        examples_dict[key]['graph_json'] = graph_to_json(
+            examples_dict[key]['graph'], encoding_method
+        )
+      if fixed_exemplars:
+        few_shots_examples = shared_few_shots_examples
+      else:
+        few_shots_examples = choose_nested_few_shot_examples(
+            few_shots_examples_dict,
+            encoding_method,
+            task.rng(encoding_method, key, 'exemplar_choice'),
+            ks,
+        )
+      for k in ks:
+        question = few_shots_examples[k] + examples_dict[key]['question']
+        if bind_graph:
+          question = task.bind_instruction(question)
+        if bag:
+          question = question.replace(
+              '\nQ: ',
+              "\nLet's construct the graph with the nodes and edges first.\nQ: ",
+          )  # pytype: disable=attribute-error
+        k_examples_dicts[k][key] = dict(examples_dict[key], question=question)
+        number_of_tokens[k].setdefault(encoding_method, []).append(
+            count_tokens(question)
+        )
+    with profiling.stage('serialization'):
+      for k in ks:
+        examples[k] += prepare_examples(k_examples_dicts[k], encoding_method)
 
+  for k in ks:
+    if len(ks) > 1:
+      print('%d-shot:' % k)
+    report_number_of_tokens(number_of_tokens[k])
   return examples
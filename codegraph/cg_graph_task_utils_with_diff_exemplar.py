@@ -21,7 +21,6 @@
 """The graph tasks to be tried with LLMs."""
 
 import os
-import random
 
 import networkx as nx
 import tensorflow as tf
@@ -83,7 +82,19 @@ def load_graphs(
     split,
     max_nnodes = 20,
 ):
-  """Load a list of graphs from a given algorithm and split."""
+  """Load a list of graphs from a given algorithm and split.
+
+  The binary corpus of `cg_graph_generator`, `{algorithm}/{split}.npz`, is
+  read if it exists; the GraphML files in `{algorithm}/{split}/` otherwise.
+  """
+  from codegraph import cg_graph_generator_utils
+
+  path = cg_graph_generator_utils.corpus_path(base_path, algorithm, split)
+  if os.path.exists(path):
+    return cg_graph_generator_utils.corpus_graphs(
+        cg_graph_generator_utils.read_corpus(path), max_nnodes
+    )
+
   graphs_path = os.path.join(
       base_path,
       algorithm,
@@ -171,9 +182,9 @@ def prepare_few_shots(
   for encoding_method in text_encoders:
     if encoding_method not in few_shots_examples_dict:
       few_shots_examples_dict[(encoding_method)] = []
-    for graph in few_shot_graphs:
+    for index, graph in enumerate(few_shot_graphs):
       few_shots_examples_dict[(encoding_method)].append(
-          task.create_few_shot_example(graph, encoding_method, cot)
+          task.create_few_shot_example(graph, encoding_method, cot, index=index)
       )
   return few_shots_examples_dict
 
@@ -181,13 +192,14 @@ def prepare_few_shots(
 def choose_few_shot_examples(
     few_shots_dict,
     encoding_method,
+    rng,
     k = 1,
 ):
   """Choose few shot examples for each algorithm."""
   few_shots_str = ''
   for _ in range(k):
     example_list = few_shots_dict[encoding_method]
-    few_shots_str +=  random.choice(example_list) + '\n'
+    few_shots_str +=  rng.choice(example_list) + '\n'
   return few_shots_str
 
 
@@ -203,37 +215,80 @@ def create_few_shot_task(
     k,
 ):
   """Create a recordio file with few-shot examples for the task."""
-  number_of_tokens = {}
-  examples = []
-  print('prepare few shot task', 'cot', cot, 'bag', bag)
-  
-  few_shots_examples_dict = prepare_few_shots(
+  question_algorithm = question_algorithms[0] if question_algorithms else ''
+  return create_cross_few_shot_tasks(
       task,
-      few_shots_graphs,
+      {question_algorithm: question_graphs},
+      {'': few_shots_graphs},
       text_encoders,
       cot,
-  )
-  for encoding_method in text_encoders:
-    random.seed(random_seed)
-    examples_dict = task.prepare_examples_dict(
-        question_graphs, question_algorithms, encoding_method
-    )
-    for key in examples_dict.keys():
-      few_shots_examples = choose_few_shot_examples(
-          few_shots_examples_dict,
-          encoding_method,
-          k,
+      bag,
+      random_seed,
+      k,
+  )[(question_algorithm, '')]
+
+
+def create_cross_few_shot_tasks(
+    task,
+    question_graphs,
+    few_shots_graphs,
+    text_encoders,
+    cot,
+    bag,
+    random_seed,
+    k,
+):
+  """Create the few-shot examples of every (question, exemplar) algorithm pair.
+
+  Each exemplar pool is rendered once and each question set encoded once,
+  however many pairs they are part of.
+
+  Args:
+    question_graphs: the test graphs of each question algorithm.
+    few_shots_graphs: the exemplar graphs of each exemplar algorithm.
+
+  Returns:
+    A dict from each (question algorithm, exemplar algorithm) to its examples.
+  """
+  print('prepare few shot task', 'cot', cot, 'bag', bag)
+  task.random_seed = random_seed
+  few_shots_examples_dicts = {
+      exemplar_algorithm: prepare_few_shots(
+          task,
+          graphs,
+          text_encoders,
+          cot,
       )
-      examples_dict[key]['question'] = (
-          few_shots_examples +  examples_dict[key]['question']
+      for exemplar_algorithm, graphs in few_shots_graphs.items()
+  }
+  examples = {
+      (question_algorithm, exemplar_algorithm): []
+      for question_algorithm in question_graphs
+      for exemplar_algorithm in few_shots_graphs
+  }
+  for question_algorithm, graphs in question_graphs.items():
+    for encoding_method in text_encoders:
+      examples_dict = task.prepare_examples_dict(
+          graphs, [question_algorithm] * len(graphs), encoding_method
       )
-      if bag:
-        examples_dict[key]['question'] = examples_dict[key]['question'].replace(
-            '\nQ: ',
-            "\nLet's construct the graph with the nodes and edges first.\nQ: ",
-        )  # pytype: disable=attribute-error
-      if encoding_method not in number_of_tokens:
-        number_of_tokens[encoding_method] = []
-    examples += prepare_examples(examples_dict, encoding_method)
+      for exemplar_algorithm in few_shots_graphs:
+        pair_examples_dict = {}
+        for key in examples_dict.keys():
+          few_shots_examples = choose_few_shot_examples(
+              few_shots_examples_dicts[exemplar_algorithm],
+              encoding_method,
+              task.rng(encoding_method, key, 'exemplar_choice'),
+              k,
+          )
+          question = few_shots_examples + examples_dict[key]['question']
+          if bag:
+            question = question.replace(
+                '\nQ: ',
+                "\nLet's construct the graph with the nodes and edges first.\nQ: ",
+            )  # pytype: disable=attribute-error
+          pair_examples_dict[key] = dict(examples_dict[key], question=question)
+        examples[(question_algorithm, exemplar_algorithm)] += prepare_examples(
+            pair_examples_dict, encoding_method
+        )
 
   return examples
@@ -15,24 +15,42 @@
 
 """Library for encoding graphs in text."""
 
-import networkx as nx
-
 from codegraph import name_dictionaries
 
-TEXT_ENCODER_DICT = {
-    "adjacency": name_dictionaries.create_name_dict("integer"),
-    "incident": name_dictionaries.create_name_dict("integer"),
-    "friendship": name_dictionaries.create_name_dict("popular"),
-    "south_park": name_dictionaries.create_name_dict("south_park"),
-    "got": name_dictionaries.create_name_dict("got"),
-    "politician": name_dictionaries.create_name_dict("politician"),
-    "social_network": name_dictionaries.create_name_dict("popular"),
-    "expert": name_dictionaries.create_name_dict("alphabet"),
-    "coauthorship": name_dictionaries.create_name_dict("popular"),
-    "random": name_dictionaries.create_name_dict("random_integer"),
+# The name table behind the node names of each text encoder.
+TEXT_ENCODER_NAMES = {
+    "adjacency": "integer",
+    "incident": "integer",
+    "friendship": "popular",
+    "south_park": "south_park",
+    "got": "got",
+    "politician": "politician",
+    "social_network": "popular",
+    "expert": "alphabet",
+    "coauthorship": "popular",
+    "random": "random_integer",
+    "compact": "integer",
+    "adjacency_rows": "integer",
+    "run_length": "integer",
 }
 
 
+class _NameDicts(dict):
+    """Maps a text encoder to its node names, building each table on first use."""
+
+    def __missing__(self, text_encoder):
+        name_dict = name_dictionaries.create_name_dict(TEXT_ENCODER_NAMES[text_encoder])
+        self[text_encoder] = name_dict
+        return name_dict
+
+
+TEXT_ENCODER_DICT = _NameDicts()
+
+# Token-efficient encoders. They list every edge once in a terse format that
+# cg exemplars copy verbatim into a string instead of re-listing the edges.
+COMPACT_ENCODERS = ["compact", "adjacency_rows", "run_length"]
+
+
 def create_node_string(name_dict, nnodes):
     node_string = ""
     for i in range(nnodes - 1):
@@ -155,6 +173,69 @@ def expert_encoder(graph, name_dict):
     return output
 
 
+def create_graph_header(graph, name_dict):
+    return "G is a%s graph with nodes %s to %s.\n" % (
+        " directed" if graph.is_directed() else "n undirected",
+        name_dict[0],
+        name_dict[len(graph.nodes()) - 1],
+    )
+
+
+def compact_edges(graph, name_dict):
+    """Return the edges of a graph as a space separated `u-v` list."""
+    return " ".join("%s-%s" % (name_dict[i], name_dict[j]) for i, j in graph.edges())
+
+
+def neighbor_rows(graph, name_dict, run_length=False):
+    """Return one `u: v w ...` row per node listing its neighbors with a larger id.
+
+    With `run_length`, runs of consecutive neighbors are written as `a-b`.
+    """
+    rows = []
+    for source_node in sorted(graph.nodes()):
+        if graph.is_directed():
+            target_nodes = sorted(graph.successors(source_node))
+        else:
+            target_nodes = sorted(node for node in graph.neighbors(source_node) if node > source_node)
+        if not target_nodes:
+            continue
+        items = []
+        start = previous = target_nodes[0]
+        for node in target_nodes[1:] + [None]:
+            if run_length and node == previous + 1:
+                previous = node
+                continue
+            if start == previous:
+                items.append(name_dict[start])
+            else:
+                items.append("%s-%s" % (name_dict[start], name_dict[previous]))
+            start = previous = node
+        rows.append("%s: %s" % (name_dict[source_node], " ".join(items)))
+    return "\n".join(rows)
+
+
+def compact_encoder(graph, name_dict):
+    """Encoding a graph as a compact `u-v` edge list."""
+    return create_graph_header(graph, name_dict) + "Edges: %s\n" % compact_edges(graph, name_dict)
+
+
+def adjacency_rows_encoder(graph, name_dict):
+    """Encoding a graph with one row of larger-id neighbors per node."""
+    output = create_graph_header(graph, name_dict)
+    output += "Each row lists a node followed by its neighbors with a larger id:\n"
+    return output + neighbor_rows(graph, name_dict) + "\n"
+
+
+def run_length_encoder(graph, name_dict):
+    """Encoding a graph with run-length compressed neighbor rows."""
+    output = create_graph_header(graph, name_dict)
+    output += (
+        "Each row lists a node followed by its neighbors with a larger id, where"
+        " a-b stands for all nodes from a to b:\n"
+    )
+    return output + neighbor_rows(graph, name_dict, run_length=True) + "\n"
+
+
 TEXT_ENCODER_FN = {
     "adjacency": adjacency_encoder,
     "incident": incident_encoder,
@@ -166,10 +247,14 @@ TEXT_ENCODER_FN = {
     "expert": expert_encoder,
     "coauthorship": coauthorship_encoder,
     "random": adjacency_encoder,
+    "compact": compact_encoder,
+    "adjacency_rows": adjacency_rows_encoder,
+    "run_length": run_length_encoder,
 }
 
 
 def with_ids(graph, text_encoder):
+    import networkx as nx
     nx.set_node_attributes(graph, TEXT_ENCODER_DICT[text_encoder], name="id")
     return graph
 
@@ -178,3 +263,11 @@ def encode_graph(graph, text_encoder):
     """Encoding a graph according to the given text_encoder method."""
     name_dict = TEXT_ENCODER_DICT[text_encoder]
     return TEXT_ENCODER_FN[text_encoder](graph, name_dict)
+
+
+def graph_payload(graph, text_encoder):
+    """Return the part of a compact encoding that lists the edges."""
+    name_dict = TEXT_ENCODER_DICT[text_encoder]
+    if text_encoder == "compact":
+        return compact_edges(graph, name_dict)
+    return neighbor_rows(graph, name_dict, run_length=text_encoder == "run_length")
@@ -20,7 +20,8 @@
 #!/bin/bash
 set -e
 set -x
-# Default k-shot is 1 unless specified
+# Default k-shot is 1 unless specified; a comma-separated list such as 1,2,3
+# generates every k in one pass per task.
 K_SHOT=${1:-1}
 
 # Now you have $K_SHOT available in this script
@@ -52,6 +53,6 @@ do
                 --task_dir=$TASK_DIR \
                 --graphs_dir=$GRAPHS_DIR \
                 --random_seed=1234 \
-                --k_shot=$K_SHOT
+                --k_shots=$K_SHOT
   done
 done
@@ -15,13 +15,14 @@
 #
 # Modifications made:
 # Include two input arguments (`QUESTION_ALGORITHM` and `EXEMPLAR_ALGORITHM`) to enable flexible combinations of algorithms for question and exemplar settings.
+# Both arguments may be comma-separated lists; every pair and task is generated in one run.
 
 #!/bin/bash
 set -e
 set -x
 # Default k-shot is 1 unless specified
 K_SHOT=${3:-1}
-# Algorithms to process, passed as arguments
+# Algorithms to process, passed as arguments, e.g. "ba,sbm" "er"
 QUESTION_ALGORITHM=$1
 EXEMPLAR_ALGORITHM=$2
 
@@ -31,22 +32,16 @@ conda activate codegraph
 
 GRAPHS_DIR="./graphqa/graphs"
 BASE_TASK_DIR="./codegraph/tasks"
-TASK_DIR="${BASE_TASK_DIR}/${QUESTION_ALGORITHM}_${EXEMPLAR_ALGORITHM}"
-mkdir -p "${TASK_DIR}" # Ensure the directory exists
 
-TASKS=("node_degree" "connected_nodes")
+TASKS="node_degree,connected_nodes"
 
-# Generating examples for a specific algorithm
-echo "Generating tasks using question algorithm $QUESTION_ALGORITHM and exemplar algorithm $EXEMPLAR_ALGORITHM"
-for TASK in "${TASKS[@]}"
-do
-    echo "Generating prompts for task $TASK"
-    python3 -m codegraph.cg_graph_task_generator_with_diff_exemplar \
-                --task=$TASK \
-                --question_algorithm=$QUESTION_ALGORITHM \
-                --exemplar_algorithm=$EXEMPLAR_ALGORITHM \
-                --task_dir=$TASK_DIR \
-                --graphs_dir=$GRAPHS_DIR \
-                --random_seed=1234 \
-                --k_shot=$K_SHOT
-done
+# The tasks of each pair go to ${BASE_TASK_DIR}/${question}_${exemplar}.
+echo "Generating tasks $TASKS using question algorithms $QUESTION_ALGORITHM and exemplar algorithms $EXEMPLAR_ALGORITHM"
+python3 -m codegraph.cg_graph_task_generator_with_diff_exemplar \
+            --task=$TASKS \
+            --question_algorithm=$QUESTION_ALGORITHM \
+            --exemplar_algorithm=$EXEMPLAR_ALGORITHM \
+            --base_task_dir=$BASE_TASK_DIR \
+            --graphs_dir=$GRAPHS_DIR \
+            --random_seed=1234 \
+            --k_shot=$K_SHOT
@@ -17,7 +17,8 @@
 import random
 
 _RANDOM_SEED = 1234
-random.seed(_RANDOM_SEED)
+# Draws the random integer names without touching the global random state.
+_random = random.Random(_RANDOM_SEED)
 
 _INTEGER_NAMES = [
     "0",
@@ -178,7 +179,7 @@ def create_name_dict(name, nnodes = 20):
   elif name == "random_integer":
     names_list = []
     for _ in range(nnodes):
-      names_list.append(str(random.randint(0, 1000000)))
+      names_list.append(str(_random.randint(0, 1000000)))
   elif name == "popular":
     names_list = _POPULAR_NAMES
   elif name == "south_park":
@@ -18,25 +18,28 @@
 import sys
 import os
 import json
+import math
+import random
 import argparse
+import functools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from statistics import NormalDist
 from tqdm import tqdm
-from time import time
-
-import tensorflow as tf
-# Set TensorFlow to use CPU only
-tf.config.set_visible_devices([], 'GPU')
+from time import perf_counter, time
 
 # Determine the absolute path of the project root directory
 PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Print the project directory to debug
-print("PROJECT_DIR:", PROJECT_DIR)
 # Add the project root directory to sys.path
 if PROJECT_DIR not in sys.path:
     sys.path.append(PROJECT_DIR)
 
 
-from models.clients import Clients
+# TensorFlow and the API clients take seconds to import, so they are loaded
+# on first use (see `import_tensorflow` and the main block).
+import profiling
 from get_graphqa_answer import (
     extract_connected_nodes,
     extract_cot_num_response,
@@ -46,6 +49,10 @@ from get_graphqa_answer import (
     process_answer_to_correct_sequence,
 )
 
+# The compact encoders of codegraph/cg_graph_text_encoder.py; only the cg
+# exemplars carry the code parsing their edge lists.
+COMPACT_TEXT_ENCODERS = ['compact', 'adjacency_rows', 'run_length']
+
 
 def process_ground_truth_answer(answer, task_name):
     """Process the ground truth answer based on the task."""
@@ -59,29 +66,61 @@ def process_ground_truth_answer(answer, task_name):
     else:
         return answer
 
-def extract_model_answer(ans, args, question):
-    """Extract the model's answer based on the task and prompt method."""
+def extract_model_answer(ans, args, question, stats=None, graph=None):
+    """Extract the model's answer based on the task and prompt method.
+
+    If `stats` is given, the time spent executing generated code is added to it.
+    If `graph` is given, it is bound as 'nodes' and 'edges' in that code.
+    """
     if args.task_name in ['node_degree', 'edge_count', 'node_count']:
         if args.prompt_method == 'cot':
             return extract_cot_num_response(ans)
         elif args.prompt_method == 'cg':
-            return exec_py(ans)
+            return exec_py(ans, stats, graph)
         else:
             return extract_num_response(ans)
     elif args.task_name in ['cycle_check', 'edge_existence']:
         if args.prompt_method != 'cg':
             return extract_yes_no_response(ans)
         else:
-            return exec_py(ans)
+            return exec_py(ans, stats, graph)
     elif args.task_name == 'connected_nodes':
         if args.prompt_method != 'cg':
             return extract_connected_nodes(ans, args.text_enc, question)
         else:
-            return str(exec_py(ans))
+            return str(exec_py(ans, stats, graph))
     else:
         return ans
 
-def log_wrong_case(results, example_id, answer, gpt_answer, response):
+# What the extractors return when a response holds no usable answer: the
+# errors of exec_py and the extract_* functions, and code printing nothing.
+FAILED_ANSWERS = [-1, '-1', 'Code snippet not found.', None]
+
+def voting_answers(sample_answers):
+    """Return the sample answers that take part in the majority vote.
+
+    Failed extractions do not vote, unless every sample failed.
+    """
+    return [answer for answer in sample_answers if answer not in FAILED_ANSWERS] or sample_answers
+
+def vote_answers(answers, args, question, stats=None, graph=None):
+    """Extract the answers of all sampled completions and return the majority one.
+
+    The `cg` code blocks run concurrently; their wall time is stored as the
+    exec time in `stats`. Failed extractions are left out of the vote, and ties
+    go to the answer of the earliest sample.
+
+    Returns:
+        tuple: The majority answer and the list of per-sample answers.
+    """
+    exec_start = perf_counter()
+    with ThreadPoolExecutor(max_workers=len(answers)) as executor:
+        sample_answers = list(executor.map(lambda ans: extract_model_answer(ans, args, question, graph=graph), answers))
+    if stats is not None and args.prompt_method == 'cg':
+        stats['exec'] = perf_counter() - exec_start
+    return Counter(voting_answers(sample_answers)).most_common(1)[0][0], sample_answers
+
+def log_wrong_case(example_id, answer, gpt_answer, response):
     """Log wrong cases."""
     print({
         'ID': example_id,
@@ -89,46 +128,199 @@ def log_wrong_case(results, example_id, answer, gpt_answer, response):
         'gpt_ans': gpt_answer,
         'response': response
     })
-    results['wrong_cases'].append({
-        'ID': example_id,
-        'correct_ans': answer,
-        'gpt_ans': gpt_answer,
-        'response': response
-    })
+
+def get_save_path(args):
+    """Return the results directory for the given evaluation cell."""
+    suffix = '_fixed_result' if args.prefix_cache else '_result'
+    if args.pack > 1:
+        suffix = f'_pack{args.pack}{suffix}'
+    if args.samples > 1:
+        suffix = f'_sc{args.samples}{suffix}'
+    if args.bind_graph:
+        suffix = f'_bound{suffix}'
+    if args.stratified:
+        suffix = f'_strat{suffix}'
+    if args.profile or args.trace_memory:
+        # Profiled timings are inflated, so they never mix with real results.
+        suffix = f'_profile{suffix}'
+    if args.prompt_method == 'cg':
+        return os.path.join(args.results_dir, args.prompt_source, args.model_name, f"{args.prompt_method}_{args.k_shot}_shot{suffix}", args.graph_gen, args.task_name)
+    return os.path.join(args.results_dir, args.prompt_source, args.model_name, f"{args.prompt_method}{suffix}", args.graph_gen, args.task_name)
+
+def get_results_file(args):
+    """Return the JSON file holding the results summary of the evaluation cell."""
+    return os.path.join(get_save_path(args), f'{args.task_name}_{args.text_enc}.json')
 
 def save_results(results, args):
     """Save the results to a JSON file."""
-    if args.prompt_method == 'cg':
-        save_path = os.path.join(PROJECT_DIR, 'results', args.prompt_source, args.model_name, f"{args.prompt_method}_{args.k_shot}_shot_result", args.graph_gen, args.task_name)
-    else:
-        save_path = os.path.join(PROJECT_DIR, 'results', args.prompt_source, args.model_name, f"{args.prompt_method}_result", args.graph_gen, args.task_name)
-    os.makedirs(save_path, exist_ok=True)
-    file_name = f'{args.task_name}_{args.text_enc}.json'
-    with open(os.path.join(save_path, file_name), 'w') as f:
+    os.makedirs(get_save_path(args), exist_ok=True)
+    with open(get_results_file(args), 'w') as f:
         json.dump(results, f, indent=4)
 
-def evaluate(args):
-    """Read prompts from TFRecord files and evaluate the performance of the LLMs on the  GraphQA benchmark.
+def get_checkpoint_path(args):
+    """Return the append-only checkpoint file holding per-example outcomes."""
+    return os.path.join(get_save_path(args), f'{args.task_name}_{args.text_enc}.checkpoint.jsonl')
 
-    Args:
-        args (argparse.Namespace): Parsed command-line arguments containing settings for the evaluation, such as task name, graph type, prompt method, and model.
+def load_checkpoint(checkpoint_path):
+    """Load the per-example outcomes recorded by a previous run.
+
+    A partially written last line (e.g. from a killed process) is ignored, and
+    so are questions whose last query failed (rate limits, timeouts, failed
+    batch items), so that a resumed run asks them again.
+    """
+    records = {}
+    if not os.path.exists(checkpoint_path):
+        return records
+    with open(checkpoint_path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['ID']] = record
+    return {example_id: record for example_id, record in records.items() if not record.get('error')}
+
+def record_outcome(results, counters, record):
+    """Fold a single per-example outcome into the running results."""
+    counters['total_count'] += 1
+    counters['total_time'] += record['time']
+    counters['total_token'] += record['token']
+    counters['answered'][record['ID']] = record['correct']
+    if 'agreement' in record:
+        counters['total_agreement'] += record['agreement']
+        counters['sample_accuracy'] += record['sample_accuracy']
+    if record['correct']:
+        counters['correct_count'] += 1
+    else:
+        results['wrong_cases'].append({
+            'ID': record['ID'],
+            'correct_ans': record['correct_ans'],
+            'gpt_ans': record['gpt_ans'],
+            'response': record['response']
+        })
+
+STRATUM_NODE_WIDTH = 5
+DENSITY_LEVELS = ['sparse', 'medium', 'dense']
+
+def get_stratum(example):
+    """Return the (graph size, edge density) stratum of an example."""
+    nnodes = int(example['nnodes'])
+    nedges = int(example['nedges'])
+    pairs = nnodes * (nnodes - 1) / 2
+    density = nedges / pairs if pairs else 0.0
+    low = nnodes // STRATUM_NODE_WIDTH * STRATUM_NODE_WIDTH
+    level = DENSITY_LEVELS[min(int(density * len(DENSITY_LEVELS)), len(DENSITY_LEVELS) - 1)]
+    return f'nodes_{low}-{low + STRATUM_NODE_WIDTH - 1}_{level}'
+
+def stratified_sample(examples, size, seed):
+    """Draw `size` examples with proportional allocation over the strata.
+
+    Every stratum gets at least one question when `size` allows it; the rest is
+    split by largest remainder. No stratum gets more questions than it holds;
+    what a full stratum cannot take is split over the others the same way. The
+    sample keeps the file order.
 
     Returns:
-        dict: A summary of the evaluation results, including:
-            - 'Total Count': Total number of questions evaluated.
-            - 'Average time used': Average time taken to process each question.
-            - 'Average token used': Average number of tokens used by the model per question.
-            - 'Total time used': Total time taken for the evaluation.
-            - 'Accuracy rate': Accuracy of the model on the graph task.
+        tuple: The sampled examples and the number of examples per stratum in
+        the whole file.
     """
-    """Read prompts from TFRecord files and evaluate the performance of the LLMs on the benchmark."""
+    strata = {}
+    for index, example in enumerate(examples):
+        strata.setdefault(get_stratum(example), []).append(index)
+    populations = {stratum: len(indices) for stratum, indices in strata.items()}
+    size = min(size, len(examples))
+    allocation = {stratum: 0 for stratum in strata}
+    if size >= len(strata):
+        allocation = {stratum: 1 for stratum in strata}
+    remaining = size - sum(allocation.values())
+    while remaining > 0:
+        open_strata = [stratum for stratum in strata if allocation[stratum] < populations[stratum]]
+        open_population = sum(populations[stratum] for stratum in open_strata)
+        quotas = {stratum: remaining * populations[stratum] / open_population for stratum in open_strata}
+        for stratum, quota in quotas.items():
+            allocation[stratum] += min(int(quota), populations[stratum] - allocation[stratum])
+        by_remainder = sorted(open_strata, key=lambda stratum: quotas[stratum] - int(quotas[stratum]), reverse=True)
+        for stratum in by_remainder:
+            if sum(allocation.values()) == size:
+                break
+            if allocation[stratum] < populations[stratum]:
+                allocation[stratum] += 1
+        remaining = size - sum(allocation.values())
+    rng = random.Random(seed)
+    chosen = []
+    for stratum, indices in strata.items():
+        chosen += rng.sample(indices, allocation[stratum])
+    return [examples[index] for index in sorted(chosen)], populations
+
+def stratified_summary(examples, populations, answered):
+    """Per-stratum accuracy and the stratified accuracy estimate with its standard error."""
+    strata = {}
+    for example in examples:
+        if example['id'] in answered:
+            correct = strata.setdefault(get_stratum(example), [0, 0])
+            correct[0] += answered[example['id']]
+            correct[1] += 1
+    total = sum(populations.values())
+    accuracy, variance = 0.0, 0.0
+    per_stratum = {}
+    for stratum, (correct, count) in sorted(strata.items()):
+        population = populations[stratum]
+        weight = population / total
+        p = correct / count
+        accuracy += weight * p
+        # Finite population correction: a fully sampled stratum adds no variance.
+        if count > 1:
+            variance += weight ** 2 * p * (1 - p) / (count - 1) * (1 - count / population)
+        per_stratum[stratum] = {'population': population, 'answered': count, 'accuracy': p}
+    # Strata without answered questions are left out and the weights renormalized.
+    covered = sum(populations[stratum] for stratum in strata) / total if strata else 1.0
+    return {
+        'Stratified accuracy': accuracy / covered if strata else 0.0,
+        'Stratified standard error': math.sqrt(variance) / covered if strata else 0.0,
+        'Strata': per_stratum,
+    }
+
+def wilson_interval(correct, total, confidence=0.95):
+    """Return the Wilson score interval of the accuracy correct / total."""
+    if total == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf((1 + confidence) / 2)
+    p = correct / total
+    denominator = 1 + z * z / total
+    center = (p + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+def accuracy_settled(counters, args):
+    """Whether the accuracy interval of the cell is narrow enough to stop (--ci_width)."""
+    if args.ci_width is None or counters['total_count'] < args.min_questions:
+        return False
+    lower, upper = wilson_interval(counters['correct_count'], counters['total_count'], args.ci_confidence)
+    return upper - lower <= args.ci_width
+
+def get_dataset_path(args):
+    """Return the TFRecord file holding the prompts of the evaluation cell."""
     if args.prompt_method == 'cg':
     # For the CodeGraph method, we have a naming pattern that includes k_shot
-        dataset_file = f"{args.task_name}_cg_{args.k_shot}_shot_test.tfrecords"
+        fixed = '_fixed' if args.prefix_cache else ''
+        bound = '_bound' if args.bind_graph else ''
+        dataset_file = f"{args.task_name}_cg_{args.k_shot}_shot{fixed}{bound}_test.tfrecords"
     else:
     # For all other prompting methods (few_shot, zero_shot, cot), stick to the old pattern
         dataset_file = f"{args.task_name}_{args.prompt_method}_test.tfrecords"
-    dataset_path = os.path.join(PROJECT_DIR, args.prompt_source, 'tasks', args.graph_gen, dataset_file)
+    return os.path.join(PROJECT_DIR, args.prompt_source, 'tasks', args.graph_gen, dataset_file)
+
+@functools.lru_cache(maxsize=None)
+def import_tensorflow():
+    """Import TensorFlow, restricted to the CPU, on first use."""
+    import tensorflow as tf
+    tf.config.set_visible_devices([], 'GPU')
+    return tf
+
+def load_examples(args):
+    """Yield the decoded examples of the evaluation cell that use `args.text_enc`."""
+    tf = import_tensorflow()
+    dataset_path = get_dataset_path(args)
     print(f"Dataset path: {dataset_path}")
     raw_dataset = tf.data.TFRecordDataset(dataset_path)
     feature_description = {
@@ -139,14 +331,200 @@ def evaluate(args):
         'algorithm': tf.io.FixedLenFeature([], tf.string),
         'id': tf.io.FixedLenFeature([], tf.string),
         'text_encoding': tf.io.FixedLenFeature([], tf.string),
+        # Files written before the graph was stored have no 'graph' feature.
+        'graph': tf.io.FixedLenFeature([], tf.string, default_value=''),
     }
 
     def _parse_function(example_proto):
         """Parse a single TFRecord example."""
         return tf.io.parse_single_example(example_proto, feature_description)
 
-    parsed_dataset = raw_dataset.map(_parse_function)
+    parsed_examples = iter(raw_dataset.map(_parse_function))
+    while True:
+        with profiling.stage('dataset_loading'):
+            example = next(parsed_examples, None)
+            if example is not None:
+                example = {key: value.numpy().decode('utf-8') for key, value in example.items()}
+        if example is None:
+            return
+        if example['text_encoding'] != args.text_enc:
+            continue
+        yield example
+
+def evaluate_example(example, args, query_model, ready_time=None):
+    """Query the model on one example and score its answer.
 
+    Args:
+        example: the decoded example.
+        args: the parsed command-line arguments.
+        query_model: a callable answering an example with `(answer, token_count)`.
+            It receives a dict to fill with request telemetry.
+        ready_time: for answers that arrive before scoring (--batch), the
+            `perf_counter` time at which they arrived; the delay until this
+            example is scored is its queue wait. None for synchronous requests,
+            which do not queue.
+
+    Returns:
+        tuple: The per-example outcome, as written to the checkpoint file, and
+        the telemetry spans of the request.
+    """
+    start_time = time()
+    span_start = perf_counter()
+    spans = {
+        'queue_wait': span_start - ready_time if ready_time is not None else None,
+        'network': None,
+        'ttft': None,
+        'exec': 0.0,
+        'extraction': 0.0,
+        'prompt_tokens': None,
+        'completion_tokens': None,
+        'cached_tokens': None,
+        'truncated': False,
+    }
+    question = example['question']
+    graph = example['graph'] if args.bind_graph else None
+    answer = None
+    sample_answers = []
+    failed = False
+    try:
+        # Process the ground truth answer
+        answer_raw = example['answer']
+        try:
+            answer = int(answer_raw.rstrip('.'))  # Remove trailing period if present
+        except ValueError:
+            answer = answer_raw
+        answer = process_ground_truth_answer(answer, args.task_name)
+        # Send question to the model
+        with profiling.stage('api_wait'):
+            ans, token_count = query_model(example, spans)
+    except Exception as e:
+        # Log error and continue
+        ans, token_count = 'NA', 0
+        gpt_answer = str(e)
+        failed = True
+    else:
+        # Extract model's answer
+        extract_start = perf_counter()
+        with profiling.stage('extraction'):
+            if args.samples > 1:
+                gpt_answer, sample_answers = vote_answers(ans, args, question, spans, graph)
+            else:
+                gpt_answer = extract_model_answer(ans, args, question, spans, graph)
+        spans['extraction'] = perf_counter() - extract_start - spans['exec']
+    spans['total'] = perf_counter() - span_start
+    record = {
+        'ID': example['id'],
+        'correct': gpt_answer == answer,
+        'correct_ans': answer,
+        'gpt_ans': gpt_answer,
+        'response': ans,
+        'time': time() - start_time,
+        'token': token_count,
+    }
+    if failed:
+        # The question was not answered; --resume asks it again.
+        record['error'] = True
+    if args.samples > 1:
+        record['sample_answers'] = sample_answers
+        # Share of the voting samples agreeing with the majority, and of all samples that are correct.
+        voters = voting_answers(sample_answers)
+        record['agreement'] = voters.count(gpt_answer) / len(voters) if voters else 0.0
+        record['sample_accuracy'] = sample_answers.count(answer) / len(sample_answers) if sample_answers else 0.0
+    if not record['correct']:
+        log_wrong_case(example['id'], answer, gpt_answer, ans)
+    return record, spans
+
+def get_profile_path(args):
+    """Return the directory holding the stage profiles of the evaluation cell."""
+    return os.path.join(get_save_path(args), 'profile', f'{args.task_name}_{args.text_enc}')
+
+def get_telemetry_path(args):
+    """Return the JSONL file holding the per-request telemetry spans."""
+    return os.path.join(get_save_path(args), f'{args.task_name}_{args.text_enc}.telemetry.jsonl')
+
+def telemetry_record(args, record, spans):
+    """Combine the cell, the outcome and the spans of a request into one line."""
+    return {
+        'ID': record['ID'],
+        'model_name': args.model_name,
+        'prompt_source': args.prompt_source,
+        'prompt_method': args.prompt_method,
+        'k_shot': args.k_shot,
+        'prefix_cache': args.prefix_cache,
+        'pack': args.pack,
+        'samples': args.samples,
+        'bind_graph': args.bind_graph,
+        'graph_gen': args.graph_gen,
+        'task_name': args.task_name,
+        'text_enc': args.text_enc,
+        'correct': record['correct'],
+        **spans,
+    }
+
+def lookup_response(responses):
+    """Return a `query_model` answering from precomputed responses.
+
+    `responses` maps an example id to an `(answer, token_count, stats)` tuple
+    or to the exception raised while answering it.
+    """
+    def query_model(example, stats):
+        response = responses[example['id']]
+        if isinstance(response, Exception):
+            raise response
+        ans, token_count, response_stats = response
+        stats.update(response_stats)
+        return ans, token_count
+    return query_model
+
+def query_packed(examples):
+    """Answer several cg examples with one packed request.
+
+    The request cost (network time and tokens) is split evenly over the
+    examples so that per-question averages stay comparable to unpacked runs.
+    """
+    stats = {}
+    try:
+        answers, token_count = graph_gpt.data_input_packed([example['question'] for example in examples], stats)
+    except Exception as e:
+        return {example['id']: e for example in examples}
+    share = {key: value / len(examples) if key not in ['ttft', 'truncated'] else value
+             for key, value in stats.items() if value is not None}
+    return {example['id']: (answer, token_count / len(examples), share) for example, answer in zip(examples, answers)}
+
+def load_unpacked_accuracy(args):
+    """Return the accuracy of the unpacked run of the same cell, if it exists."""
+    unpacked_file = get_results_file(argparse.Namespace(**{**vars(args), 'pack': 1}))
+    if not os.path.exists(unpacked_file):
+        return None
+    with open(unpacked_file) as f:
+        return json.load(f)['summary']['Accuracy rate']
+
+def evaluate(args):
+    """Read prompts from TFRecord files and evaluate the performance of the LLMs on the  GraphQA benchmark.
+
+    Args:
+        args (argparse.Namespace): Parsed command-line arguments containing settings for the evaluation, such as task name, graph type, prompt method, and model.
+
+    Returns:
+        dict: A summary of the evaluation results, including:
+            - 'Total Count': Total number of questions evaluated.
+            - 'Average time used': Average time taken to process each question.
+            - 'Average token used': Average number of tokens used by the model per question.
+            - 'Total time used': Total time taken for the evaluation.
+            - 'Accuracy rate': Accuracy of the model on the graph task.
+            - 'Accuracy delta vs unpacked': For packed runs (--pack), the
+              accuracy change against the saved unpacked run of the cell.
+            - 'Average agreement' and 'Single-sample accuracy rate': For
+              self-consistency runs (--samples), the average share of samples
+              agreeing with the majority answer and the accuracy of one sample.
+            - 'Accuracy CI': The Wilson interval of the accuracy at --ci_confidence.
+            - 'Stratified accuracy', 'Stratified standard error' and 'Strata':
+              With --stratified, the population-weighted accuracy over the
+              (graph size, density) strata, its standard error and the
+              per-stratum accuracies.
+            - 'Stopping Point': With --ci_width, the number of questions after
+              which the interval was narrow enough, or None if it never was.
+    """
     results = {
         'summary': {
             'Total Count': 0,
@@ -161,64 +539,139 @@ def evaluate(args):
         'wrong_cases': [],
     } 
 
-    correct_count = 0
-    total_count = 0
-    total_time = 0.0
-    total_token = 0
-    total_examples = args.number_of_questions
-    for example in tqdm(parsed_dataset, total=total_examples):
-        start_time = time()
-        text_encoder = example['text_encoding'].numpy().decode('utf-8')
-        if text_encoder != args.text_enc:
+    counters = {
+        'correct_count': 0,
+        'total_count': 0,
+        'total_time': 0.0,
+        'total_token': 0,
+        'answered': {},
+        'total_agreement': 0.0,
+        'sample_accuracy': 0.0,
+    }
+    resumed_count = 0
+    # Outcomes are appended to the checkpoint as soon as they are known, so a
+    # killed run loses at most the in-flight question.
+    checkpoint = {}
+    checkpoint_file = None
+    telemetry_file = None
+    if not args.debug:
+        checkpoint_path = get_checkpoint_path(args)
+        os.makedirs(os.path.dirname(checkpoint_path), exist_ok=True)
+        if args.resume:
+            checkpoint = load_checkpoint(checkpoint_path)
+            print(f"Resuming from {checkpoint_path} with {len(checkpoint)} answered questions")
+        checkpoint_file = open(checkpoint_path, 'a' if args.resume else 'w')
+        telemetry_file = open(get_telemetry_path(args), 'a' if args.resume else 'w')
+
+    total_examples = min(10, args.number_of_questions) if args.debug else args.number_of_questions
+    if args.stratified:
+        examples, populations = stratified_sample(list(load_examples(args)), total_examples, args.sample_seed)
+        print(f"Stratified sample of {len(examples)} questions over {len(populations)} strata")
+    else:
+        examples = islice(load_examples(args), total_examples)
+    if args.batch:
+        # Submit every unanswered prompt of the cell as one batch job, then
+        # score the returned completions exactly like synchronous answers.
+        from models.batch import run_batch
+        examples = list(examples)
+        with profiling.stage('api_wait'):
+            query_model = lookup_response(run_batch(
+                graph_gpt,
+                {example['id']: example['question'] for example in examples if example['id'] not in checkpoint},
+                os.path.join(get_save_path(args), f'{args.task_name}_{args.text_enc}'),
+                poll_interval=args.batch_poll_interval,
+            ))
+        # The answers of the batch wait from its completion until scored.
+        ready_time = perf_counter()
+    else:
+        ready_time = None
+        query_model = lambda example, stats: graph_gpt.data_input(example['question'], stats)
+
+    def score(example, query_model, ready_time):
+        record, spans = evaluate_example(example, args, query_model, ready_time)
+        if args.pack > 1 and spans['network'] is not None:
+            # The packed request is sent before scoring; charge each question its share.
+            record['time'] += spans['network']
+            spans['total'] += spans['network']
+        if checkpoint_file is not None:
+            checkpoint_file.write(json.dumps(record) + '\n')
+            checkpoint_file.flush()
+            telemetry_file.write(json.dumps(telemetry_record(args, record, spans)) + '\n')
+            telemetry_file.flush()
+        record_outcome(results, counters, record)
+
+    def score_packed(pending):
+        with profiling.stage('api_wait'):
+            score_pending = lookup_response(query_packed(pending))
+        for example in pending:
+            score(example, score_pending, None)
+
+    pending = []
+    stopping_point = None
+    for example in tqdm(examples, total=total_examples):
+        if accuracy_settled(counters, args):
+            # Questions already gathered for a packed request are dropped unsent.
+            stopping_point = counters['total_count']
+            pending = []
+            break
+        if example['id'] in checkpoint:
+            record_outcome(results, counters, checkpoint[example['id']])
+            resumed_count += 1
             continue
-        question = example['question'].numpy().decode('utf-8')
-        try:
-            # Process the ground truth answer
-            answer_raw = example['answer'].numpy().decode('utf-8')
-            try:
-                answer = int(answer_raw.rstrip('.'))  # Remove trailing period if present
-            except ValueError:
-                answer = answer_raw
-            answer = process_ground_truth_answer(answer, args.task_name)
-            # Send question to the model
-            ans, token_count = graph_gpt.data_input(question)
-        except Exception as e:
-            # Log error and continue
-            example_id = example['id'].numpy().decode('utf-8')
-            log_wrong_case(results, example_id, answer, str(e), 'NA')
-            total_count += 1
-            total_time += time() - start_time
+        if args.pack > 1:
+            pending.append(example)
+            if len(pending) == args.pack:
+                score_packed(pending)
+                pending = []
             continue
-        total_token += token_count
-        # Extract model's answer
-        gpt_answer = extract_model_answer(ans, args, question)
-        # Compare answers
-        if gpt_answer == answer:
-            correct_count += 1
-        else:
-            example_id = example['id'].numpy().decode('utf-8')
-            log_wrong_case(results, example_id, answer, gpt_answer, ans)
-        total_count += 1
-        total_time += time() - start_time
-        if args.debug and total_count == 10:
-            break
-        if args.number_of_questions == total_count:
-            break
+        score(example, query_model, ready_time)
+    if pending:
+        score_packed(pending)
+    if checkpoint_file is not None:
+        checkpoint_file.close()
+        telemetry_file.close()
+    total_count = counters['total_count']
+    total_time = counters['total_time']
     # Update results summary
     results['summary']['Total Count'] = total_count
+    results['summary']['Resumed Count'] = resumed_count
     results['summary']['Average time used'] = total_time / total_count if total_count > 0 else 0
-    results['summary']['Average token used'] = total_token / total_count if total_count > 0 else 0
+    results['summary']['Average token used'] = counters['total_token'] / total_count if total_count > 0 else 0
     results['summary']['Total time used'] = total_time
-    results['summary']['Accuracy rate'] = correct_count / total_count if total_count > 0 else 0
+    results['summary']['Accuracy rate'] = counters['correct_count'] / total_count if total_count > 0 else 0
+    results['summary']['Accuracy CI'] = wilson_interval(counters['correct_count'], total_count, args.ci_confidence)
+    results['summary']['Stopping Point'] = stopping_point
+    if args.stratified:
+        results['summary'].update(stratified_summary(examples, populations, counters['answered']))
+    if args.samples > 1:
+        results['summary']['Samples'] = args.samples
+        results['summary']['Average agreement'] = counters['total_agreement'] / total_count if total_count > 0 else 0
+        results['summary']['Single-sample accuracy rate'] = counters['sample_accuracy'] / total_count if total_count > 0 else 0
+    if args.pack > 1:
+        unpacked_accuracy = load_unpacked_accuracy(args)
+        results['summary']['Pack Size'] = args.pack
+        results['summary']['Unpacked Accuracy rate'] = unpacked_accuracy
+        results['summary']['Accuracy delta vs unpacked'] = (
+            results['summary']['Accuracy rate'] - unpacked_accuracy if unpacked_accuracy is not None else None)
     # Save results
     if not args.debug:
         save_results(results, args)
     print(f'Total Count: {total_count}')
     print(f'Average time used: {results["summary"]["Average time used"]}')
     print(f'Average token used: {results["summary"]["Average token used"]}')
+    if args.stratified:
+        print(f'Stratified accuracy: {results["summary"]["Stratified accuracy"]} '
+              f'(standard error {results["summary"]["Stratified standard error"]})')
+    if stopping_point is not None:
+        print(f'Stopped early after {stopping_point} questions, accuracy CI: {results["summary"]["Accuracy CI"]}')
+    if args.samples > 1:
+        print(f'Average agreement: {results["summary"]["Average agreement"]}')
+    if args.pack > 1:
+        print(f'Accuracy delta vs unpacked: {results["summary"]["Accuracy delta vs unpacked"]}')
     return results['summary']['Accuracy rate']
 
 if __name__ == "__main__":
+    from models.clients import BACKENDS
     # Ensure the file path is correct
     parser = argparse.ArgumentParser()
     parser.add_argument('--prompt_source', type=str, default='codegraph', choices=['codegraph', 'graphqa'],
@@ -226,19 +679,65 @@ if __name__ == "__main__":
     parser.add_argument('--task_name', type=str, required=True,
                         choices=['edge_count', 'connected_nodes', 'cycle_check', 'node_count', 'node_degree', 'edge_existence'])
     parser.add_argument('--text_enc', type=str, required=True, choices=['adjacency', 'coauthorship', 'incident',
-                        'expert', 'friendship', 'social_network', 'politician', 'got', 'south_park'])
+                        'expert', 'friendship', 'social_network', 'politician', 'got', 'south_park']
+                        + COMPACT_TEXT_ENCODERS)
     parser.add_argument('--graph_gen', type=str, required=True,
                         choices=['er', 'ba', 'sbm', 'sfn', 'complete', 'star', 'path','path_er','sbm_er','sfn_er','star_er','ba_er','complete_er'])
     parser.add_argument('--debug', action='store_true', default=False, help='Enable debug mode')
     parser.add_argument('--prompt_method', type=str, choices=['few_shot', 'cot', 'zero_shot', 'cg'], required=True, help='Select the prompting method')
-    parser.add_argument('--model_name', type=str, default='GPT35', choices=['GPT35', 'Llama_3_70B', 'Mixtral_8x7B', 'Mixtral_8x22B'], help='Specify the model to use for querying')
+    parser.add_argument('--model_name', type=str, default='GPT35', choices=list(BACKENDS), help='Specify the model to use for querying')
     parser.add_argument('--number_of_questions', type=int, default=500, help='Number of questions to evaluate')
     parser.add_argument('--k_shot', type=int, default=1, help='Number of shots to use for the codegraph prompting (default: 1)')
+    parser.add_argument('--results_dir', type=str, default=os.path.join(PROJECT_DIR, 'results'), help='Directory the results, checkpoints and telemetry are written to')
+    parser.add_argument('--resume', action='store_true', default=False, help='Skip questions already answered in the checkpoint of a previous run')
+    parser.add_argument('--stream', action='store_true', default=False, help='Stream completions and close the stream as soon as the code block or \\boxed{} answer is complete')
+    parser.add_argument('--max_tokens', type=int, default=None, help='Override the per-(prompt_method, task) output cap of models/clients.py')
+    parser.add_argument('--prefix_cache', action='store_true', default=False, help='Lead every prompt with all static text and, for cg, use the fixed-exemplar prompts (--fixed_exemplars in the generator) so requests share a cacheable prefix')
+    parser.add_argument('--batch', action='store_true', default=False, help='Submit all prompts of the cell through the provider batch endpoint instead of one request per question')
+    parser.add_argument('--batch_poll_interval', type=float, default=30.0, help='Seconds between two status checks of a submitted batch job')
+    parser.add_argument('--pack', type=int, default=1, help='Number of cg questions packed behind one shared exemplar into a single request (default: 1, no packing)')
+    parser.add_argument('--samples', type=int, default=1, help='Number of completions requested per question in one call (n); the majority answer is scored (default: 1)')
+    parser.add_argument('--ci_width', type=float, default=None, help='Stop the cell early once the Wilson interval of the accuracy is at most this wide (default: run all questions)')
+    parser.add_argument('--ci_confidence', type=float, default=0.95, help='Confidence level of the accuracy interval (default: 0.95)')
+    parser.add_argument('--min_questions', type=int, default=30, help='Number of questions answered before --ci_width may stop the cell (default: 30)')
+    parser.add_argument('--bind_graph', action='store_true', default=False, help='For cg, use the prompts generated with --bind_graph and define the question graph as nodes/edges in the executed code, so the model only writes the algorithm')
+    parser.add_argument('--stratified', action='store_true', default=False, help='Evaluate a stratified sample of --number_of_questions questions over graph size and edge density instead of the first ones in the file')
+    parser.add_argument('--sample_seed', type=int, default=1234, help='Random seed of the stratified sample (default: 1234)')
+    parser.add_argument('--profile', action='store_true', default=False, help='Profile the stages of the run (dataset loading, API wait, execution, extraction) and write the profiles to results/.../profile/')
+    parser.add_argument('--trace_memory', action='store_true', default=False, help='Record the peak traced memory of every stage with its top allocation sites, written like --profile')
+    parser.add_argument('--profiler', type=str, default='cprofile', choices=profiling.PROFILERS, help='cprofile profiles each stage; pyinstrument samples the whole run (default: cprofile)')
     args = parser.parse_args()
+    if args.pack > 1 and (args.prompt_method != 'cg' or args.batch):
+        parser.error('--pack requires --prompt_method cg and cannot be combined with --batch')
+    if args.samples > 1 and (args.stream or args.pack > 1):
+        parser.error('--samples cannot be combined with --stream or --pack')
+    if args.bind_graph and args.prompt_method != 'cg':
+        parser.error('--bind_graph requires --prompt_method cg')
+    if args.text_enc in COMPACT_TEXT_ENCODERS and args.prompt_method != 'cg':
+        parser.error(f'--text_enc {args.text_enc} requires --prompt_method cg')
+    if args.batch and args.model_name == 'Mock':
+        parser.error('--batch is not supported by the in-process Mock backend; run models.mock_server and use --model_name Local')
+    if args.ci_width is not None and args.batch:
+        parser.error('--ci_width cannot be combined with --batch, which submits all questions up front')
+    from models.clients import Clients
+    print("PROJECT_DIR:", PROJECT_DIR)
     program_start_time = time()
+    if args.profile or args.trace_memory:
+        profiling.start(args.profile, args.trace_memory, args.profiler)
     graph_gpt = Clients(model_name=args.model_name)
     graph_gpt.prompt_selection(prompt_method=args.prompt_method)
     graph_gpt.task_selection(task=args.task_name, text_enc=args.text_enc)
+    graph_gpt.stream = args.stream
+    graph_gpt.prefix_cache_layout = args.prefix_cache
+    graph_gpt.samples = args.samples
+    if args.max_tokens is not None:
+        graph_gpt.max_token = args.max_tokens
+    if args.pack > 1 and args.pack * graph_gpt.max_token > graph_gpt.max_completion_tokens:
+        parser.error(f'--pack {args.pack} needs {args.pack * graph_gpt.max_token} output tokens, more than the '
+                     f'{graph_gpt.max_completion_tokens} of {args.model_name}; pack fewer questions or lower --max_tokens')
     acc_rate = evaluate(args)
+    profiler = profiling.stop()
+    if profiler is not None:
+        profiler.write(get_profile_path(args), vars(args))
     print(f'Time used: {time() - program_start_time}')
     print(f'Accuracy rate: {acc_rate}')
\ No newline at end of file
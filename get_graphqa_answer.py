@@ -15,12 +15,13 @@
 
 import sys
 import os
+import json
 import subprocess
+import time
 project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(project_dir)
 import re
-from graphqa import name_dictionaries
-from graphqa.graph_text_encoder import TEXT_ENCODER_DICT
+import profiling
 
 """Code to extract answers"""
 
@@ -34,19 +35,39 @@ def process_answer_to_correct_sequence(answer):
         return answer
 
 
-def exec_py(code:str):
+def bind_graph_code(graph_json):
+    """Return the code defining 'nodes' and 'edges' from a stored example graph."""
+    graph = json.loads(graph_json)
+    nodes = graph['nodes']
+    edges = [tuple(edge) for edge in graph['edges']]
+    return f"nodes = {nodes!r}\nedges = {edges!r}\n"
+
+def exec_py(code:str, stats=None, graph=None):
+    """Run the code block of a response and return its 'ans'.
+
+    If `graph` (the JSON graph stored with an example) is given, 'nodes' and
+    'edges' are defined before the code runs.
+    """
     try:
         # Using a regular expression to flexibly match the start and end delimiters
         pattern = r'(?i)#\s*CODE\s+START\n(.*?)#\s*CODE\s+END'
         match = re.search(pattern, code, re.DOTALL)
         if match:
             new_code = match.group(1).strip() + "\nprint(ans)"
+            if graph:
+                new_code = bind_graph_code(graph) + new_code
             #import pdb; pdb.set_trace()
         else:
             return "Code snippet not found."
 
         # Execute the extracted code
-        result = subprocess.run(['python', '-c', new_code], capture_output=True, text=True, check=True)
+        start_time = time.perf_counter()
+        try:
+            with profiling.stage('execution'):
+                result = subprocess.run(['python', '-c', new_code], capture_output=True, text=True, check=True)
+        finally:
+            if stats is not None:
+                stats['exec'] = stats.get('exec', 0.0) + time.perf_counter() - start_time
         resp = result.stdout.strip()
 
         ans_list = [line.strip() for line in resp.split('\n') if line.strip()]
@@ -154,6 +175,8 @@ def extract_connected_nodes(response, encoding_method,question):
     Returns:
     str: A string representation of the nodes extracted from the response, formatted as the ground truth.
     """
+    # Loaded here, as the graphqa encoders build all name tables on import.
+    from graphqa.graph_text_encoder import TEXT_ENCODER_DICT
     # Normalize the ground truth string by removing any trailing period and spaces
     node_name_dict = TEXT_ENCODER_DICT[encoding_method]
     is_numeric = all(item.isdigit() for item in node_name_dict.values())
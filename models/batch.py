@@ -0,0 +1,144 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Submit the prompts of an evaluation cell through the provider batch API."""
+
+import json
+import os
+import time
+
+from openai import AzureOpenAI
+from openai.types.chat import ChatCompletion
+
+BATCH_FINAL_STATUSES = ['completed', 'failed', 'expired', 'cancelled']
+BATCH_COMPLETION_WINDOW = '24h'
+
+
+def get_batch_endpoint(clients):
+    """Return the chat completion endpoint expected in the batch input file."""
+    if isinstance(clients.client, AzureOpenAI):
+        return '/chat/completions'
+    return '/v1/chat/completions'
+
+
+def write_batch_file(clients, questions, path):
+    """Write one chat completion request per question as a JSONL batch input.
+
+    Args:
+        clients: the `Clients` instance whose prompt and sampling settings are used.
+        questions: a dict from example id to question text.
+        path: the output JSONL file.
+    """
+    endpoint = get_batch_endpoint(clients)
+    with open(path, 'w') as f:
+        for example_id, question in questions.items():
+            f.write(json.dumps({
+                'custom_id': example_id,
+                'method': 'POST',
+                'url': endpoint,
+                'body': clients.build_request(question),
+            }) + '\n')
+
+
+def submit_batch(clients, path):
+    """Upload a batch input file and create the batch job."""
+    with open(path, 'rb') as f:
+        input_file = clients.client.files.create(file=f, purpose='batch')
+    return clients.client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=get_batch_endpoint(clients),
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+
+
+def wait_for_batch(clients, batch_id, poll_interval=30.0):
+    """Poll a batch job until it reaches a final status."""
+    while True:
+        batch = clients.client.batches.retrieve(batch_id)
+        print(f"Batch {batch_id}: {batch.status} {batch.request_counts}")
+        if batch.status in BATCH_FINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def read_batch_results(clients, batch):
+    """Parse the output and error files of a finished batch job.
+
+    Returns:
+        dict: From example id to either an `(answer, token_count, stats)` tuple,
+        where the first two items are what `Clients.data_input` would have
+        returned and `stats` holds the token split, or the exception
+        describing why that request failed.
+    """
+    responses = {}
+    for file_id in [batch.output_file_id, batch.error_file_id]:
+        if not file_id:
+            continue
+        content = clients.client.files.content(file_id).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get('response') or {}
+            if item.get('error') or response.get('status_code') != 200:
+                responses[item['custom_id']] = RuntimeError(
+                    f"Batch request failed: {item.get('error') or response.get('body')}")
+                continue
+            completion = ChatCompletion.model_validate(response['body'])
+            stats = {}
+            answer, token_count = clients.parse_response(completion, stats)
+            responses[item['custom_id']] = (answer, token_count, stats)
+    return responses
+
+
+def run_batch(clients, questions, path_prefix, poll_interval=30.0):
+    """Answer all questions through one batch job.
+
+    The batch id is stored in `{path_prefix}.batch.json` so that a resumed run
+    waits for the job it already paid for instead of submitting a new one.
+    A stored job that failed, expired or was cancelled is submitted again.
+
+    Returns:
+        dict: From example id to the `(answer, token_count, stats)` tuple or exception.
+        Questions missing from the batch output map to a `RuntimeError`.
+    """
+    if not questions:
+        return {}
+    os.makedirs(os.path.dirname(path_prefix), exist_ok=True)
+    input_path = f'{path_prefix}.batch_input.jsonl'
+    state_path = f'{path_prefix}.batch.json'
+    batch_id = None
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+        if sorted(state['custom_ids']) == sorted(questions):
+            status = clients.client.batches.retrieve(state['batch_id']).status
+            if status in BATCH_FINAL_STATUSES and status != 'completed':
+                print(f"Stored batch {state['batch_id']} ended as '{status}', resubmitting")
+            else:
+                batch_id = state['batch_id']
+                print(f"Reusing submitted batch {batch_id} ({status})")
+    if batch_id is None:
+        write_batch_file(clients, questions, input_path)
+        batch_id = submit_batch(clients, input_path).id
+        with open(state_path, 'w') as f:
+            json.dump({'batch_id': batch_id, 'custom_ids': list(questions)}, f)
+        print(f"Submitted batch {batch_id} with {len(questions)} requests")
+    batch = wait_for_batch(clients, batch_id, poll_interval)
+    responses = read_batch_results(clients, batch)
+    for example_id in questions:
+        if example_id not in responses:
+            responses[example_id] = RuntimeError(f"Batch {batch_id} ended as '{batch.status}' without a response")
+    return responses
@@ -14,8 +14,12 @@
 # limitations under the License.
 
 import os
-from openai import AzureOpenAI
-from openai import OpenAI
+import re
+import threading
+import time
+
+# httpx and openai take most of a second to import, so they are imported by
+# the functions that use them; `BACKENDS` can be read without them.
 
 TEMPERATURE_GPT = 0.7
 TEMPERATURE_LLAMA3 = 0.7
@@ -25,58 +29,248 @@ FREQUENCY_PENALTY = 0
 PRESENCE_PENALTY = 0 
 MAX_TOKEN = 8000
 
-class Clients():
-    def __init__(self, endpoint=None, api_key=None, api_version="2024-02-01", model_name='GPT35'):
-        # Load API credentials from environment variables if not provided
-        self.endpoint = endpoint or os.environ.get('AZURE_ENDPOINT')
-        self.api_key = api_key or os.environ.get('AZURE_API_KEY')
-        self.api_version = api_version
-        
-        if model_name == 'GPT35':
-            if not self.endpoint or not self.api_key:
-                raise ValueError("Azure endpoint and API key must be provided for GPT35 model.")
-
-            self.client = AzureOpenAI(
-                azure_endpoint=self.endpoint,
-                api_key=self.api_key,
-                api_version=self.api_version
-            )
-            self.model = "GPT35"
-            self.temperature = TEMPERATURE_GPT
+# Output caps per (prompt_method, task). Under `cg` the answer is a code block
+# that repeats the graph: up to 190 edges of a 19-node graph, which takes about
+# 3.5k tokens with the long node names of the got and politician encoders, so
+# the tasks that list the edges get 4096 tokens and node_count, which lists the
+# nodes only, 512. The other methods answer in prose ending with \boxed{}.
+# Requests never ask for more than the completion limit of their backend.
+GENERATION_LIMITS = {
+    'cg': {
+        'node_count': 512,
+        'edge_count': 4096,
+        'node_degree': 4096,
+        'edge_existence': 4096,
+        'connected_nodes': 4096,
+        'cycle_check': 4096,
+    },
+    'zero_shot': {task: 1024 for task in ['node_count', 'edge_count', 'node_degree', 'edge_existence', 'connected_nodes', 'cycle_check']},
+    'few_shot': {task: 1024 for task in ['node_count', 'edge_count', 'node_degree', 'edge_existence', 'connected_nodes', 'cycle_check']},
+    'cot': {task: 2048 for task in ['node_count', 'edge_count', 'node_degree', 'edge_existence', 'connected_nodes', 'cycle_check']},
+}
+# Everything after `# CODE END` is discarded by `exec_py`, so generation can
+# stop there. The stop sequence itself is not returned and is restored by
+# `complete_code_block` when the completion finished on it.
+STOP_SEQUENCES = {
+    'cg': ['# CODE END', '#CODE END'],
+}
+_CODE_START_PATTERN = re.compile(r'#\s*CODE\s+START', re.IGNORECASE)
+_CODE_END_PATTERN = re.compile(r'#\s*CODE\s+END', re.IGNORECASE)
+_CODE_BLOCK_PATTERN = re.compile(r'#\s*CODE\s+START\n.*?#\s*CODE\s+END', re.IGNORECASE | re.DOTALL)
+_BOXED_PATTERN = re.compile(r'\\boxed\{[^}]*\}')
 
-        elif model_name == 'Llama_3_70B':
-            self.api_key = api_key or os.environ.get('DEEPINFRA_API_KEY')
-            self.base_url = os.environ.get('DEEPINFRA_BASE_URL', "https://api.deepinfra.com/v1/openai")
 
-            if not self.api_key:
-                raise ValueError("API key must be provided for Llama models.")
+_EXEMPLAR_END_PATTERN = re.compile(r'^[ \t]*#\s*CODE\s+END[^\n]*\n', re.IGNORECASE | re.MULTILINE)
+_QUESTION_LABEL_PATTERN = re.compile(r'^[ \t]*#\s*QUESTION\s+(\d+)[^\n]*$', re.IGNORECASE | re.MULTILINE)
+PACK_INSTRUCTION = (
+    "Now answer the following {count} questions. Write one code block per question, in order, "
+    "and put a line '# QUESTION <number>' right before the '# CODE START' of each block.\n"
+)
 
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
-            )
-            self.model = "meta-llama/Meta-Llama-3-70B-Instruct"
-            self.temperature = TEMPERATURE_LLAMA3
 
-        elif model_name.startswith('Mistral_8x'):
-            self.api_key = api_key or os.environ.get('DEEPINFRA_API_KEY')
-            self.base_url = os.environ.get('DEEPINFRA_BASE_URL', "https://api.deepinfra.com/v1/openai")
+def answer_complete(text, prompt_method, expected_answers=1):
+    """Whether a partial response already holds everything the scorer reads."""
+    if prompt_method == 'cg':
+        return len(_CODE_BLOCK_PATTERN.findall(text)) >= expected_answers
+    return len(_BOXED_PATTERN.findall(text)) >= expected_answers
+
+
+def split_cg_question(question):
+    """Split a cg question into its instruction, its exemplars and the question itself."""
+    instruction = question.split('\n', 1)[0]
+    ends = list(_EXEMPLAR_END_PATTERN.finditer(question))
+    exemplars = question[:ends[-1].end()] if ends else ''
+    body = question[len(exemplars):].lstrip('\n')
+    if body.startswith(instruction):
+        body = body[len(instruction):].lstrip('\n')
+    return instruction, exemplars, body
+
+
+def pack_questions(questions):
+    """Put several cg questions behind the instruction and exemplars of the first one."""
+    instruction, exemplars, _ = split_cg_question(questions[0])
+    packed = f"{exemplars}\n{instruction}\n" if exemplars else f"{instruction}\n"
+    packed += PACK_INSTRUCTION.format(count=len(questions))
+    for index, question in enumerate(questions, start=1):
+        packed += f'# QUESTION {index}\n{split_cg_question(question)[2].rstrip()}\n'
+    return packed
+
+
+def split_packed_response(response, count):
+    """Cut a packed response into `count` answers at its '# QUESTION <n>' labels.
+
+    Questions the model skipped get an empty answer, which scores as wrong.
+    """
+    parts = _QUESTION_LABEL_PATTERN.split(response)
+    answers = {}
+    for number, segment in zip(parts[1::2], parts[2::2]):
+        answers.setdefault(int(number), segment.strip())
+    return [answers.get(index, '') for index in range(1, count + 1)]
+
+
+def complete_code_block(text, finish_reason='stop'):
+    """Re-append the `# CODE END` marker removed by the stop sequence.
+
+    A completion cut off by the output cap (finish reason 'length') is left
+    without the marker, so its partial code is not executed.
+    """
+    if finish_reason != 'stop':
+        return text
+    code_start = _CODE_START_PATTERN.search(text)
+    if code_start and not _CODE_END_PATTERN.search(text, code_start.end()):
+        text = text.rstrip() + '\n# CODE END'
+    return text
 
-            if not self.api_key:
-                raise ValueError("API key must be provided for Mistral models.")
+# Connection pool shared by every Clients instance in the process. The values
+# can be overridden through the environment so that the evaluation scripts can
+# tune them without code changes.
+HTTP_MAX_CONNECTIONS = int(os.environ.get('CODEGRAPH_HTTP_MAX_CONNECTIONS', 32))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('CODEGRAPH_HTTP_MAX_KEEPALIVE', 16))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('CODEGRAPH_HTTP_KEEPALIVE_EXPIRY', 120))
+HTTP_TIMEOUT = float(os.environ.get('CODEGRAPH_HTTP_TIMEOUT', 600))
+HTTP2 = os.environ.get('CODEGRAPH_HTTP2', '0') == '1'
 
-            self.client = OpenAI(
-                api_key=self.api_key,
-                base_url=self.base_url
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+
+def get_shared_http_client(
+    max_connections=None,
+    max_keepalive_connections=None,
+    keepalive_expiry=None,
+    http2=None,
+):
+    """Return the process-wide httpx client used by all Clients instances.
+
+    The first call creates the client; later calls return the same instance so
+    that all model calls reuse a small set of persistent (optionally HTTP/2)
+    connections. HTTP/2 requires the `h2` package (`pip install httpx[http2]`).
+    """
+    import httpx
+
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is None:
+            limits = httpx.Limits(
+                max_connections=max_connections or HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=max_keepalive_connections or HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=keepalive_expiry or HTTP_KEEPALIVE_EXPIRY,
+            )
+            _shared_http_client = httpx.Client(
+                limits=limits,
+                timeout=HTTP_TIMEOUT,
+                http2=HTTP2 if http2 is None else http2,
             )
-            if model_name == 'Mistral_8x7B':
-                self.model = "mistralai/Mistral-8x7B-Instruct-v0.1"
-            elif model_name == 'Mistral_8x22B':
-                self.model = "mistralai/Mistral-8x22B-Instruct-v0.1"
-            self.temperature = TEMPERATURE_MISTRAL
+        return _shared_http_client
 
-        else:
+
+def close_shared_http_client():
+    """Close the shared httpx client and drop its pooled connections."""
+    global _shared_http_client
+    with _shared_http_client_lock:
+        if _shared_http_client is not None:
+            _shared_http_client.close()
+            _shared_http_client = None
+
+# Maps each `--model_name` to a function that sets up `client`, `model` and
+# `temperature` on a Clients instance. New backends register themselves with
+# `register_backend`.
+BACKENDS = {}
+
+
+def register_backend(*model_names):
+    """Register a backend setup function under one or more model names."""
+    def decorator(setup_fn):
+        for model_name in model_names:
+            BACKENDS[model_name] = setup_fn
+        return setup_fn
+    return decorator
+
+
+@register_backend('GPT35')
+def _setup_azure(clients, model_name, api_key):
+    from openai import AzureOpenAI
+
+    if not clients.endpoint or not clients.api_key:
+        raise ValueError("Azure endpoint and API key must be provided for GPT35 model.")
+
+    clients.client = AzureOpenAI(
+        azure_endpoint=clients.endpoint,
+        api_key=clients.api_key,
+        api_version=clients.api_version,
+        http_client=clients.http_client
+    )
+    clients.model = "GPT35"
+    clients.temperature = TEMPERATURE_GPT
+    # gpt-35-turbo rejects requests for more completion tokens than this.
+    clients.max_completion_tokens = 4096
+
+
+@register_backend('Llama_3_70B', 'Mistral_8x7B', 'Mistral_8x22B')
+def _setup_deepinfra(clients, model_name, api_key):
+    from openai import OpenAI
+
+    clients.api_key = api_key or os.environ.get('DEEPINFRA_API_KEY')
+    clients.base_url = os.environ.get('DEEPINFRA_BASE_URL', "https://api.deepinfra.com/v1/openai")
+
+    if not clients.api_key:
+        raise ValueError(f"API key must be provided for {model_name.split('_')[0]} models.")
+
+    clients.client = OpenAI(
+        api_key=clients.api_key,
+        base_url=clients.base_url,
+        http_client=clients.http_client
+    )
+    if model_name == 'Llama_3_70B':
+        clients.model = "meta-llama/Meta-Llama-3-70B-Instruct"
+        clients.temperature = TEMPERATURE_LLAMA3
+        # Half of the 8k context window, leaving the other half to the prompt.
+        clients.max_completion_tokens = 4096
+    else:
+        clients.model = f"mistralai/{model_name.replace('_', '-')}-Instruct-v0.1"
+        clients.temperature = TEMPERATURE_MISTRAL
+        clients.max_completion_tokens = MAX_TOKEN
+
+
+@register_backend('Local')
+def _setup_local(clients, model_name, api_key):
+    """An OpenAI-compatible server on this machine, e.g. vLLM or llama.cpp."""
+    from openai import OpenAI
+
+    clients.api_key = api_key or os.environ.get('LOCAL_API_KEY', 'EMPTY')
+    clients.base_url = os.environ.get('LOCAL_BASE_URL', "http://127.0.0.1:8000/v1")
+    clients.client = OpenAI(
+        api_key=clients.api_key,
+        base_url=clients.base_url,
+        http_client=clients.http_client
+    )
+    clients.model = os.environ.get('LOCAL_MODEL', "local")
+    clients.temperature = float(os.environ.get('LOCAL_TEMPERATURE', TEMPERATURE_LLAMA3))
+    clients.max_completion_tokens = int(os.environ.get('LOCAL_MAX_TOKENS', MAX_TOKEN))
+
+
+@register_backend('Mock')
+def _setup_mock(clients, model_name, api_key):
+    """A deterministic in-process backend that never touches the network."""
+    from models.mock_client import MockOpenAI
+    clients.client = MockOpenAI.from_env()
+    clients.model = "mock"
+    clients.temperature = 0
+    clients.max_completion_tokens = MAX_TOKEN
+
+
+class Clients():
+    def __init__(self, endpoint=None, api_key=None, api_version="2024-02-01", model_name='GPT35', http_client=None):
+        # Load API credentials from environment variables if not provided
+        self.endpoint = endpoint or os.environ.get('AZURE_ENDPOINT')
+        self.api_key = api_key or os.environ.get('AZURE_API_KEY')
+        self.api_version = api_version
+        # Reuse the pooled connections unless the caller injects its own client
+        self.http_client = http_client or get_shared_http_client()
+
+        if model_name not in BACKENDS:
             raise ValueError(f"Model {model_name} not recognized.")
+        BACKENDS[model_name](self, model_name, api_key)
 
         self.frequency_penalty = FREQUENCY_PENALTY
         self.presence_penalty = PRESENCE_PENALTY
@@ -86,6 +280,10 @@ class Clients():
         self.formatted_constrain_text = ""
         self.message_text = []
         self.max_token = MAX_TOKEN 
+        self.stop = None
+        self.stream = False
+        self.prefix_cache_layout = False
+        self.samples = 1
 
     def prompt_selection(self, prompt_method: str) -> None:
         assert prompt_method in ['few_shot', 'cot', 'zero_shot', 'cg'], NotImplementedError('The given prompt method hasn\'t implemented. Please double check')
@@ -137,7 +335,10 @@ class Clients():
                 'expert': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
                 'friendship': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
                 'social_network': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
-                'got': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G."
+                'got': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
+                'compact': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
+                'adjacency_rows': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G.",
+                'run_length': "For this task, please determine whether there is an edge between node i and node j in the undirected graph G."
             },
             'node_degree': {
                 'adjacency': "For this task, please count the degree of a node in the undirected graph G.",
@@ -146,7 +347,10 @@ class Clients():
                 'expert': "For this task, please count the degree of a node in the undirected graph G.",
                 'friendship': "For this task, please count the degree of a node in the undirected graph G.",
                 'social_network': "For this task, please count the degree of a node in the undirected graph G.",
-                'got': "For this task, please count the degree of a node in the undirected graph G."
+                'got': "For this task, please count the degree of a node in the undirected graph G.",
+                'compact': "For this task, please count the degree of a node in the undirected graph G.",
+                'adjacency_rows': "For this task, please count the degree of a node in the undirected graph G.",
+                'run_length': "For this task, please count the degree of a node in the undirected graph G."
             },
             'node_count': {
                 'adjacency': "For this task, please count the number of nodes in the undirected graph G.",
@@ -155,7 +359,10 @@ class Clients():
                 'expert': "For this task, please count the number of nodes in the undirected graph G.",
                 'friendship': "For this task, please count the number of nodes in the undirected graph G.",
                 'social_network': "For this task, please count the number of nodes in the undirected graph G.",
-                'got': "For this task, please count the number of nodes in the undirected graph G."
+                'got': "For this task, please count the number of nodes in the undirected graph G.",
+                'compact': "For this task, please count the number of nodes in the undirected graph G.",
+                'adjacency_rows': "For this task, please count the number of nodes in the undirected graph G.",
+                'run_length': "For this task, please count the number of nodes in the undirected graph G."
             },
             'edge_count': {
                 'adjacency': "For this task, you will count the number of edges in the undirected graph G.",
@@ -164,7 +371,10 @@ class Clients():
                 'expert': "For this task, you will count the number of edges in the undirected graph G.",
                 'friendship': "For this task, you will count the number of edges in the undirected graph G.",
                 'social_network': "For this task, you will count the number of edges in the undirected graph G.",
-                'got': "For this task, you will count the number of edges in the undirected graph G."
+                'got': "For this task, you will count the number of edges in the undirected graph G.",
+                'compact': "For this task, you will count the number of edges in the undirected graph G.",
+                'adjacency_rows': "For this task, you will count the number of edges in the undirected graph G.",
+                'run_length': "For this task, you will count the number of edges in the undirected graph G."
             },
             'cycle_check': {
                 'adjacency': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, (i,j) means that node i and node j are connected with an undirected edge.",
@@ -175,7 +385,10 @@ class Clients():
                 'social_network': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i and j are connected means that i and j are connected with an undirected edge.",
                 'politician': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i and j are connected means that i and j are connected with an undirected edge.",
                 'got': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i and j are friends means that i and j are connected with an undirected edge.",
-                'south_park': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i and j are friends means that i and j are connected with an undirected edge."
+                'south_park': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i and j are friends means that i and j are connected with an undirected edge.",
+                'compact': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, i-j means that node i and node j are connected with an undirected edge.",
+                'adjacency_rows': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, a row i: j k means that node i is connected to node j and to node k with undirected edges.",
+                'run_length': "For this task, please determine if the given undirected graph G contains any cycles. In the undirected graph, a row i: j k means that node i is connected to node j and to node k with undirected edges, and a-b stands for all nodes from a to b."
             },
 
             'connected_nodes': {
@@ -185,7 +398,10 @@ class Clients():
                 'expert': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
                 'friendship': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
                 'social_network': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
-                'south_park': "For this task, please list all nodes that are connected to the specified node in the undirected graph G."
+                'south_park': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
+                'compact': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
+                'adjacency_rows': "For this task, please list all nodes that are connected to the specified node in the undirected graph G.",
+                'run_length': "For this task, please list all nodes that are connected to the specified node in the undirected graph G."
             }
         }
 
@@ -193,49 +409,170 @@ class Clients():
         if not self.prompt_method == 'cg':
             self.formatted_constrain_text = formatted_constrain_texts[self.prompt_method][task].strip()
         self.task_specific_message_text = task_texts[task][text_enc].strip()
+        self.max_token = GENERATION_LIMITS.get(self.prompt_method, {}).get(task, MAX_TOKEN)
+        self.stop = STOP_SEQUENCES.get(self.prompt_method)
 
 
-    def get_token_usage(self,response):
+    def get_token_usage(self,response=None, usage=None):
+        usage = usage or response.usage
         if self.model == 'GPT35':
-            return response.usage.total_tokens
+            return usage.total_tokens
+        else:
+            return usage.completion_tokens
+
+    def build_messages(self, question: str):
+        if self.prefix_cache_layout:
+            # All static text leads so that prompts share a cacheable prefix.
+            prompt = (
+            f"{self.basic_text}\n"
+            f"{self.task_specific_message_text}\n"
+            f"{self.formatted_constrain_text}\n\n"
+            f"{question}"
+            ).strip()
         else:
-            return response.usage.completion_tokens
-        
-   
-    def data_input(self, question: str):
-        prompt = (
-        f"{self.basic_text}\n"
-        f"{self.task_specific_message_text}\n"
-        f"{question}\n\n"
-        f"{self.formatted_constrain_text}"
-        ).strip()
+            prompt = (
+            f"{self.basic_text}\n"
+            f"{self.task_specific_message_text}\n"
+            f"{question}\n\n"
+            f"{self.formatted_constrain_text}"
+            ).strip()
         assert type(prompt) is str, "prompt must be a string"
-        self.message_text.append(
+        return self.message_text + [
             {'role': 'user',
              'content': prompt}
-        )
-        if self.model == 'GPT35':
-            response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.message_text,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            frequency_penalty=self.frequency_penalty,
-            presence_penalty=self.presence_penalty
-            )
-        else:
-            response = self.client.chat.completions.create(
-            model=self.model,
-            messages=self.message_text,
-            temperature=self.temperature,
-            top_p=self.top_p,
-            frequency_penalty=self.frequency_penalty,
-            presence_penalty=self.presence_penalty,
-            max_tokens= self.max_token
-            )
+        ]
+
+    def build_request(self, question: str, expected_answers=1):
+        """Return the chat completion request body for a question.
+
+        A request expecting several answers (packed questions) gets a
+        proportionally larger output cap and no stop sequences. The cap never
+        exceeds the completion limit of the backend.
+        """
+        request = {
+            'model': self.model,
+            'messages': self.build_messages(question),
+            'temperature': self.temperature,
+            'top_p': self.top_p,
+            'frequency_penalty': self.frequency_penalty,
+            'presence_penalty': self.presence_penalty,
+            'max_tokens': min(self.max_token * expected_answers, self.max_completion_tokens),
+        }
+        if self.stop and expected_answers == 1:
+            request['stop'] = self.stop
+        if self.samples > 1:
+            request['n'] = self.samples
+        return request
+
+    @staticmethod
+    def record_usage(usage, stats):
+        """Store the prompt/completion/cached token split of a usage object."""
+        stats['prompt_tokens'] = usage.prompt_tokens
+        stats['completion_tokens'] = usage.completion_tokens
+        details = getattr(usage, 'prompt_tokens_details', None)
+        stats['cached_tokens'] = getattr(details, 'cached_tokens', None) if details is not None else None
+
+    def parse_response(self, response, stats=None):
+        """Return the answer text and the token usage of a chat completion.
+
+        If `stats` is given, the prompt/completion/cached token split is stored in it,
+        and whether a completion was cut off by the output cap.
+        With `samples` > 1 the answer is the list of all sampled completions.
+        """
+        if stats is not None and response.usage is not None:
+            self.record_usage(response.usage, stats)
+        contents = []
+        choices = sorted(response.choices, key=lambda choice: choice.index)
+        for choice in choices:
+            content = choice.message.content
+            if self.stop and content:
+                content = complete_code_block(content, choice.finish_reason)
+            contents.append(content)
+        if stats is not None:
+            stats['truncated'] = any(choice.finish_reason == 'length' for choice in choices)
+        if self.samples > 1:
+            return contents, self.get_token_usage(response)
+        return contents[0], self.get_token_usage(response)
+
+    def stream_response(self, request, stats=None, expected_answers=1):
+        """Stream a chat completion and close it once the answer is complete.
+
+        Returns the same `(answer, token_count)` pair as `parse_response`. If
+        the stream is closed before the provider reports usage, the number of
+        received content chunks stands in for the completion tokens.
+        """
+        request = dict(request, stream=True)
+        if self.model != 'GPT35':
+            request['stream_options'] = {'include_usage': True}
+        start_time = time.perf_counter()
+        stream = self.client.chat.completions.create(**request)
+        content = ''
+        chunks = 0
+        usage = None
+        finish_reason = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].finish_reason:
+                    finish_reason = chunk.choices[0].finish_reason
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if chunks == 0 and stats is not None:
+                    stats['ttft'] = time.perf_counter() - start_time
+                content += chunk.choices[0].delta.content
+                chunks += 1
+                if answer_complete(content, self.prompt_method, expected_answers):
+                    break
+        finally:
+            stream.close()
+        if stats is not None:
+            stats['network'] = time.perf_counter() - start_time
+            stats['truncated'] = finish_reason == 'length'
+        if self.stop:
+            # A stream closed early holds a complete block and needs no marker.
+            content = complete_code_block(content, finish_reason)
+        if usage is not None:
+            if stats is not None:
+                self.record_usage(usage, stats)
+            return content, self.get_token_usage(usage=usage)
+        if stats is not None:
+            stats['completion_tokens'] = chunks
+        return content, chunks
+
+    def data_input(self, question: str, stats=None):
+        """Send a question to the model.
+
+        Args:
+            question: the question text.
+            stats: optional dict receiving the request telemetry, i.e. the
+                network time in seconds and the prompt/completion token split.
+
+        Returns:
+            tuple: The answer text, or the list of sampled answers when
+            `samples` > 1, and the token usage.
+        """
+        return self._query(question, stats)
+
+    def data_input_packed(self, questions, stats=None):
+        """Send several cg questions in one request behind a shared exemplar.
+
+        Returns:
+            tuple: The list of per-question answer segments, in question
+            order, and the token usage of the whole request.
+        """
+        ans, token_count = self._query(pack_questions(questions), stats, len(questions))
+        return split_packed_response(ans, len(questions)), token_count
 
-        self.message_text.pop()
-        return response.choices[0].message.content, self.get_token_usage(response)
+    def _query(self, question, stats=None, expected_answers=1):
+        request = self.build_request(question, expected_answers)
+        if self.stream:
+            return self.stream_response(request, stats, expected_answers)
+        start_time = time.perf_counter()
+        response = self.client.chat.completions.create(**request)
+        if stats is not None:
+            stats['network'] = time.perf_counter() - start_time
+        return self.parse_response(response, stats)
 
 if __name__ == '__main__':
     import argparse
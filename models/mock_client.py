@@ -0,0 +1,100 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A deterministic in-process stand-in for the OpenAI client.
+
+Used by the `Mock` backend of `models.clients.Clients` to drive the whole
+generate -> query -> execute -> score pipeline without network calls. Answers
+come from a file of stored responses keyed by prompt, falling back to a fixed
+template.
+"""
+
+import hashlib
+import json
+import os
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from models.mock_server import DEFAULT_RESPONSE, PrefixCache, chat_completion, chat_completion_chunks
+
+
+def prompt_key(request):
+    """Return the lookup key of a request: the sha256 of its last message."""
+    return hashlib.sha256(request['messages'][-1]['content'].encode()).hexdigest()
+
+
+def load_stored_responses(path):
+    """Load a JSONL file of `{"prompt_sha256": ..., "response": ...}` lines."""
+    responses = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                responses[item['prompt_sha256']] = item['response']
+    return responses
+
+
+def stored_responder(responses, template=DEFAULT_RESPONSE):
+    """Answer with the stored response of a prompt, or with `template`."""
+    def respond(request):
+        return responses.get(prompt_key(request), template)
+    return respond
+
+
+class _Stream:
+    """Iterates over completion chunks like `openai.Stream`."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield ChatCompletionChunk.model_validate(chunk)
+
+    def close(self):
+        self._chunks.close()
+
+
+class _Completions:
+
+    def __init__(self, responder, prefix_cache):
+        self._responder = responder
+        self._prefix_cache = prefix_cache
+
+    def create(self, **request):
+        if request.get('stream'):
+            return _Stream(chat_completion_chunks(request, self._responder(request), self._prefix_cache))
+        return ChatCompletion.model_validate(chat_completion(request, self._responder(request), self._prefix_cache))
+
+
+class _Chat:
+
+    def __init__(self, responder, prefix_cache):
+        self.completions = _Completions(responder, prefix_cache)
+
+
+class MockOpenAI:
+    """Mimics `OpenAI().chat.completions.create` with a responder callable."""
+
+    def __init__(self, responder, prefix_cache=None):
+        self.chat = _Chat(responder, prefix_cache or PrefixCache())
+
+    @classmethod
+    def from_env(cls):
+        """Build the client from `MOCK_RESPONSES_FILE` and `MOCK_RESPONSE`."""
+        template = os.environ.get('MOCK_RESPONSE', DEFAULT_RESPONSE)
+        path = os.environ.get('MOCK_RESPONSES_FILE')
+        responses = load_stored_responses(path) if path else {}
+        return cls(stored_responder(responses, template))
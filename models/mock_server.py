@@ -0,0 +1,517 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""A local OpenAI-compatible server for exercising the evaluation pipeline offline.
+
+It implements chat completions plus the files and batches endpoints used by
+`models.batch`. Routes are matched on the path suffix, so both OpenAI style
+(`/v1/chat/completions`) and Azure style
+(`/openai/deployments/<name>/chat/completions`) clients can point at it.
+A `LoadProfile` adds provider-like latency, rate limiting and server errors to
+the chat completions, for load tests such as `benchmarks.load_test`.
+
+Example:
+    python -m models.mock_server --port 8000
+    DEEPINFRA_API_KEY=mock DEEPINFRA_BASE_URL=http://127.0.0.1:8000/v1 \\
+        python evaluate.py --model_name Llama_3_70B --batch ...
+"""
+
+import argparse
+import contextlib
+import email.parser
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+DEFAULT_RESPONSE = "# CODE START\nans = 0\n# CODE END"
+
+
+def fixed_responder(text=DEFAULT_RESPONSE):
+    """Return a responder that answers every request with the same text."""
+    def respond(request):
+        return text
+    return respond
+
+
+def exemplar_responder(fallback=DEFAULT_RESPONSE):
+    """Return a responder that answers with the last code block of the prompt.
+
+    For cg prompts this is the exemplar's code, a response of realistic length
+    that runs without errors.
+    """
+    def respond(request):
+        blocks = re.findall(r'#\s*CODE\s+START\n.*?#\s*CODE\s+END', request['messages'][-1]['content'], re.DOTALL)
+        return blocks[-1] if blocks else fallback
+    return respond
+
+
+# The line `models.clients.pack_questions` adds to a packed prompt.
+_PACKED_PROMPT_PATTERN = re.compile(r'Now answer the following (\d+) questions')
+_QUESTION_LABEL_PATTERN = re.compile(r'#\s*QUESTION\s+\d+', re.IGNORECASE)
+
+
+def label_packed_answers(request, content):
+    """Answer a packed prompt with one '# QUESTION <n>' labelled copy of the answer per question.
+
+    Answers of other prompts, and answers that already carry labels, are kept.
+    """
+    match = _PACKED_PROMPT_PATTERN.search(request['messages'][-1]['content'])
+    if not match or _QUESTION_LABEL_PATTERN.search(content):
+        return content
+    return '\n'.join(f'# QUESTION {number}\n{content}' for number in range(1, int(match.group(1)) + 1))
+
+
+def count_tokens(text):
+    """A rough whitespace token count, good enough for usage bookkeeping."""
+    return len(text.split())
+
+
+def apply_generation_limits(request, content):
+    """Cut an answer at the request's stop sequences and `max_tokens`.
+
+    Returns:
+        tuple: The visible answer text and its finish reason.
+    """
+    finish_reason = 'stop'
+    stop = request.get('stop') or []
+    if isinstance(stop, str):
+        stop = [stop]
+    cut = min([content.find(sequence) for sequence in stop if sequence in content], default=-1)
+    if cut >= 0:
+        content = content[:cut]
+    max_tokens = request.get('max_tokens')
+    if max_tokens is not None:
+        pieces = re.findall(r'\s*\S+', content)
+        if len(pieces) > max_tokens:
+            content = ''.join(pieces[:max_tokens])
+            finish_reason = 'length'
+    return content, finish_reason
+
+
+class PrefixCache:
+    """Simulates provider-side prompt caching.
+
+    Like OpenAI, a prompt reuses the longest prefix it shares with a recent
+    prompt, counted in whole blocks and only once the prefix reaches a minimum
+    length. The cache holds the hashes of the block-aligned prefixes of the
+    last `size` prompts, so a lookup costs one pass over its own prompt.
+    """
+
+    def __init__(self, block=128, minimum=1024, size=256):
+        self.block = block
+        self.minimum = minimum
+        self.size = size
+        # From prefix hash to the number of remembered prompts having it.
+        self._prefixes = {}
+        self._prompts = deque()
+        self._lock = threading.Lock()
+
+    def prefix_hashes(self, tokens):
+        """Return the chained hashes of the prefixes of whole blocks of a prompt."""
+        hashes = []
+        prefix_hash = None
+        for start in range(0, len(tokens) - self.block + 1, self.block):
+            prefix_hash = hash((prefix_hash, tuple(tokens[start:start + self.block])))
+            hashes.append(prefix_hash)
+        return hashes
+
+    def lookup(self, tokens):
+        """Return the number of cached tokens for a prompt and remember it."""
+        hashes = self.prefix_hashes(tokens)
+        blocks = 0
+        with self._lock:
+            while blocks < len(hashes) and hashes[blocks] in self._prefixes:
+                blocks += 1
+            for prefix_hash in hashes:
+                self._prefixes[prefix_hash] = self._prefixes.get(prefix_hash, 0) + 1
+            self._prompts.append(hashes)
+            if len(self._prompts) > self.size:
+                for prefix_hash in self._prompts.popleft():
+                    self._prefixes[prefix_hash] -= 1
+                    if not self._prefixes[prefix_hash]:
+                        del self._prefixes[prefix_hash]
+        cached = blocks * self.block
+        return cached if cached >= self.minimum else 0
+
+
+LATENCY_DISTRIBUTIONS = ['fixed', 'uniform', 'lognormal']
+
+
+class LoadProfile:
+    """Simulates the latency, rate limiting and errors of a provider.
+
+    Args:
+        latency: the mean seconds before a completion is returned.
+        jitter: for 'uniform', the half width of the interval around `latency`;
+            for 'lognormal', the sigma of the underlying normal distribution.
+        distribution: one of `LATENCY_DISTRIBUTIONS`.
+        rate_limit_rate: the share of requests rejected with 429.
+        error_rate: the share of requests failing with 500.
+        retry_after: the Retry-After seconds sent with a 429.
+        seed: the seed of the draws.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, distribution='fixed', rate_limit_rate=0.0,
+                 error_rate=0.0, retry_after=1.0, seed=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f'Unknown latency distribution: {distribution}')
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw_latency(self):
+        """Return the seconds to wait before answering a request."""
+        with self._lock:
+            if self.distribution == 'uniform':
+                return max(0.0, self._random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+            if self.distribution == 'lognormal' and self.latency > 0:
+                # Shift mu so that the mean of the distribution is `latency`.
+                return self._random.lognormvariate(math.log(self.latency) - self.jitter ** 2 / 2, self.jitter)
+            return self.latency
+
+    def draw_status(self):
+        """Return the HTTP status of a request: 429, 500 or 200."""
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.rate_limit_rate:
+            return 429
+        if draw < self.rate_limit_rate + self.error_rate:
+            return 500
+        return 200
+
+
+def chat_completion(request, content, prefix_cache=None):
+    """Build a chat.completion response body for a request and answer text.
+
+    For requests with `n` > 1, `content` may also be a list of answers that
+    the choices cycle through.
+    """
+    contents = content if isinstance(content, list) else [content]
+    choices = []
+    for index in range(request.get('n') or 1):
+        text, finish_reason = apply_generation_limits(
+            request, label_packed_answers(request, contents[index % len(contents)]))
+        choices.append({
+            'index': index,
+            'message': {'role': 'assistant', 'content': text},
+            'finish_reason': finish_reason,
+        })
+    prompt = [token for message in request.get('messages', []) for token in message['content'].split()]
+    prompt_tokens = len(prompt)
+    cached_tokens = prefix_cache.lookup(prompt) if prefix_cache is not None else 0
+    completion_tokens = sum(count_tokens(choice['message']['content']) for choice in choices)
+    return {
+        'id': f'chatcmpl-{uuid.uuid4().hex}',
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', 'mock'),
+        'choices': choices,
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens,
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        },
+    }
+
+
+def chat_completion_chunks(request, content, prefix_cache=None):
+    """Yield chat.completion.chunk bodies streaming the answer word by word."""
+    completion = chat_completion(request, content, prefix_cache)
+    base = {
+        'id': completion['id'],
+        'object': 'chat.completion.chunk',
+        'created': completion['created'],
+        'model': completion['model'],
+    }
+    for piece in re.findall(r'\s*\S+|\s+$', completion['choices'][0]['message']['content']):
+        yield {**base, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+    yield {**base, 'choices': [{'index': 0, 'delta': {}, 'finish_reason': completion['choices'][0]['finish_reason']}]}
+    if (request.get('stream_options') or {}).get('include_usage'):
+        yield {**base, 'choices': [], 'usage': completion['usage']}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Route requests to the owning `MockOpenAIServer`."""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, body, status=200, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, chunks):
+        """Send chunks as server-sent events; the client may hang up early."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for chunk in chunks:
+                self.wfile.write(b'data: ' + json.dumps(chunk).encode() + b'\n\n')
+                self.wfile.flush()
+            self.wfile.write(b'data: [DONE]\n\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _read_body(self):
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def do_POST(self):
+        path = urlparse(self.path).path.rstrip('/')
+        body = self._read_body()
+        mock = self.server.mock
+        if path.endswith('/chat/completions'):
+            with mock.track_request() as counts:
+                self._chat_completion(json.loads(body), mock, counts)
+        elif path.endswith('/files'):
+            self._send_json(mock.create_file(self.headers['Content-Type'], body))
+        elif path.endswith('/batches'):
+            self._send_json(mock.create_batch(json.loads(body)))
+        else:
+            self._send_json({'error': {'message': f'Unknown route {path}'}}, status=404)
+
+    def _chat_completion(self, request, mock, counts):
+        profile = mock.load_profile
+        status = profile.draw_status()
+        if status == 429:
+            counts['rate_limited'] += 1
+            self._send_json({'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit_error'}},
+                            status=429, headers={'Retry-After': str(profile.retry_after)})
+            return
+        if status == 500:
+            counts['errors'] += 1
+            self._send_json({'error': {'message': 'Internal server error', 'type': 'server_error'}}, status=500)
+            return
+        time.sleep(profile.draw_latency())
+        if request.get('stream'):
+            self._send_stream(chat_completion_chunks(request, mock.responder(request), mock.prefix_cache))
+        else:
+            self._send_json(chat_completion(request, mock.responder(request), mock.prefix_cache))
+
+    def do_GET(self):
+        path = urlparse(self.path).path.rstrip('/')
+        mock = self.server.mock
+        match = re.search(r'/files/([^/]+)/content$', path)
+        if match and match.group(1) in mock.files:
+            self._send_bytes(mock.files[match.group(1)]['content'])
+            return
+        match = re.search(r'/batches/([^/]+)$', path)
+        if match and match.group(1) in mock.batches:
+            self._send_json(mock.retrieve_batch(match.group(1)))
+            return
+        self._send_json({'error': {'message': f'Unknown route {path}'}}, status=404)
+
+
+class MockOpenAIServer:
+    """An in-process OpenAI-compatible server running on a background thread.
+
+    Args:
+        host: the interface to bind.
+        port: the port to bind, 0 picks a free one.
+        responder: a callable mapping a chat completion request body to the
+            answer text. Defaults to a fixed CodeGraph-style answer.
+        prefix_cache: the `PrefixCache` reporting cached prompt tokens.
+        load_profile: the `LoadProfile` of the chat completions. Defaults to
+            answering at once without errors.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, responder=None, prefix_cache=None, load_profile=None):
+        self.responder = responder or fixed_responder()
+        self.prefix_cache = prefix_cache or PrefixCache()
+        self.load_profile = load_profile or LoadProfile()
+        self.files = {}
+        self.batches = {}
+        self._lock = threading.Lock()
+        self.reset_counts()
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def reset_counts(self):
+        """Reset the chat completion counters: requests, rate_limited, errors,
+        in_flight and peak_in_flight."""
+        with self._lock:
+            self.counts = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'in_flight': 0, 'peak_in_flight': 0}
+
+    @contextlib.contextmanager
+    def track_request(self):
+        """Count a chat completion request while it is being served."""
+        with self._lock:
+            counts = self.counts
+            counts['requests'] += 1
+            counts['in_flight'] += 1
+            counts['peak_in_flight'] = max(counts['peak_in_flight'], counts['in_flight'])
+        try:
+            yield counts
+        finally:
+            with self._lock:
+                counts['in_flight'] -= 1
+
+    def _add_file(self, content, filename, purpose):
+        file_id = f'file-{uuid.uuid4().hex}'
+        with self._lock:
+            self.files[file_id] = {
+                'id': file_id,
+                'object': 'file',
+                'bytes': len(content),
+                'created_at': int(time.time()),
+                'filename': filename,
+                'purpose': purpose,
+                'status': 'processed',
+                'content': content,
+            }
+        return {key: value for key, value in self.files[file_id].items() if key != 'content'}
+
+    def create_file(self, content_type, body):
+        """Store a file uploaded as multipart/form-data."""
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        fields = {}
+        for part in message.get_payload():
+            fields[part.get_param('name', header='content-disposition')] = part
+        file_part = fields['file']
+        purpose = fields['purpose'].get_payload(decode=True).decode() if 'purpose' in fields else 'batch'
+        return self._add_file(
+            file_part.get_payload(decode=True),
+            file_part.get_filename() or 'upload.jsonl',
+            purpose,
+        )
+
+    def create_batch(self, request):
+        """Register a batch job; it is processed on the first status check."""
+        batch_id = f'batch_{uuid.uuid4().hex}'
+        with self._lock:
+            self.batches[batch_id] = {
+                'id': batch_id,
+                'object': 'batch',
+                'endpoint': request['endpoint'],
+                'completion_window': request['completion_window'],
+                'input_file_id': request['input_file_id'],
+                'created_at': int(time.time()),
+                'status': 'validating',
+                'output_file_id': None,
+                'error_file_id': None,
+                'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            }
+        return self.batches[batch_id]
+
+    def retrieve_batch(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch['status'] == 'validating':
+            batch['status'] = 'in_progress'
+        elif batch['status'] == 'in_progress':
+            self._run_batch(batch)
+        return batch
+
+    def _run_batch(self, batch):
+        lines = self.files[batch['input_file_id']]['content'].decode().splitlines()
+        outputs = []
+        for line in lines:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            outputs.append(json.dumps({
+                'id': f'batch_req_{uuid.uuid4().hex}',
+                'custom_id': item['custom_id'],
+                'response': {
+                    'status_code': 200,
+                    'request_id': uuid.uuid4().hex,
+                    'body': chat_completion(item['body'], self.responder(item['body']), self.prefix_cache),
+                },
+                'error': None,
+            }))
+        output_file = self._add_file(('\n'.join(outputs) + '\n').encode(), 'output.jsonl', 'batch_output')
+        batch['output_file_id'] = output_file['id']
+        batch['request_counts'] = {'total': len(outputs), 'completed': len(outputs), 'failed': 0}
+        batch['completed_at'] = int(time.time())
+        batch['status'] = 'completed'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--response', type=str, default=DEFAULT_RESPONSE, help='The answer returned for requests without a stored response')
+    parser.add_argument('--responses_file', type=str, default=None, help='JSONL file of {"prompt_sha256": ..., "response": ...} stored answers')
+    parser.add_argument('--echo_exemplar', action='store_true', default=False, help='Answer cg prompts with the code block of their exemplar instead of --response')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean seconds before a completion is returned')
+    parser.add_argument('--latency_jitter', type=float, default=0.0, help='Half width (uniform) or sigma (lognormal) of the latency')
+    parser.add_argument('--latency_distribution', type=str, default='fixed', choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument('--rate_limit_rate', type=float, default=0.0, help='Share of chat completions rejected with 429')
+    parser.add_argument('--error_rate', type=float, default=0.0, help='Share of chat completions failing with 500')
+    parser.add_argument('--retry_after', type=float, default=1.0, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the latency and error draws')
+    args = parser.parse_args()
+    responder = exemplar_responder(args.response) if args.echo_exemplar else fixed_responder(args.response)
+    if args.responses_file:
+        from models.mock_client import load_stored_responses, stored_responder
+        responder = stored_responder(load_stored_responses(args.responses_file), args.response)
+    load_profile = LoadProfile(args.latency, args.latency_jitter, args.latency_distribution,
+                               args.rate_limit_rate, args.error_rate, args.retry_after, args.seed)
+    server = MockOpenAIServer(args.host, args.port, responder, load_profile=load_profile)
+    print(f'Mock OpenAI server listening on {server.url}')
+    server.serve_forever()
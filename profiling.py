@@ -0,0 +1,206 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-stage profiling of the generator and evaluator runs.
+
+Code marks its stages with `stage(name)`, which does nothing unless a
+`RunProfiler` was started with `start()`. A started profiler records the calls
+and wall time of every stage and, on request, a cProfile of the stage's own
+code and the peak traced memory while it ran. Stages may nest: the profile of
+a stage leaves out its nested stages, while its time and memory peak include
+them. Only the thread that started the profiler is profiled.
+"""
+
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+PROFILERS = ['cprofile', 'pyinstrument']
+# Number of functions in the text report of a stage, and of allocation sites
+# kept with a memory peak.
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 10
+# A snapshot of the allocation sites is taken only when the run's memory peak
+# grows by this factor, as a snapshot of a large heap (e.g. with TensorFlow
+# loaded) takes far longer than most stages.
+SNAPSHOT_GROWTH = 1.1
+
+_active = None
+
+
+class RunProfiler:
+    """Collects the per-stage profiles and memory peaks of one run.
+
+    Args:
+        profile: whether to profile the stages.
+        trace_memory: whether to trace the memory peaks of the stages.
+        profiler: 'cprofile' for a profile per stage, or 'pyinstrument' for one
+            sampling profile of the whole run (requires `pip install pyinstrument`).
+    """
+
+    def __init__(self, profile=False, trace_memory=False, profiler='cprofile'):
+        if profiler not in PROFILERS:
+            raise ValueError(f'Unknown profiler: {profiler}')
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profiler = profiler
+        self.stages = {}
+        self._profiles = {}
+        self._stack = []
+        self._thread = threading.get_ident()
+        self._session = None
+        self._start_time = None
+        # Seconds spent taking memory snapshots, left out of the stage times.
+        self._overhead = 0.0
+        # The run's memory peak at the last snapshot, and the last snapshot
+        # kept per stage, summarized when the run stops.
+        self._snapshot_peak = 0
+        self._snapshots = {}
+
+    def start(self):
+        self._start_time = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile and self.profiler == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError as e:
+                raise ImportError('--profiler pyinstrument requires `pip install pyinstrument`') from e
+            self._session = Profiler()
+            self._session.start()
+
+    def stop(self):
+        if self._session is not None:
+            self._session.stop()
+        self.stages['run'] = {'calls': 1, 'seconds': time.perf_counter() - self._start_time}
+        if self.trace_memory:
+            tracemalloc.stop()
+            for name, snapshot in self._snapshots.items():
+                self.stages[name]['peak_allocations'] = [
+                    {'site': str(statistic.traceback), 'bytes': statistic.size, 'count': statistic.count}
+                    for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+                ]
+            self._snapshots = {}
+
+    def _stage_profile(self, name):
+        if not self.profile or self.profiler != 'cprofile':
+            return None
+        return self._profiles.setdefault(name, cProfile.Profile())
+
+    def _record_peak(self):
+        """Charge the memory peak since the last call to every open stage."""
+        peak = tracemalloc.get_traced_memory()[1]
+        for name in self._stack:
+            self.stages[name]['peak_bytes'] = max(self.stages[name].get('peak_bytes', 0), peak)
+        tracemalloc.reset_peak()
+        return peak
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if threading.get_ident() != self._thread:
+            yield
+            return
+        record = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+        outer = self._profile_of_top()
+        if outer is not None:
+            outer.disable()
+        if self.trace_memory:
+            self._record_peak()
+        self._stack.append(name)
+        profile = self._stage_profile(name)
+        start_overhead = self._overhead
+        start_time = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            record['calls'] += 1
+            record['seconds'] += time.perf_counter() - start_time - (self._overhead - start_overhead)
+            if self.trace_memory:
+                peak = self._record_peak()
+                if peak > self._snapshot_peak * SNAPSHOT_GROWTH:
+                    # Keep the largest allocation sites with the stage that
+                    # raised the run's peak.
+                    self._snapshot_peak = peak
+                    snapshot_start = time.perf_counter()
+                    self._snapshots[name] = tracemalloc.take_snapshot()
+                    self._overhead += time.perf_counter() - snapshot_start
+            self._stack.pop()
+            if outer is not None:
+                outer.enable()
+
+    def _profile_of_top(self):
+        if not self._stack:
+            return None
+        return self._profiles.get(self._stack[-1])
+
+    def write(self, output_dir, config):
+        """Write the stage summary, with the run's config, and the profiles to output_dir.
+
+        Files:
+            summary.json: the config and, per stage, its calls, seconds and
+                memory peak with the top allocation sites.
+            {stage}.prof and {stage}.txt: the cProfile of a stage, as pstats
+                data and as text sorted by cumulative time.
+            run.html and run.txt: the pyinstrument profile of the run.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        with open(os.path.join(output_dir, 'summary.json'), 'w') as f:
+            json.dump({'config': config, 'stages': self.stages}, f, indent=4, default=str)
+        for name, profile in self._profiles.items():
+            profile.dump_stats(os.path.join(output_dir, f'{name}.prof'))
+            report = io.StringIO()
+            pstats.Stats(profile, stream=report).sort_stats('cumulative').print_stats(TOP_FUNCTIONS)
+            with open(os.path.join(output_dir, f'{name}.txt'), 'w') as f:
+                f.write(report.getvalue())
+        if self._session is not None:
+            with open(os.path.join(output_dir, 'run.html'), 'w') as f:
+                f.write(self._session.output_html())
+            with open(os.path.join(output_dir, 'run.txt'), 'w') as f:
+                f.write(self._session.output_text())
+        print(f'Profile written to {output_dir}')
+
+
+def start(profile=False, trace_memory=False, profiler='cprofile'):
+    """Start profiling the stages of this run and return the profiler."""
+    global _active
+    _active = RunProfiler(profile, trace_memory, profiler)
+    _active.start()
+    return _active
+
+
+def stop():
+    """Stop the active profiler and return it."""
+    global _active
+    profiler, _active = _active, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def stage(name):
+    """Return a context manager marking a stage of the active profiler."""
+    if _active is None:
+        return contextlib.nullcontext()
+    return _active.stage(name)
@@ -21,24 +21,13 @@ mkdir -p logs
 
 
 # Define the algorithms to be processed
-QUESTION_ALGORITHMS=("ba" "sbm" "sfn" "complete" "star" "path")
-EXEMPLAR_ALGORITHMS=("er")
+QUESTION_ALGORITHMS="ba,sbm,sfn,complete,star,path"
+EXEMPLAR_ALGORITHMS="er"
+K_SHOT=${K_SHOT:-1}
 
-# Loop over the pairs of algorithms and create a background process for each pair
-for QUESTION_ALGORITHM in "${QUESTION_ALGORITHMS[@]}"
-do
-    for EXEMPLAR_ALGORITHM in "${EXEMPLAR_ALGORITHMS[@]}"
-    do
-        SESSION_NAME="generate_${QUESTION_ALGORITHM}_${EXEMPLAR_ALGORITHM}"
-        
-        # Run each task in the background and log the output to separate files
-        bash ./codegraph/cg_task_generators_with_diff_exemplar.sh "$QUESTION_ALGORITHM" "$EXEMPLAR_ALGORITHM" "$K_SHOT" > "logs/${SESSION_NAME}.log" 2>&1 &
-        
-        # Capture the process ID to track running processes (for debugging)
-        echo "Launched session ${SESSION_NAME} with PID: $!"
-    done
-done
+# One run generates every (question, exemplar) pair: the graphs are loaded and
+# each exemplar pool is rendered once, and shared by all pairs.
+SESSION_NAME="generate_all_pairs"
+bash ./codegraph/cg_task_generators_with_diff_exemplar.sh "$QUESTION_ALGORITHMS" "$EXEMPLAR_ALGORITHMS" "$K_SHOT" > "logs/${SESSION_NAME}.log" 2>&1
 
-wait
-
-echo "All sessions have been launched. Logs are available in the 'logs' folder."
\ No newline at end of file
+echo "All pairs have been generated. Logs are available in the 'logs' folder."
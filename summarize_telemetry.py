@@ -0,0 +1,112 @@
+# coding=utf-8
+#Copyright 2024 HKUST-KnowComp Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Summarize the per-request telemetry written by evaluate.py per grid cell."""
+
+import argparse
+import glob
+import json
+import os
+
+CELL_KEYS = ['model_name', 'prompt_source', 'prompt_method', 'k_shot', 'prefix_cache', 'pack', 'samples', 'bind_graph', 'graph_gen', 'task_name', 'text_enc']
+LATENCY_SPANS = ['total', 'queue_wait', 'network', 'ttft', 'exec', 'extraction']
+PERCENTILES = [50, 95, 99]
+
+
+def percentile(values, q):
+    """Return the q-th percentile of values using linear interpolation."""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def load_telemetry(results_dir):
+    """Load all telemetry records below results_dir, grouped by grid cell."""
+    cells = {}
+    pattern = os.path.join(results_dir, '**', '*.telemetry.jsonl')
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                cell = tuple(record.get(key) for key in CELL_KEYS)
+                # A resumed run may repeat an ID; the latest record wins.
+                cells.setdefault(cell, {})[record['ID']] = record
+    return {cell: list(records.values()) for cell, records in cells.items()}
+
+
+def summarize_cell(records):
+    """Compute latency percentiles, token splits and throughput for one cell."""
+    summary = {
+        'count': len(records),
+        'accuracy': sum(record['correct'] for record in records) / len(records),
+        # Share of completions cut off by the output cap before the answer ended.
+        'truncated_rate': sum(bool(record.get('truncated')) for record in records) / len(records),
+    }
+    for span in LATENCY_SPANS:
+        values = [record[span] for record in records if record.get(span) is not None]
+        for q in PERCENTILES:
+            summary[f'{span}_p{q}'] = percentile(values, q)
+    for key in ['prompt_tokens', 'completion_tokens', 'cached_tokens']:
+        values = [record[key] for record in records if record.get(key) is not None]
+        summary[f'avg_{key}'] = sum(values) / len(values) if values else None
+    prompt_tokens = sum(record['prompt_tokens'] for record in records if record.get('cached_tokens') is not None)
+    summary['cached_prompt_ratio'] = (
+        sum(record['cached_tokens'] for record in records if record.get('cached_tokens') is not None) / prompt_tokens
+        if prompt_tokens > 0 else None
+    )
+    timed = [record for record in records if record.get('network') and record.get('completion_tokens') is not None]
+    network_time = sum(record['network'] for record in timed)
+    summary['completion_tokens_per_s'] = (
+        sum(record['completion_tokens'] for record in timed) / network_time if network_time > 0 else None
+    )
+    return summary
+
+
+def format_value(value):
+    if value is None:
+        return '--'
+    if isinstance(value, float):
+        return f'{value:.3f}'
+    return str(value)
+
+
+def print_table(summaries):
+    columns = ['count', 'accuracy', 'truncated_rate', 'total_p50', 'total_p95', 'total_p99',
+               'network_p50', 'network_p95', 'network_p99', 'ttft_p50', 'exec_p50',
+               'avg_prompt_tokens', 'avg_cached_tokens', 'cached_prompt_ratio', 'avg_completion_tokens', 'completion_tokens_per_s']
+    print('\t'.join(CELL_KEYS + columns))
+    for cell, summary in summaries:
+        print('\t'.join([format_value(value) for value in cell] + [format_value(summary[column]) for column in columns]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results_dir', type=str, default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results'),
+                        help='Directory searched recursively for *.telemetry.jsonl files')
+    parser.add_argument('--output', type=str, default=None, help='Optional JSON file to write the per-cell summaries to')
+    args = parser.parse_args()
+
+    summaries = [(cell, summarize_cell(records)) for cell, records in sorted(load_telemetry(args.results_dir).items(), key=lambda item: str(item[0]))]
+    print_table(summaries)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump([{**dict(zip(CELL_KEYS, cell)), **summary} for cell, summary in summaries], f, indent=4)